@@ -1,46 +1,560 @@
-import google.generativeai as genai
+import contextvars
+import heapq
+import importlib
+import itertools
+import logging
 import os
-import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-def gemini_generate(prompt: str, max_tokens: int = None, temperature: float = 0.7) -> str:
-    """Generate text using Google's Gemini API with API key from environment."""
-    # Implement the actual Gemini API call
-    # This is a placeholder - implement with actual API logic
+from typing import List, Dict, Optional
+
+from ai.prompt import build_answer_prompt, fit_prompt, count_tokens
+from ai.routes import ModelRoute, get_route
+from ai.usage import ledger, budget_route
+from ai.links import known_case_links, repair_case_links, append_missing_citations, count_answer
+from utils import metrics
+from utils.deadline import Deadline
+from utils.log import get_logger, session_id_var
+from utils.cassette import get_cassette, wrap_gemini_backend
+from utils.memo import shared
+from utils.shared_cache import SharedCache, cache_key
+from utils.singleflight import SingleFlight, Abandoned, FlightTimeout
+
+logger = get_logger("ai.gemini")
+
+# Returned by gemini_generate when the call fails; callers must not treat it as an answer
+GEMINI_ERROR_RESPONSE = "Error generating response"
+
+# Priority classes for the request scheduler (lower runs first)
+PRIORITY_CLASSIFY = 0    # LEGAL/NOT LEGAL classification, search phrases, section suggestions
+PRIORITY_ANSWER = 1      # user-facing answers
+PRIORITY_BACKGROUND = 2  # summarization and other background work
+PRIORITY_NAMES = {PRIORITY_CLASSIFY: "classify", PRIORITY_ANSWER: "answer", PRIORITY_BACKGROUND: "background"}
+PRIORITIES = {name: priority for priority, name in PRIORITY_NAMES.items()}
+
+# How many times a throttled (429) call is retried before giving up
+MAX_THROTTLE_RETRIES = 2
+
+queue_depth = metrics.gauge("gemini_queue_depth", "Gemini calls waiting for a slot", ("priority",))
+queue_wait = metrics.histogram("gemini_queue_wait_seconds", "Time Gemini calls spent queued", ("priority",))
+in_flight = metrics.gauge("gemini_in_flight", "Gemini calls currently running")
+concurrency_limit = metrics.gauge("gemini_concurrency_limit", "Current adaptive Gemini concurrency limit")
+throttled = metrics.counter("gemini_throttled_total", "Gemini calls rejected with 429 / resource exhausted")
+
+
+class GeminiScheduler:
+    """Client-side admission for Gemini calls.
+
+    Combines an adaptive concurrency limit (additive increase on fast
+    successes, multiplicative decrease on 429s or slow calls) with a token
+    bucket capping the request rate. Waiting calls are served in priority
+    order, FIFO within a priority.
+    """
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 16,
+                 rate: float = 5.0, burst: int = 10, latency_target: float = 8.0,
+                 wait_half_life: float = 10.0):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial_limit)
+        self.rate = rate
+        self.burst = burst
+        self.latency_target = latency_target
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # Moving average of queue wait for user-facing calls, decaying with time
+        # so that it recovers while nothing is admitted (see recent_wait)
+        self.wait_half_life = wait_half_life
+        self._wait_avg = 0.0
+        self._wait_noted_at = time.monotonic()
+        # Start times of user-facing calls still queued, by sequence number
+        self._waiting_since: Dict[int, float] = {}
+        concurrency_limit.set(self.limit)
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def acquire(self, priority: int = PRIORITY_ANSWER, timeout: Optional[float] = None,
+                cancelled: Optional[threading.Event] = None) -> bool:
+        """Block until the call may run; returns False if timeout elapsed or `cancelled` was set first."""
+        start = time.monotonic()
+        give_up_at = None if timeout is None else start + timeout
+        entry = (priority, next(self._seq))
+        label = PRIORITY_NAMES.get(priority, str(priority))
+        acquired = False
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            if priority <= PRIORITY_ANSWER:
+                self._waiting_since[entry[1]] = start
+            queue_depth.inc(priority=label)
+            try:
+                while True:
+                    if cancelled is not None and cancelled.is_set():
+                        break
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = None
+                    if self._waiting[0] == entry and self._in_flight < int(self.limit):
+                        if self._tokens >= 1:
+                            acquired = True
+                            break
+                        # Wait for the next token rather than for a release
+                        wait = (1 - self._tokens) / self.rate
+                    if give_up_at is not None:
+                        if now >= give_up_at:
+                            break
+                        wait = give_up_at - now if wait is None else min(wait, give_up_at - now)
+                    self._cond.wait(wait)
+                if acquired:
+                    heapq.heappop(self._waiting)
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    in_flight.set(self._in_flight)
+                else:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+            finally:
+                self._waiting_since.pop(entry[1], None)
+                queue_depth.dec(priority=label)
+            # The next waiter may be able to run too
+            self._cond.notify_all()
+        waited = time.monotonic() - start
+        queue_wait.observe(waited, priority=label)
+        if priority <= PRIORITY_ANSWER:
+            self.note_wait(waited)
+        return acquired
+
+    def _decayed_wait(self, now: float) -> float:
+        return self._wait_avg * 0.5 ** ((now - self._wait_noted_at) / self.wait_half_life)
+
+    def note_wait(self, waited: float):
+        """Fold one user-facing call's queue wait into the moving average."""
+        with self._cond:
+            now = time.monotonic()
+            average = self._decayed_wait(now)
+            self._wait_avg = average + 0.2 * (waited - average)
+            self._wait_noted_at = now
+
+    @property
+    def recent_wait(self) -> float:
+        """Recent queue wait of user-facing calls, for admission control.
+
+        The larger of the moving average, which halves every wait_half_life
+        seconds without new samples, and how long the oldest user-facing call
+        still queued has waited. It falls back once the queue drains, even if
+        load shedding lets no calls through to add new samples.
+        """
+        with self._cond:
+            now = time.monotonic()
+            oldest = now - min(self._waiting_since.values()) if self._waiting_since else 0.0
+            return max(self._decayed_wait(now), oldest)
+
+    def wake(self):
+        """Let waiting calls re-check their cancellation flags."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def congested(self) -> bool:
+        """True when calls are queued or the concurrency limit is (nearly) used up."""
+        with self._cond:
+            return bool(self._waiting) or self._in_flight >= int(self.limit) - 1
+
+    def release(self, latency: float, overloaded: bool = False):
+        """Return a slot and adapt the concurrency limit to the call's outcome."""
+        with self._cond:
+            self._in_flight -= 1
+            in_flight.set(self._in_flight)
+            if overloaded:
+                self.limit = max(self.min_limit, self.limit / 2)
+            elif latency > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * 0.9)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            concurrency_limit.set(self.limit)
+            self._cond.notify_all()
+
+    def release_unused(self):
+        """Return a slot whose call was never sent, leaving the limit alone and refunding its token."""
+        with self._cond:
+            self._in_flight -= 1
+            in_flight.set(self._in_flight)
+            self._tokens = min(self.burst, self._tokens + 1)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self._in_flight,
+                "queued": len(self._waiting),
+                "tokens": self._tokens,
+                "recent_wait": self.recent_wait,
+            }
+
+
+scheduler = GeminiScheduler(
+    initial_limit=int(os.getenv("GEMINI_INITIAL_CONCURRENCY", "4")),
+    max_limit=int(os.getenv("GEMINI_MAX_CONCURRENCY", "16")),
+    rate=float(os.getenv("GEMINI_RATE_LIMIT", "5")),
+    burst=int(os.getenv("GEMINI_BURST", "10")),
+    wait_half_life=float(os.getenv("GEMINI_WAIT_HALF_LIFE", "10")),
+)
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies, used to decide when to hedge."""
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self.samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+latencies: Dict[str, LatencyTracker] = {}
+_latencies_lock = threading.Lock()
+
+
+def _latency_tracker(route_name: str) -> LatencyTracker:
+    with _latencies_lock:
+        tracker = latencies.get(route_name)
+        if tracker is None:
+            tracker = latencies[route_name] = LatencyTracker()
+        return tracker
+
+# Used when there aren't enough samples yet to estimate p95
+DEFAULT_HEDGE_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY", "3"))
+
+hedged_calls = metrics.counter("gemini_hedged_total", "Gemini calls that fired a hedge request")
+hedge_wins = metrics.counter("gemini_hedge_wins_total", "Hedged Gemini calls won by the duplicate request")
+hedges_suppressed = metrics.counter("gemini_hedges_suppressed_total", "Hedges not sent because the scheduler was congested")
+
+route_latency = metrics.histogram("gemini_route_latency_seconds", "Gemini call latency per route", ("route", "model"))
+route_tokens = metrics.counter("gemini_route_tokens_total", "Gemini tokens per route", ("route", "model", "kind"))
+route_calls = metrics.counter("gemini_route_calls_total", "Gemini calls per route and outcome", ("route", "model", "outcome"))
+
+# Identical calls already in flight are joined rather than repeated (GEMINI_COALESCE=0 turns this off)
+COALESCE = os.getenv("GEMINI_COALESCE", "1") != "0"
+_inflight = SingleFlight("gemini")
+
+# Responses of routes with a cache_ttl, by model, generation settings and prompt
+_response_cache = SharedCache("gemini_responses", maxsize=int(os.getenv("GEMINI_RESPONSE_CACHE_SIZE", "1024")),
+                              ttl=86400.0, l2_maxsize=int(os.getenv("GEMINI_SHARED_CACHE_SIZE", "20000")))
+
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("GEMINI_HEDGE_WORKERS", "16")), thread_name_prefix="gemini-hedge")
+
+
+def _is_throttled(error: Exception) -> bool:
+    """True for 429 / ResourceExhausted errors from the Gemini client."""
+    return (getattr(error, "code", None) == 429 or type(error).__name__ == "ResourceExhausted"
+            or "429" in str(error))
+
+
+def _record_usage(route_name: str, model_name: str, prompt: str, response, latency: float) -> None:
+    """Record prompt/output tokens for a route, estimating them if the response has no usage metadata.
+
+    The call is also added to the usage ledger under the current session.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", None) if usage else None
+    output_tokens = getattr(usage, "candidates_token_count", None) if usage else None
+    if prompt_tokens is None:
+        prompt_tokens = count_tokens(prompt)
+    if output_tokens is None:
+        output_tokens = count_tokens(response.text)
+    route_tokens.inc(prompt_tokens, route=route_name, model=model_name, kind="prompt")
+    route_tokens.inc(output_tokens, route=route_name, model=model_name, kind="output")
+    ledger.record(route_name, model_name, prompt_tokens, output_tokens, latency, session_id=session_id_var.get())
+
+
+# google.generativeai takes about a second to import, so it is imported on the
+# first real call (or by warmup) rather than with this module.
+_configured_key: Optional[str] = None
+_configure_lock = threading.Lock()
+
+
+def _configure_genai():
+    """Configure the client once per process (and again only if the key changes).
+
+    genai.configure() discards the cached client, so calling it per request
+    would open a new connection for every call.
+    """
+    global _configured_key
+    api_key = os.getenv("GEMINI_API_KEY")
+    if api_key == _configured_key:
+        return
+    with _configure_lock:
+        if api_key != _configured_key:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _configured_key = api_key
+
+
+def _genai_backend(prompt: str, route_name: str, model_name: str, generation_config: Dict, timeout: float):
+    """The real backend: one generate_content call through google.generativeai."""
+    import google.generativeai as genai
+    _configure_genai()
+    model = genai.GenerativeModel(model_name, generation_config=generation_config)
+    return model.generate_content(prompt, request_options={"timeout": timeout})
+
+
+# The callable that actually talks to the model. Load tests swap in a local
+# stand-in, either with set_backend() or GEMINI_BACKEND="module:attribute".
+_backend = None
+_using_genai = True
+
+
+def set_backend(backend=None):
+    """Replace the model backend; None restores the real Gemini client.
+
+    The backend is wrapped by the record/replay cassette (utils.cassette).
+    """
+    global _backend, _using_genai
+    _using_genai = backend is None
+    _backend = wrap_gemini_backend(backend or _genai_backend)
+
+
+def warm_client() -> bool:
+    """Create the Gemini client ahead of the first call; False when it isn't the real backend."""
+    if os.getenv("GEMINI_BACKEND") or get_cassette().replaying or (_backend is not None and not _using_genai):
+        return False
+    if not os.getenv("GEMINI_API_KEY"):
+        return False
+    _configure_genai()
+    from google.generativeai.client import get_default_generative_client
+    get_default_generative_client()
+    return True
+
+
+def get_backend():
+    if _backend is None:
+        spec = os.getenv("GEMINI_BACKEND")
+        if spec:
+            module_name, _, attr = spec.partition(":")
+            backend = getattr(importlib.import_module(module_name), attr or "backend")
+            # A class or factory is instantiated with no arguments
+            set_backend(backend() if isinstance(backend, type) else backend)
+            logger.warning("Using Gemini backend %s", spec)
+        else:
+            set_backend(None)
+    return _backend
+
+
+def _generate_once(prompt: str, route_name: str, route: ModelRoute, generation_config: Dict,
+                   priority: int, deadline: Optional[Deadline],
+                   started: Optional[threading.Event] = None, cancelled: Optional[threading.Event] = None) -> str:
+    """One scheduled Gemini call, retried with backoff while throttled.
+
+    `started` is set once the call holds a scheduler slot; setting `cancelled`
+    withdraws a call that has not been sent yet (hedging uses both).
+    """
+    for attempt in range(MAX_THROTTLE_RETRIES + 1):
+        if cancelled is not None and cancelled.is_set():
+            return GEMINI_ERROR_RESPONSE
+        if deadline is not None and deadline.expired:
+            logger.warning("Gemini call skipped: request deadline exceeded", extra={"route": route_name})
+            route_calls.inc(route=route_name, model=route.model, outcome="deadline")
+            return GEMINI_ERROR_RESPONSE
+        if not scheduler.acquire(priority, timeout=None if deadline is None else deadline.remaining(),
+                                 cancelled=cancelled):
+            if cancelled is not None and cancelled.is_set():
+                return GEMINI_ERROR_RESPONSE
+            logger.warning("Gemini call timed out waiting for a slot", extra={"route": route_name})
+            route_calls.inc(route=route_name, model=route.model, outcome="deadline")
+            return GEMINI_ERROR_RESPONSE
+        # The slot may come just after the call was withdrawn or ran out of time;
+        # sending it anyway would fail and feed a bogus sample to the limiter
+        if (cancelled is not None and cancelled.is_set()) or (deadline is not None and deadline.expired):
+            scheduler.release_unused()
+            if cancelled is None or not cancelled.is_set():
+                logger.warning("Gemini call skipped: request deadline exceeded", extra={"route": route_name})
+                route_calls.inc(route=route_name, model=route.model, outcome="deadline")
+            return GEMINI_ERROR_RESPONSE
+        if started is not None:
+            started.set()
+        start = time.monotonic()
+        overloaded = False
+        try:
+            timeout = route.timeout if deadline is None else min(route.timeout, max(0.1, deadline.remaining()))
+            response = get_backend()(prompt, route_name, route.model, generation_config, timeout)
+            latency = time.monotonic() - start
+            _latency_tracker(route_name).record(latency)
+            route_latency.observe(latency, route=route_name, model=route.model)
+            route_calls.inc(route=route_name, model=route.model, outcome="ok")
+            _record_usage(route_name, route.model, prompt, response, latency)
+            return response.text
+        except Exception as e:
+            overloaded = _is_throttled(e)
+            if not overloaded:
+                logger.error("Gemini API error: %s", e, extra={"route": route_name})
+                route_calls.inc(route=route_name, model=route.model, outcome="error")
+                return GEMINI_ERROR_RESPONSE
+            throttled.inc()
+            route_calls.inc(route=route_name, model=route.model, outcome="throttled")
+            logger.warning("Gemini throttled on attempt %d: %s", attempt + 1, e, extra={"route": route_name})
+        finally:
+            scheduler.release(time.monotonic() - start, overloaded)
+        # Back off before queueing again; the halved limit already slows everyone down
+        backoff = 0.5 * (2 ** attempt)
+        if attempt < MAX_THROTTLE_RETRIES and (deadline is None or deadline.remaining() > backoff):
+            time.sleep(backoff)
+        else:
+            break
+    return GEMINI_ERROR_RESPONSE
+
+
+def _generate_hedged(prompt: str, route_name: str, route: ModelRoute, generation_config: Dict,
+                     priority: int, deadline: Optional[Deadline]) -> str:
+    """Run a call and, if it outlives the p95 latency, race a duplicate against it.
+
+    The hedge delay is measured from when the primary gets a scheduler slot,
+    since the p95 is API latency only. No duplicate is sent while the
+    scheduler is congested, where it would only add load. Once one call
+    succeeds the other is withdrawn if it hasn't been sent yet; a request
+    already sent to the API runs to completion.
+    """
+    args = (prompt, route_name, route, generation_config, priority, deadline)
+    delay = _latency_tracker(route_name).percentile(0.95) or DEFAULT_HEDGE_DELAY
+    primary_started, primary_cancelled = threading.Event(), threading.Event()
+    # Each submission runs in its own copy of the caller's context so logs keep the request IDs
+    primary = _hedge_pool.submit(contextvars.copy_context().run, _generate_once, *args,
+                                 started=primary_started, cancelled=primary_cancelled)
+    primary.add_done_callback(lambda _: primary_started.set())
+    primary_started.wait(None if deadline is None else deadline.remaining())
+    done, _ = wait([primary], timeout=delay if deadline is None else min(delay, deadline.remaining()))
+    if not done and (deadline is None or not deadline.expired) and scheduler.congested():
+        hedges_suppressed.inc()
+        done, _ = wait([primary], timeout=None if deadline is None else deadline.remaining())
+    if done:
+        return primary.result()
+    if deadline is not None and deadline.expired:
+        primary_cancelled.set()
+        scheduler.wake()
+        return GEMINI_ERROR_RESPONSE
+    hedged_calls.inc()
+    hedge_cancelled = threading.Event()
+    hedge = _hedge_pool.submit(contextvars.copy_context().run, _generate_once, *args, cancelled=hedge_cancelled)
+    cancel_flags = {primary: primary_cancelled, hedge: hedge_cancelled}
+    pending = {primary, hedge}
+    timeout = None if deadline is None else deadline.remaining()
     try:
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        
-        generation_config = {
-            "temperature": temperature,
-            "top_p": 1,
-            "top_k": 1,
-        }
-        
-        if max_tokens:
-            generation_config["max_output_tokens"] = max_tokens
-        
-        model = genai.GenerativeModel('gemini-2.0-flash-lite', generation_config=generation_config)
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        print(f"Gemini API error: {e}")
-        return "Error generating response"
+        while pending:
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                result = future.result()
+                if result != GEMINI_ERROR_RESPONSE:
+                    if future is hedge:
+                        hedge_wins.inc()
+                    return result
+            timeout = None if deadline is None else deadline.remaining()
+        return GEMINI_ERROR_RESPONSE
+    finally:
+        # Withdraw whichever call lost (or both, if the deadline ran out)
+        for future in pending:
+            cancel_flags[future].set()
+            future.cancel()
+        if pending:
+            scheduler.wake()
+
+
+def gemini_generate(prompt: str, max_tokens: int = None, temperature: float = None,
+                    priority: int = None, deadline: Optional[Deadline] = None,
+                    hedge: bool = None, route: str = "answer") -> str:
+    """Generate text using Google's Gemini API with API key from environment.
+
+    Model, token limit, temperature, timeout, priority and hedging come from the
+    call site's route in ai.routes; explicit arguments override the route.
+    With hedging a duplicate request is fired if the first one runs past the
+    observed p95 latency, and whichever returns first wins. Sessions over
+    their token budget get the cheaper variant of the route (ai.usage).
+    Routes with a cache_ttl reuse earlier responses to the same prompt,
+    including ones from other workers (utils.shared_cache).
+    """
+    route_name = route
+    route = get_route(route_name)
+    if ledger.over_budget(session_id_var.get()):
+        route = budget_route(route)
+        max_tokens = None if max_tokens is None else min(max_tokens, route.max_tokens)
+        hedge = False
+    generation_config = {
+        "temperature": route.temperature if temperature is None else temperature,
+        "top_p": 1,
+        "top_k": 1,
+    }
+    
+    max_tokens = route.max_tokens if max_tokens is None else max_tokens
+    if max_tokens:
+        generation_config["max_output_tokens"] = max_tokens
+    if priority is None:
+        priority = PRIORITIES.get(route.priority, PRIORITY_ANSWER)
+    
+    generate = _generate_hedged if (route.hedge if hedge is None else hedge) else _generate_once
+    if route.cache_ttl > 0:
+        response_key = cache_key(route.model, sorted(generation_config.items()), prompt)
+        cached = _response_cache.get(response_key)
+        if cached is not None:
+            return cached
+        text = _generate_coalesced(prompt, route_name, route, generation_config, priority, deadline, generate)
+        if text != GEMINI_ERROR_RESPONSE:
+            _response_cache.set(response_key, text, ttl=route.cache_ttl)
+        return text
+    return _generate_coalesced(prompt, route_name, route, generation_config, priority, deadline, generate)
+
+
+def _generate_coalesced(prompt: str, route_name: str, route: ModelRoute, generation_config: Dict,
+                        priority: int, deadline: Optional[Deadline], generate) -> str:
+    """Run `generate`, sharing one call between concurrent identical requests."""
+    if not COALESCE:
+        return generate(prompt, route_name, route, generation_config, priority, deadline)
+
+    def leader_call() -> str:
+        text = generate(prompt, route_name, route, generation_config, priority, deadline)
+        if text == GEMINI_ERROR_RESPONSE and deadline is not None and deadline.expired:
+            # Ran out of this caller's time; callers with time left try again themselves
+            raise Abandoned(text)
+        return text
+
+    # Concurrent identical prompts for the same route and settings share one call
+    key = (route_name, route.model, tuple(sorted(generation_config.items())), prompt)
+    try:
+        return _inflight.do(key, leader_call, wait_timeout=None if deadline is None else deadline.remaining())
+    except Abandoned:
+        return GEMINI_ERROR_RESPONSE
+    except FlightTimeout:
+        logger.warning("Gemini call timed out waiting for an identical in-flight call", extra={"route": route_name})
+        route_calls.inc(route=route_name, model=route.model, outcome="deadline")
+        return GEMINI_ERROR_RESPONSE
 
-def generate_with_gemini(prompt: str) -> str:
+def generate_with_gemini(prompt: str, route: str = "answer", deadline: Optional[Deadline] = None) -> str:
     """Generate text using Gemini API with fallback."""
     try:
-        if len(prompt) > 1000:
-            prompt_lines = prompt.split('\n')
-            if len(prompt_lines) > 20:
-                prompt = '\n'.join(prompt_lines[:10] + ['\n...[content trimmed]...\n'] + prompt_lines[-10:])
-        if len(prompt) > 6000:
-            prompt = prompt[:1500] + "\n...[content trimmed]...\n" + prompt[-1500:]
-        print(f"Prompt length: {len(prompt)} characters")
-        return gemini_generate(prompt)
+        prompt = fit_prompt(prompt)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Prompt length: ~%d tokens", count_tokens(prompt), extra={"route": route})
+        return gemini_generate(prompt, deadline=deadline, route=route)
     except Exception as e:
-        print(f"Error generating response: {e}")
+        logger.exception("Error generating response: %s", e)
         return "I'm having trouble connecting to my knowledge source. For legal matters, it's always best to consult with a qualified attorney who can provide personalized advice."
 
-def is_legal_query_gemini(query: str, conversation_history: str = "") -> bool:
+def is_legal_query_gemini(query: str, conversation_history: str = "", deadline: Optional[Deadline] = None) -> bool:
     """Uses Gemini to determine if the query is legal in nature, considering conversation context."""
     # Check if the query itself is too short to be meaningful
     if len(query.strip()) < 5:
@@ -51,7 +565,7 @@ def is_legal_query_gemini(query: str, conversation_history: str = "") -> bool:
         # Check if this is likely a direct follow-up to a question about details
         if "have you" in conversation_history.lower() or "do you" in conversation_history.lower() or "could you" in conversation_history.lower() or "please provide" in conversation_history.lower():
             if "yes" in query.lower() or "no" in query.lower() or "i did" in query.lower() or "i didn't" in query.lower() or "i have" in query.lower() or "i don't" in query.lower():
-                print("Detected follow-up response to a question, treating as LEGAL")
+                logger.debug("Detected follow-up response to a question, treating as LEGAL")
                 return True
         
         # Check if the conversation history contains obvious legal topics
@@ -60,7 +574,7 @@ def is_legal_query_gemini(query: str, conversation_history: str = "") -> bool:
             if keyword in conversation_history.lower():
                 # If legal keywords are in history and this is a short response, it's likely continuing the legal conversation
                 if len(query.split()) < 15:
-                    print(f"Detected short follow-up to legal topic containing '{keyword}', treating as LEGAL")
+                    logger.debug("Detected short follow-up to legal topic containing '%s', treating as LEGAL", keyword)
                     return True
                     
         # Extract a brief summary for context
@@ -86,84 +600,32 @@ Reply with only 'LEGAL' or 'NOT LEGAL'.
 Query: "{query}"
 """
     try:
-        result = gemini_generate(prompt, max_tokens=5, temperature=0.0).strip().upper()
-        return result == "LEGAL"
+        # Identical queries in a batch are classified once
+        result = shared("classification", prompt, gemini_generate, prompt, deadline=deadline, route="classification")
+        if result == GEMINI_ERROR_RESPONSE:
+            return True  # Don't turn an outage into a "not legal" redirect
+        return result.strip().upper() == "LEGAL"
     except Exception as e:
-        print(f"Error in legal query classification: {e}")
+        logger.exception("Error in legal query classification: %s", e)
         return True  # Default to assuming it's legal if we can't classify
 
-def generate_direct_answer(query: str, context: str = "", conversation_history: str = "", is_followup: bool = False, max_tokens: int = 256) -> str:
-    """Generate a direct answer with simplified context to reduce tokens."""
-    # Always use conversation history to be more context-aware
-    
-    # Limit conversation history to reduce tokens
-    if conversation_history and len(conversation_history) > 300:
-        # Extract just the last exchange or two - more focused context
-        parts = conversation_history.split("\n\n")
-        if len(parts) > 2:
-            conversation_history = "\n\n".join(parts[-2:])
-    
-    # Check for impact queries to use a more focused system prompt
-    is_impact_query = "impact" in query.lower() or "consequence" in query.lower() or "effect" in query.lower()
-    
-    # Build the prompt
-    if is_impact_query:
-        system_prompt = (
-            "You are an Indian legal assistant specializing in practical legal impacts. "
-            "Focus ONLY on consequences, penalties, and next steps. "
-            "Be extremely concise (max 200 tokens). "
-            "Your response should be structured as a short list of practical points. "
-            "For impact queries, never discuss legal theory - focus on practical consequences only."
-        )
-    else:
-        system_prompt = (
-            "You are an Indian legal assistant powered by a large language model. "
-            "You answer ONLY questions about Indian law. "
-            "Be extremely concise (max 256 tokens). "
-            "Don't provide disclaimers unless absolutely necessary. "
-            "When case URLs are provided in your context, ALWAYS include them in your answer. "
-            "Format case references as: [Case Name](URL). "
-            "Preserve ALL URLs exactly as provided. "
-            "For non-legal questions, politely redirect to legal topics only."
-        )
-    
-    # Extract and preserve case URLs
-    preserved_urls = []
-    url_pattern = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
-    url_matches = url_pattern.findall(context)
-    for case_name, url in url_matches:
-        preserved_urls.append((case_name, url))
-    
-    # Optimize context to focus on most relevant information
-    if context and len(context) > 400:
-        context_lines = context.split('\n')
-        context = '\n'.join(context_lines[:5])  # Only use most important context
-        
-    # Add a special instruction for preserved URLs
-    if preserved_urls:
-        context += "\n\nIMPORTANT: Include these case references with exact URLs:\n"
-        for case_name, url in preserved_urls:
-            context += f"- [{case_name}]({url})\n"
-    
-    context_part = f"\nRelevant context:\n{context}" if context else ""
-    history_part = f"\nPrevious conversation:\n{conversation_history}" if conversation_history else ""
-    
-    # Check if this is an impact query to use a more specific format
-    if "impact" in query.lower() or "consequence" in query.lower() or "effect" in query.lower():
-        prompt = f"""{system_prompt}{context_part}{history_part}
+def generate_direct_answer(query: str, context: str = "", conversation_history: str = "", is_followup: bool = False, max_tokens: int = None, cases: List[Dict] = None, deadline: Optional[Deadline] = None, route: str = "answer", cite_cases: bool = False) -> str:
+    """Generate a direct answer with simplified context to reduce tokens.
 
-Question: {query}
-
-Answer with only the practical impact and next steps, under {max_tokens} tokens:
-1. Immediate consequences: 
-2. Legal remedies: 
-3. Next steps:"""
-    else:
-        prompt = f"{system_prompt}{context_part}{history_part}\n\nQuestion: {query}\n\nAnswer (be concise, under {max_tokens} tokens):"
+    With cite_cases (answers to case requests) known cases the answer doesn't cite are listed after it.
+    """
+    # The token limit comes from the route unless the caller overrides it
+    max_tokens = max_tokens or get_route(route).max_tokens or 256
+    # Assemble the prompt within a fixed token budget; case links are kept verbatim
+    prompt, preserved_urls = build_answer_prompt(query, context, conversation_history, max_tokens)
+    known_links = known_case_links(preserved_urls, cases)
     
     # Generate answer with strict token limit
     try:
-        answer = gemini_generate(prompt, max_tokens=max_tokens, temperature=0.5)
+        answer = gemini_generate(prompt, max_tokens=max_tokens, deadline=deadline, route=route)
+        if answer == GEMINI_ERROR_RESPONSE:
+            raise RuntimeError("Gemini call failed")
+        count_answer()
         
         # If non-legal question is detected and no context available, use standard response
         if "rephrase your question" in answer.lower() or "focus on a legal topic" in answer.lower():
@@ -173,19 +635,25 @@ Answer with only the practical impact and next steps, under {max_tokens} tokens:
             )
             return non_legal_response
             
-        # Check for truncated URLs and fix them
-        if "](http" in answer and ")" not in answer.split("](http")[-1]:
-            # URL got truncated, let's fix by regenerating with lower token limit
-            print("URL truncation detected, regenerating with lower token limit")
+        # Repair truncated or mangled case links against the cases we supplied
+        answer, unresolved = repair_case_links(answer, known_links)
+        if unresolved and not known_links:
+            # Nothing to repair from locally, regenerate with a lower token limit
+            logger.info("URL truncation detected, regenerating with lower token limit")
+            count_answer(regenerated=True)
             reduced_tokens = max(100, max_tokens - 50)  # Reduce by 50 tokens or set to 100 minimum
-            answer = gemini_generate(prompt, max_tokens=reduced_tokens, temperature=0.5)
+            regenerated = gemini_generate(prompt, max_tokens=reduced_tokens, deadline=deadline, route=route)
+            if regenerated != GEMINI_ERROR_RESPONSE:
+                answer, _ = repair_case_links(regenerated, known_links)
             
         # Fall back to simpler prompt if failed or result is too short
         if not answer or len(answer) < 20:
             simpler_prompt = f"Answer this legal question about Indian law in {max_tokens} tokens or less: {query}"
-            answer = gemini_generate(simpler_prompt, max_tokens=max_tokens)
+            answer = gemini_generate(simpler_prompt, max_tokens=max_tokens, deadline=deadline, route=route)
+            if answer == GEMINI_ERROR_RESPONSE:
+                raise RuntimeError("Gemini call failed")
             
-        return answer
+        return append_missing_citations(answer, known_links) if cite_cases else answer
     except Exception as e:
-        print(f"Error in generating direct answer: {e}")
+        logger.warning("Error in generating direct answer: %s", e)
         return "I'm unable to generate a response at the moment. Please try again later."
\ No newline at end of file
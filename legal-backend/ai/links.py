@@ -0,0 +1,187 @@
+import re
+from typing import List, Dict, Optional, Tuple
+
+from ai.prompt import CASE_LINK_PATTERN
+from utils import metrics
+
+# Deterministic clean-up of case citations in model output. The model is told to
+# cite cases as [Case Name](URL); when it runs out of tokens mid-link or garbles a
+# Kanoon URL we repair it against the cases we actually gave it instead of paying
+# for another generation.
+
+KANOON_DOC_RE = re.compile(r'(?:https?://)?(?:www\.)?indiankanoon\.org/(?:doc|docfragment)/(\d+)', re.IGNORECASE)
+KANOON_HOST_RE = re.compile(r'^(?:https?://)?(?:www\.)?indiankanoon\.org', re.IGNORECASE)
+
+link_repairs = metrics.counter("answer_link_repairs_total", "Case links repaired locally", ("kind",))
+answers_generated = metrics.counter("answers_generated_total", "Direct answers generated")
+answer_regenerations = metrics.counter("answer_regenerations_total", "Answers regenerated because a link could not be repaired")
+regeneration_ratio = metrics.gauge("answer_regeneration_ratio", "Share of direct answers that needed a second Gemini call")
+
+
+def regeneration_rate() -> float:
+    """Fraction of direct answers that needed a second Gemini call."""
+    total = answers_generated.value()
+    return answer_regenerations.value() / total if total else 0.0
+
+
+def count_answer(regenerated: bool = False):
+    """Count a generated answer, or its regeneration, and update the exported regeneration ratio."""
+    (answer_regenerations if regenerated else answers_generated).inc()
+    regeneration_ratio.set(regeneration_rate())
+
+
+def canonical_kanoon_url(url: str) -> str:
+    """Normalize an Indian Kanoon document URL to https://indiankanoon.org/doc/<id>/."""
+    m = KANOON_DOC_RE.search(url or "")
+    if m:
+        return f"https://indiankanoon.org/doc/{m.group(1)}/"
+    return url
+
+
+def _name_key(name: str) -> str:
+    return re.sub(r'[^a-z0-9]+', ' ', (name or "").lower()).strip()
+
+
+def known_case_links(preserved_urls: List[Tuple[str, str]] = None, cases: List[Dict] = None) -> List[Tuple[str, str]]:
+    """Merge Markdown links from the prompt context and scraped cases into one (name, URL) list."""
+    links = []
+    seen = set()
+    for name, url in list(preserved_urls or []) + [(c.get('title', ''), c.get('url', '')) for c in (cases or [])]:
+        if not url or url in seen:
+            continue
+        seen.add(url)
+        links.append((name, url))
+    return links
+
+
+class _CaseIndex:
+    """Lookup of known cases by Kanoon document id, URL prefix and name."""
+    def __init__(self, links: List[Tuple[str, str]]):
+        self.links = links
+        self.by_doc = {}
+        for name, url in links:
+            m = KANOON_DOC_RE.search(url)
+            if m:
+                self.by_doc.setdefault(m.group(1), (name, url))
+
+    def by_url(self, url: str) -> Optional[Tuple[str, str]]:
+        if not url:
+            return None
+        m = KANOON_DOC_RE.search(url)
+        if m and m.group(1) in self.by_doc:
+            return self.by_doc[m.group(1)]
+        # A truncated URL is a prefix of the real one
+        partial = KANOON_HOST_RE.sub("", url).strip("/")
+        if len(partial) >= 5:
+            matches = [(n, u) for n, u in self.links if KANOON_HOST_RE.sub("", u).strip("/").startswith(partial)]
+            if len(matches) == 1:
+                return matches[0]
+        return None
+
+    def by_name(self, name: str) -> Optional[Tuple[str, str]]:
+        key = _name_key(name)
+        if len(key) < 4:
+            return None
+        words = set(key.split())
+        best, best_score = None, 0.0
+        for known_name, url in self.links:
+            known_key = _name_key(known_name)
+            if not known_key:
+                continue
+            if known_key.startswith(key) or key.startswith(known_key):
+                return (known_name, url)
+            known_words = set(known_key.split())
+            score = len(words & known_words) / len(words | known_words)
+            if score > best_score:
+                best, best_score = (known_name, url), score
+        return best if best_score >= 0.5 else None
+
+
+def _split_dangling_link(answer: str) -> Tuple[str, Optional[str], Optional[str]]:
+    """Split off a Markdown link cut short at the end of the answer.
+
+    Returns (text before the link, link name, partial URL); the name is None
+    when the answer doesn't end in a truncated link.
+    """
+    start = answer.rfind('[')
+    if start == -1:
+        return answer, None, None
+    tail = answer[start:]
+    if CASE_LINK_PATTERN.match(tail):
+        return answer, None, None
+    close = tail.find(']')
+    if close == -1:
+        return answer[:start], tail[1:], None
+    rest = tail[close + 1:]
+    if rest.startswith('('):
+        if ')' in rest:
+            return answer, None, None
+        return answer[:start], tail[1:close], rest[1:]
+    if rest.strip():
+        # "[Something] more text" is not a link at all
+        return answer, None, None
+    return answer[:start], tail[1:close], None
+
+
+def repair_case_links(answer: str, known_links: List[Tuple[str, str]]) -> Tuple[str, int]:
+    """Repair truncated or mangled case links against the known cases.
+
+    Returns the repaired answer and the number of links whose URL was cut off
+    and could not be resolved against the known cases (they are reduced to
+    plain text). A trailing "[text" or "[text]" is completed when it names a
+    known case and otherwise left as it is.
+    """
+    if not answer:
+        return answer, 0
+    index = _CaseIndex(known_links)
+    unresolved = 0
+
+    # 1. Complete a link cut off by the token limit
+    head, name, partial_url = _split_dangling_link(answer)
+    if name is not None:
+        match = index.by_url(partial_url) or index.by_name(name)
+        if match:
+            # Use the full case name if the name itself was cut short
+            link_name = match[0] if _name_key(match[0]).startswith(_name_key(name)) else name
+            answer = f"{head}[{link_name}]({match[1]})"
+            link_repairs.inc(kind="truncated")
+        elif partial_url is not None:
+            # A cut URL can't be left in the answer
+            answer = f"{head}{name}".rstrip()
+            unresolved += 1
+            link_repairs.inc(kind="dropped")
+        # Bracketed text without a URL part may not be a link at all; leave it alone
+
+    # 2. Fix Kanoon URLs the model garbled in otherwise complete links
+    def _fix(m):
+        link_name, url = m.group(1), m.group(2).strip()
+        match = index.by_url(url)
+        if match is None and (KANOON_HOST_RE.match(url) or not url.startswith("http")):
+            match = index.by_name(link_name)
+        if match and match[1] != url:
+            link_repairs.inc(kind="mangled")
+            return f"[{link_name}]({match[1]})"
+        if match is None and KANOON_DOC_RE.search(url) and not url.startswith("https://"):
+            link_repairs.inc(kind="mangled")
+            return f"[{link_name}]({canonical_kanoon_url(url)})"
+        return m.group(0)
+    answer = CASE_LINK_PATTERN.sub(_fix, answer)
+
+    return answer, unresolved
+
+
+def append_missing_citations(answer: str, known_links: List[Tuple[str, str]]) -> str:
+    """Append the known Kanoon cases that the answer doesn't cite.
+
+    Only for answers to case requests; elsewhere the cases are background and
+    listing them would pad the answer.
+    """
+    index = _CaseIndex(known_links)
+    if not answer or not index.by_doc:
+        return answer
+    cited = set(KANOON_DOC_RE.findall(answer))
+    missing = [(n, u) for doc_id, (n, u) in index.by_doc.items() if doc_id not in cited]
+    if missing:
+        answer = answer.rstrip() + "\n\nRelevant cases:\n" + "\n".join(f"- [{n}]({u})" for n, u in missing)
+        link_repairs.inc(len(missing), kind="appended")
+    return answer
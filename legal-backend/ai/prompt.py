@@ -0,0 +1,294 @@
+import re
+from functools import lru_cache
+from itertools import islice
+from typing import List, Dict, Optional, Tuple
+
+# Rough SentencePiece-style approximation: one token per punctuation mark and
+# per 4-character chunk of a word, as matched by _TOKEN_RE.
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+# ASCII text is counted with str methods instead, several times faster than
+# the regex: each word character becomes "x" and each punctuation mark ".",
+# and with every word padded by "xxx" it holds ceil(len / 4) runs of "xxxx"
+_ASCII_CLASSES = str.maketrans({c: "x" if c.isalnum() or c == "_" else " " if c.isspace() else "."
+                                for c in map(chr, range(128))})
+_SPACE_RE = re.compile(r"\s")
+_TRIM_MARKER = "...[content trimmed]..."
+
+# Token budgets used when assembling answer prompts
+ANSWER_PROMPT_BUDGET = 1200
+ANSWER_SECTION_BUDGETS = {
+    "system": 200,
+    "context": 250,
+    "history": 200,
+    "question": 400,
+}
+
+# Budget for free-form prompts passed to generate_with_gemini
+GENERIC_PROMPT_BUDGET = 1500
+
+CASE_LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of model tokens in text without a remote tokenizer."""
+    if not text:
+        return 0
+    if text.isascii():
+        classes = text.translate(_ASCII_CLASSES)
+        padded = classes.replace(".", " ").replace(" ", "xxx ") + "xxx"
+        return classes.count(".") + padded.count("xxxx")
+    return len(_TOKEN_RE.findall(text))
+
+
+@lru_cache(maxsize=64)
+def _fixed_tokens(text: str) -> int:
+    """count_tokens for the few fixed strings (headers, system prompts) counted on every build."""
+    return count_tokens(text)
+
+
+def _snap_back(text: str, offset: int) -> int:
+    """Move a cut at `offset` back to the start of the word it would split."""
+    if offset <= 0 or not text[offset - 1].isalnum() or not text[offset].isalnum():
+        return offset
+    space = text.rfind(" ", 0, offset)
+    return offset if space == -1 else space
+
+
+def _snap_forward(text: str, offset: int) -> int:
+    """Move a cut at `offset` forward past the rest of the word it would split."""
+    if offset <= 0 or not text[offset - 1].isalnum() or not text[offset].isalnum():
+        return offset
+    space = text.find(" ", offset)
+    return len(text) if space == -1 else space
+
+
+def _last_tokens(text: str, end: int, n: int) -> Tuple[int, int]:
+    """Where the last n tokens of text[:end] start, and n; (0, count) if it has fewer.
+
+    `end` must not fall inside a word. Tokens are counted in a window before
+    `end` that starts after whitespace, so they line up with those of the
+    whole text, and the window is widened until it holds n tokens. Only the
+    tokens in front of the last n are scanned for their offsets.
+    """
+    window = 4 * (n + 1)
+    while True:
+        start = end - window
+        if start > 0:
+            space = _SPACE_RE.search(text, start, end)
+            start = end if space is None else space.end()
+        else:
+            start = 0
+        count = count_tokens(text[start:end])
+        if count >= n:
+            offset = next(islice(_TOKEN_RE.finditer(text, start, end), count - n, None)).start()
+            return offset, n
+        if start == 0:
+            return 0, count
+        window *= 2
+
+
+def _fit_head(text: str, budget: int) -> Tuple[str, int]:
+    """The longest start of text within budget tokens, and its token count.
+
+    Only a prefix a little longer than the budget is counted, so a long text
+    costs no more than a short one. The cut falls between words inside the
+    line that overflows; it doesn't fall back to the previous line break.
+    """
+    if len(text) <= budget:
+        # Every token is at least one character
+        return text, count_tokens(text)
+    window = 4 * (budget + 1)
+    while True:
+        space = _SPACE_RE.search(text, window)
+        end = len(text) if space is None else space.start()
+        count = count_tokens(text[:end])
+        if count > budget or end == len(text):
+            break
+        window *= 2
+    if count <= budget:
+        return text, count
+    # Drop the tokens past the budget from the end of the prefix
+    offset, _ = _last_tokens(text, end, count - budget)
+    cut = _snap_back(text, offset)
+    return text[:cut].rstrip(), budget - count_tokens(text[cut:offset])
+
+
+def _fit_tail(text: str, budget: int) -> Tuple[str, int]:
+    """The longest end of text within budget tokens, and its token count."""
+    if len(text) <= budget:
+        return text, count_tokens(text)
+    offset, count = _last_tokens(text, len(text), budget)
+    if offset == 0 or text[:offset].isspace():
+        return text, count
+    cut = _snap_forward(text, offset)
+    return text[cut:].lstrip(), budget - count_tokens(text[offset:cut])
+
+
+def _fit_lines(text: str, budget: int) -> Tuple[str, int]:
+    """The leading whole lines of text within budget tokens, and their token count."""
+    lines = text.split("\n")
+    used = 0
+    for kept, line in enumerate(lines):
+        tokens = count_tokens(line)
+        if used + tokens > budget:
+            return "\n".join(lines[:kept]).rstrip(), used
+        used += tokens
+    return text, used
+
+
+def _fit(text: str, budget: int, keep: str = "head") -> Tuple[str, int]:
+    """Trim text to at most budget tokens; returns the text and its token count.
+
+    `keep` is "head", "tail", "both" (the two ends around a marker) or "lines"
+    (leading whole lines, for lists that must not be cut mid-item).
+    """
+    if budget <= 0 or not text:
+        return "", 0
+    if keep == "lines":
+        return _fit_lines(text, budget)
+    if keep == "tail":
+        return _fit_tail(text, budget)
+    if keep == "both":
+        if len(text) <= budget:
+            return text, count_tokens(text)
+        whole, used = _fit_head(text, budget)
+        if whole is text:
+            return text, used
+        half = (budget - _fixed_tokens(_TRIM_MARKER)) // 2
+        if half < 1:
+            return _fit_head(text, budget)
+        head, head_used = _fit_head(text, half)
+        tail, tail_used = _fit_tail(text, half)
+        return f"{head}\n{_TRIM_MARKER}\n{tail}", head_used + _fixed_tokens(_TRIM_MARKER) + tail_used
+    return _fit_head(text, budget)
+
+
+def truncate_to_tokens(text: str, budget: int, keep: str = "head") -> str:
+    """Trim text to at most budget tokens, keeping the head, the tail or both ends."""
+    return _fit(text, budget, keep)[0]
+
+
+class PromptSection:
+    """A named piece of a prompt with its own priority and token budget."""
+    def __init__(self, name: str, text: str, budget: Optional[int] = None, priority: int = 0,
+                 keep: str = "head", header: str = "", tokens: Optional[int] = None):
+        self.name = name
+        self.text = text or ""
+        self.tokens = tokens
+        self.header = header
+        self.budget = budget
+        self.priority = priority
+        self.keep = keep
+
+
+class PromptBuilder:
+    """Assembles prompt sections within a total token budget.
+
+    Sections are allotted tokens in priority order (lower number first) and
+    rendered in the order they were added, so the system prompt and question
+    are never squeezed out by a long history.
+    """
+    def __init__(self, total_budget: int = ANSWER_PROMPT_BUDGET, separator: str = "\n\n"):
+        self.total_budget = total_budget
+        self.separator = separator
+        self.sections: List[PromptSection] = []
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def add(self, name: str, text: str, budget: Optional[int] = None, priority: int = 0,
+            keep: str = "head", header: str = "", tokens: Optional[int] = None) -> "PromptBuilder":
+        """Add a section; the header is kept verbatim and only the text is trimmed.
+
+        `tokens` is the text's token count, when the caller already knows it.
+        """
+        if text:
+            self.sections.append(PromptSection(name, text, budget, priority, keep, header, tokens))
+        return self
+
+    def build(self) -> str:
+        """Render the prompt, trimming lower-priority sections to fit the budget."""
+        remaining = self.total_budget
+        rendered: Dict[int, str] = {}
+        self.stats = {}
+        order = sorted(range(len(self.sections)), key=lambda i: self.sections[i].priority)
+        for i in order:
+            section = self.sections[i]
+            header_tokens = _fixed_tokens(section.header) if section.header else 0
+            allowed = remaining - header_tokens
+            if section.budget is not None:
+                allowed = min(allowed, section.budget - header_tokens)
+            if section.tokens is not None and section.tokens <= allowed:
+                text, used = section.text, section.tokens
+            else:
+                text, used = _fit(section.text, allowed, section.keep)
+            if text:
+                used += header_tokens
+                rendered[i] = f"{section.header}\n{text}" if section.header else text
+            remaining -= used
+            self.stats[section.name] = {"used": used, "trimmed": text is not section.text}
+        return self.separator.join(rendered[i] for i in sorted(rendered))
+
+    @property
+    def tokens_used(self) -> int:
+        return sum(s["used"] for s in self.stats.values())
+
+
+def fit_prompt(prompt: str, budget: int = GENERIC_PROMPT_BUDGET) -> str:
+    """Keep the instructions and the tail of an oversized free-form prompt."""
+    return truncate_to_tokens(prompt, budget, keep="both")
+
+
+def extract_case_links(context: str) -> List[Tuple[str, str]]:
+    """Return the (case name, URL) pairs of all Markdown links in context."""
+    return CASE_LINK_PATTERN.findall(context or "")
+
+
+def build_answer_prompt(query: str, context: str = "", conversation_history: str = "",
+                        max_tokens: int = 256, budget: int = ANSWER_PROMPT_BUDGET) -> Tuple[str, List[Tuple[str, str]]]:
+    """Build the prompt for generate_direct_answer and return it with the case links it must preserve."""
+    query_lower = query.lower()
+    is_impact_query = "impact" in query_lower or "consequence" in query_lower or "effect" in query_lower
+
+    if is_impact_query:
+        system_prompt = (
+            "You are an Indian legal assistant specializing in practical legal impacts. "
+            "Focus ONLY on consequences, penalties, and next steps. "
+            "Be extremely concise (max 200 tokens). "
+            "Your response should be structured as a short list of practical points. "
+            "For impact queries, never discuss legal theory - focus on practical consequences only."
+        )
+        question = (
+            f"Question: {query}\n\n"
+            f"Answer with only the practical impact and next steps, under {max_tokens} tokens:\n"
+            "1. Immediate consequences: \n2. Legal remedies: \n3. Next steps:"
+        )
+    else:
+        system_prompt = (
+            "You are an Indian legal assistant powered by a large language model. "
+            "You answer ONLY questions about Indian law. "
+            "Be extremely concise (max 256 tokens). "
+            "Don't provide disclaimers unless absolutely necessary. "
+            "When case URLs are provided in your context, ALWAYS include them in your answer. "
+            "Format case references as: [Case Name](URL). "
+            "Preserve ALL URLs exactly as provided. "
+            "For non-legal questions, politely redirect to legal topics only."
+        )
+        question = f"Question: {query}\n\nAnswer (be concise, under {max_tokens} tokens):"
+
+    # Case links go in their own section, which has no budget of its own and
+    # only ever loses whole links if the prompt runs out of room
+    preserved_urls = extract_case_links(context)
+    citations = ""
+    if preserved_urls:
+        citations = "IMPORTANT: Include these case references with exact URLs:\n" + "\n".join(
+            f"- [{case_name}]({url})" for case_name, url in preserved_urls
+        )
+
+    builder = PromptBuilder(budget)
+    builder.add("system", system_prompt, ANSWER_SECTION_BUDGETS["system"], priority=0,
+                tokens=_fixed_tokens(system_prompt))
+    builder.add("context", context, ANSWER_SECTION_BUDGETS["context"], priority=2, keep="head", header="Relevant context:")
+    builder.add("citations", citations, None, priority=1, keep="lines")
+    builder.add("history", conversation_history, ANSWER_SECTION_BUDGETS["history"], priority=3, keep="tail",
+                header="Previous conversation:")
+    builder.add("question", question, ANSWER_SECTION_BUDGETS["question"], priority=0, keep="both")
+    return builder.build(), preserved_urls
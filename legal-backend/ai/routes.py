@@ -0,0 +1,85 @@
+"""
+Per-call-site model configuration for Gemini calls.
+
+Each call site (classification, search phrase, section suggestions, answer,
+impact answer, summary, prefetch search phrase) has a route that sets the model, output token limit,
+temperature, timeout, scheduler priority, whether the call is hedged and how
+long its responses are cached (0: not cached). Routes can be
+overridden without code changes through a JSON file named by
+GEMINI_ROUTES_FILE, e.g.
+
+    {"answer": {"model": "gemini-2.0-flash", "max_tokens": 320},
+     "classification": {"timeout": 4}}
+"""
+import json
+import os
+from dataclasses import dataclass, replace, asdict
+from typing import Dict, Optional
+
+from utils.log import get_logger
+
+logger = get_logger("ai.routes")
+
+DEFAULT_MODEL = "gemini-2.0-flash-lite"
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    model: str = DEFAULT_MODEL
+    max_tokens: Optional[int] = None
+    temperature: float = 0.7
+    timeout: float = 30.0
+    priority: str = "answer"  # "classify", "answer" or "background"
+    hedge: bool = False
+    cache_ttl: float = 0.0  # seconds a response is reused for an identical prompt
+
+
+DEFAULT_ROUTES: Dict[str, ModelRoute] = {
+    "classification": ModelRoute(max_tokens=5, temperature=0.0, timeout=5.0, priority="classify", hedge=True, cache_ttl=86400.0),
+    "search_phrase": ModelRoute(max_tokens=48, temperature=0.2, timeout=8.0, priority="classify", hedge=True, cache_ttl=86400.0),
+    "section_suggestions": ModelRoute(max_tokens=200, temperature=0.2, timeout=10.0, priority="classify", hedge=True, cache_ttl=86400.0),
+    "answer": ModelRoute(max_tokens=256, temperature=0.5, timeout=20.0, priority="answer"),
+    "impact_answer": ModelRoute(max_tokens=200, temperature=0.5, timeout=20.0, priority="answer"),
+    "prefetch_search_phrase": ModelRoute(max_tokens=48, temperature=0.2, timeout=8.0, priority="background", cache_ttl=86400.0),
+    "summary": ModelRoute(max_tokens=256, temperature=0.3, timeout=30.0, priority="background"),
+}
+
+ROUTES: Dict[str, ModelRoute] = dict(DEFAULT_ROUTES)
+
+
+def load_routes(path: Optional[str] = None) -> Dict[str, ModelRoute]:
+    """Build the routing table from the defaults plus overrides in a JSON file."""
+    routes = dict(DEFAULT_ROUTES)
+    path = path or os.getenv("GEMINI_ROUTES_FILE")
+    if not path:
+        return routes
+    try:
+        with open(path) as f:
+            overrides = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not load Gemini routes from %s: %s", path, e)
+        return routes
+    fields = set(asdict(ModelRoute()))
+    for name, values in overrides.items():
+        unknown = set(values) - fields
+        if unknown:
+            logger.warning("Ignoring unknown route settings for '%s': %s", name, sorted(unknown))
+        values = {k: v for k, v in values.items() if k in fields}
+        routes[name] = replace(routes.get(name, ModelRoute()), **values)
+    return routes
+
+
+def reload_routes(path: Optional[str] = None) -> Dict[str, ModelRoute]:
+    """Re-read the routing table in place."""
+    routes = load_routes(path)
+    ROUTES.clear()
+    ROUTES.update(routes)
+    return ROUTES
+
+
+def get_route(name: str) -> ModelRoute:
+    """The route for a call site, falling back to the answer route."""
+    return ROUTES.get(name) or ROUTES["answer"]
+
+
+reload_routes()
@@ -0,0 +1,190 @@
+"""
+Token, latency and cost accounting for Gemini calls.
+
+Every successful call is recorded with its route (call site), model, prompt
+and output tokens and latency, and aggregated per route and model, per
+session and per intent. The intent is attached when the request's trace
+finishes, since it is only known part-way through a turn (this works with
+NYAYADOOT_TRACING=0 too); calls made outside a request (prefetch, bulk runs)
+are counted under "background".
+
+Identical concurrent calls are coalesced into one (ai.gemini), and that call is
+recorded once, under the session and intent of the caller that made it. The
+totals therefore match what was actually spent; sessions that shared the
+result are not charged for it and it does not count towards their budget.
+
+Sessions can be given a token budget (NYAYADOOT_SESSION_TOKEN_BUDGET). Past
+it, the session's calls go to a cheaper model with a smaller output limit and
+its turns are admitted at a degraded tier that skips LLM retrieval calls.
+
+Environment:
+    NYAYADOOT_SESSION_TOKEN_BUDGET  tokens per session before downgrading (0: no budget)
+    NYAYADOOT_BUDGET_MODEL          model used for over-budget sessions
+    NYAYADOOT_BUDGET_MAX_TOKENS     output token cap for over-budget sessions
+    NYAYADOOT_BUDGET_TIER           minimum service tier for over-budget sessions
+    NYAYADOOT_MODEL_PRICES          JSON {"model": [usd per 1M input, usd per 1M output]}
+    NYAYADOOT_USAGE_MAX_SESSIONS    sessions kept in the ledger (least recently active dropped)
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import replace
+from typing import Dict, Optional, Tuple
+
+from ai.routes import ModelRoute, DEFAULT_MODEL
+from utils import metrics
+from utils.admission import TIERS
+from utils.log import get_logger
+from utils.tracing import current_trace
+
+logger = get_logger("ai.usage")
+
+# USD per million tokens (input, output)
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+}
+
+SESSION_TOKEN_BUDGET = int(os.getenv("NYAYADOOT_SESSION_TOKEN_BUDGET", "0"))
+BUDGET_MODEL = os.getenv("NYAYADOOT_BUDGET_MODEL", DEFAULT_MODEL)
+BUDGET_MAX_TOKENS = int(os.getenv("NYAYADOOT_BUDGET_MAX_TOKENS", "160"))
+BUDGET_TIER = os.getenv("NYAYADOOT_BUDGET_TIER", "cached_only")
+if BUDGET_TIER not in TIERS:
+    logger.warning("Unknown NYAYADOOT_BUDGET_TIER %r; using cached_only", BUDGET_TIER)
+    BUDGET_TIER = "cached_only"
+
+cost_total = metrics.counter("gemini_cost_usd_total", "Estimated Gemini spend in USD", ("route", "model"))
+budget_exceeded = metrics.counter("session_budget_exceeded_total", "Sessions that went over their token budget")
+
+
+def load_prices(spec: Optional[str] = None) -> Dict[str, Tuple[float, float]]:
+    prices = dict(DEFAULT_PRICES)
+    spec = spec if spec is not None else os.getenv("NYAYADOOT_MODEL_PRICES")
+    if spec:
+        try:
+            prices.update({model: (float(p[0]), float(p[1])) for model, p in json.loads(spec).items()})
+        except (ValueError, TypeError, IndexError) as e:
+            logger.warning("Ignoring malformed NYAYADOOT_MODEL_PRICES: %s", e)
+    return prices
+
+
+class Usage:
+    """Running totals for one aggregation key."""
+    __slots__ = ("calls", "prompt_tokens", "output_tokens", "latency", "cost")
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.latency = 0.0
+        self.cost = 0.0
+
+    def add(self, prompt_tokens: int, output_tokens: int, latency: float, cost: float):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.output_tokens += output_tokens
+        self.latency += latency
+        self.cost += cost
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.output_tokens
+
+    def to_dict(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "output_tokens": self.output_tokens,
+            "mean_latency": round(self.latency / self.calls, 4) if self.calls else None,
+            "cost_usd": round(self.cost, 6),
+        }
+
+
+class UsageLedger:
+    """Usage per route/model, session and intent; thread-safe."""
+    def __init__(self, session_budget: int = SESSION_TOKEN_BUDGET, max_sessions: Optional[int] = None,
+                 prices: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.session_budget = session_budget
+        self.max_sessions = max_sessions or int(os.getenv("NYAYADOOT_USAGE_MAX_SESSIONS", "10000"))
+        self.prices = prices or load_prices()
+        self._lock = threading.Lock()
+        self.total = Usage()
+        self.by_route: Dict[Tuple[str, str], Usage] = {}
+        self.by_intent: Dict[str, Usage] = {}
+        self.sessions: "OrderedDict[str, Usage]" = OrderedDict()
+
+    def cost(self, model: str, prompt_tokens: int, output_tokens: int) -> float:
+        input_price, output_price = self.prices.get(model, (0.0, 0.0))
+        return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def record(self, route: str, model: str, prompt_tokens: int, output_tokens: int, latency: float,
+               session_id: Optional[str] = None):
+        """Record one call; the intent is taken from the current request's trace when it finishes.
+
+        Callers that shared a coalesced call are not recorded; it counts only for the caller that made it.
+        """
+        cost = self.cost(model, prompt_tokens, output_tokens)
+        cost_total.inc(cost, route=route, model=model)
+        with self._lock:
+            self.total.add(prompt_tokens, output_tokens, latency, cost)
+            self.by_route.setdefault((route, model), Usage()).add(prompt_tokens, output_tokens, latency, cost)
+            if session_id and session_id != "-":
+                session = self.sessions.pop(session_id, None) or Usage()
+                was_within = session.tokens <= self.session_budget
+                session.add(prompt_tokens, output_tokens, latency, cost)
+                self.sessions[session_id] = session
+                while len(self.sessions) > self.max_sessions:
+                    self.sessions.popitem(last=False)
+                if self.session_budget and was_within and session.tokens > self.session_budget:
+                    budget_exceeded.inc()
+                    logger.warning("Session went over its token budget", extra={"tokens": session.tokens})
+        trace = current_trace()
+        if trace is not None:
+            trace.on_finish(lambda intent: self._record_intent(intent, prompt_tokens, output_tokens, latency, cost))
+        else:
+            self._record_intent("background", prompt_tokens, output_tokens, latency, cost)
+
+    def _record_intent(self, intent: str, prompt_tokens: int, output_tokens: int, latency: float, cost: float):
+        with self._lock:
+            self.by_intent.setdefault(intent, Usage()).add(prompt_tokens, output_tokens, latency, cost)
+
+    def session_tokens(self, session_id: Optional[str]) -> int:
+        with self._lock:
+            usage = self.sessions.get(session_id) if session_id else None
+            return usage.tokens if usage else 0
+
+    def over_budget(self, session_id: Optional[str]) -> bool:
+        return bool(self.session_budget) and self.session_tokens(session_id) > self.session_budget
+
+    def report(self, session_id: Optional[str] = None, top: int = 20) -> Dict:
+        """Totals per route, intent and the heaviest sessions (or one session)."""
+        with self._lock:
+            report = {
+                "total": self.total.to_dict(),
+                "session_budget": self.session_budget or None,
+                "routes": [dict(route=route, model=model, **usage.to_dict())
+                           for (route, model), usage in sorted(self.by_route.items())],
+                "intents": {intent: usage.to_dict() for intent, usage in sorted(self.by_intent.items())},
+            }
+            if session_id is not None:
+                usage = self.sessions.get(session_id)
+                report["session"] = dict(session_id=session_id, **(usage or Usage()).to_dict(),
+                                         over_budget=self.session_budget and usage is not None
+                                         and usage.tokens > self.session_budget)
+            else:
+                heaviest = sorted(self.sessions.items(), key=lambda item: -item[1].tokens)[:top]
+                report["top_sessions"] = [dict(session_id=sid, tokens=usage.tokens, **usage.to_dict())
+                                          for sid, usage in heaviest]
+            return report
+
+
+def budget_route(route: ModelRoute) -> ModelRoute:
+    """The cheaper variant of a route used for sessions over their budget."""
+    max_tokens = BUDGET_MAX_TOKENS if route.max_tokens is None else min(route.max_tokens, BUDGET_MAX_TOKENS)
+    return replace(route, model=BUDGET_MODEL, max_tokens=max_tokens, hedge=False)
+
+
+ledger = UsageLedger()
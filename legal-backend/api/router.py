@@ -1,18 +1,32 @@
-from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Literal
+import asyncio
+import hmac
+import os
 import uuid
 import re
 import random
 
 from conversation.state import ConversationState
+from conversation.prefetch import Prefetcher, PREFETCH_CONSUMERS, is_generic_case_request, same_topic
+from conversation.enrichment import EnrichmentStore, ENRICHMENT_WAIT, ENRICHMENT_BUDGET, enrichment_events, run_detached
 from utils.sanitize import sanitize_query
 from utils.responses import get_contextual_redirect, NON_LEGAL_RESPONSES
 from utils.case_helper import handle_case_lookup, extract_case_names
-from keywords.extractor import extract_keywords_from_conversation
+from keywords.extractor import extract_keywords_from_conversation, format_keywords, is_legal_query_local
 from retrieval.section import find_relevant_sections
 from scraping.kanoon import fetch_kanoon_results, fetch_cases_from_api_suggestions
-from ai.gemini import generate_with_gemini, is_legal_query_gemini, generate_direct_answer
+from ai.gemini import generate_with_gemini, is_legal_query_gemini, generate_direct_answer, scheduler
+from ai.usage import ledger, BUDGET_TIER
+from utils.deadline import Deadline
+from utils.tracing import span, start_trace, set_intent
+from utils.log import get_logger, bind_request
+from utils.memo import shared_work
+from utils.idempotency import IdempotencyStore, IdempotencyConflict, fingerprint
+from utils.admission import AdmissionController, Overloaded, get_tier, at_least
+
+logger = get_logger("api.router")
 
 # Create router
 router = APIRouter(prefix="/nyayadoot")
@@ -20,10 +34,24 @@ router = APIRouter(prefix="/nyayadoot")
 # Initialize conversation state
 conv_state = ConversationState()
 
+# Kanoon results fetched ahead of the likely next turn
+prefetcher = Prefetcher()
+
+# Case lookups still running after their turn was answered
+enrichments = EnrichmentStore()
+
+# Responses by idempotency key, so client retries don't rerun a turn
+idempotency = IdempotencyStore()
+
+# Tiered load shedding in front of the pipeline (see utils/admission.py)
+admission = AdmissionController.from_env(queue_wait=lambda: scheduler.recent_wait)
+
 # Request and response models
 class QueryRequest(BaseModel):
     query: str
     session_id: Optional[str] = None
+    idempotency_key: Optional[str] = None  # same key on a retry (with a session_id) returns the original turn's response
+    defer_enrichment: bool = False  # answer a cases turn without waiting for a slow Kanoon lookup
     
 class QueryResponse(BaseModel):
     answer: str
@@ -31,6 +59,29 @@ class QueryResponse(BaseModel):
     cases: List[Dict] = []
     session_id: str
     conversation_stage: str = "initial"  # Added field to track conversation stage
+    service_tier: str = "full"  # load-shedding tier the turn was answered at
+    enrichment_id: Optional[str] = None  # set when cases are still being looked up; see /enrichment/{id}
+
+class BatchQueryRequest(BaseModel):
+    items: List[QueryRequest]
+    max_concurrency: Optional[int] = None  # capped at BATCH_MAX_CONCURRENCY
+
+class BatchItemResult(BaseModel):
+    index: int
+    response: Optional[QueryResponse] = None
+    error: Optional[str] = None
+    duplicate_of: Optional[int] = None  # index of the identical item whose answer this is
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchItemResult]
+    unique: int
+
+# Largest batch accepted by /query/batch, and how many of its items run at once
+BATCH_MAX_ITEMS = int(os.getenv("NYAYADOOT_BATCH_MAX_ITEMS", "50"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("NYAYADOOT_BATCH_CONCURRENCY", "4"))
+
+# Seconds of the turn budget kept back for answer generation when retrieving sections or cases
+ANSWER_RESERVE_SECONDS = 8
 
 # Define conversation stages and keyword patterns
 CONVERSATION_STAGES = {
@@ -59,7 +110,8 @@ def detect_query_intent(query: str, conversation_history: str = "") -> str:
     example_request = "example" in query_lower and "case" in query_lower
     
     if has_case_keywords or has_case_name or similar_case_phrase or like_this_phrase or example_request:
-        print(f"Detected case-related query. Keywords: {has_case_keywords}, Case names: {has_case_name}, Similar phrase: {similar_case_phrase}, Like this: {like_this_phrase}")
+        logger.debug("Detected case-related query. Keywords: %s, Case names: %s, Similar phrase: %s, Like this: %s",
+                     has_case_keywords, has_case_name, similar_case_phrase, like_this_phrase)
         return "cases"
     
     # Check for intent related to impact or consequences
@@ -72,12 +124,12 @@ def detect_query_intent(query: str, conversation_history: str = "") -> str:
                                                             "what is the penalty", "what punishment"])
     
     if has_impact_keywords or impact_phrase:
-        print(f"Detected impact-related query. Keywords: {has_impact_keywords}, Phrases: {impact_phrase}")
+        logger.debug("Detected impact-related query. Keywords: %s, Phrases: %s", has_impact_keywords, impact_phrase)
         return "impact"
     
     # Check for intent related to legal sections
     if any(word in query_lower for word in ["section", "act", "ipc", "crpc", "provision", "law", "legal section"]):
-        print("Detected section-related query")
+        logger.debug("Detected section-related query")
         return "sections"
     
     # After specific intent checks, check if it's a follow-up
@@ -85,7 +137,7 @@ def detect_query_intent(query: str, conversation_history: str = "") -> str:
         # If the last message was from the assistant asking for details
         if "have you" in conversation_history.lower() or "do you" in conversation_history.lower() or "could you" in conversation_history.lower():
             if len(query.split()) < 15:
-                print("Detected follow-up response to our question, treating as followup")
+                logger.debug("Detected follow-up response to our question, treating as followup")
                 return "followup"
     
     # If detailed enough (long query)
@@ -100,10 +152,112 @@ def detect_query_intent(query: str, conversation_history: str = "") -> str:
 
 # Routes
 @router.post("/query", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
-    """Process a legal query in a conversational, step-by-step manner."""
-    query = sanitize_query(request.query)
+async def process_query(request: QueryRequest, response: Response):
+    """Process a legal query in a conversational, step-by-step manner.
+
+    A request repeating an earlier idempotency key for the same session gets
+    the earlier response, waiting for it if it is still being generated, and
+    is marked with an Idempotent-Replayed header. Keys are scoped to the
+    session, so they are ignored on requests without a session_id: anonymous
+    clients would otherwise share one key space and could be handed each
+    other's answers and new sessions.
+    """
+    bind_request(request_id=uuid.uuid4().hex[:12])
+    try:
+        if not request.idempotency_key or not request.session_id:
+            return await traced_answer(request)
+        key = (request.session_id, request.idempotency_key)
+        result, outcome = await idempotency.run(key, fingerprint(request.query), lambda: traced_answer(request))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if outcome != "new":
+        logger.info("Answered from idempotency key", extra={"outcome": outcome})
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def traced_answer(request: QueryRequest) -> QueryResponse:
+    """Admit and answer one turn, recording a trace of its stages. Raises Overloaded when shedding load.
+
+    Sessions over their token budget are served at BUDGET_TIER or below.
+    """
+    floor = BUDGET_TIER if ledger.over_budget(request.session_id) else "full"
+    with admission.admit(floor=floor):
+        trace = start_trace()
+        try:
+            return await answer_query(request)
+        finally:
+            trace.finish()
+
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def process_query_batch(request: BatchQueryRequest):
+    """Answer many queries in one call; results come back in request order.
+
+    Identical queries (same text and session) are answered once. Items share
+    classification, search phrases and Kanoon scrapes through a shared-work
+    scope. Turns of the same session run one after another, in order; other
+    items run concurrently up to the batch's concurrency cap. A failing item
+    is reported in its `error` field without failing the batch.
+    """
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"A batch may contain at most {BATCH_MAX_ITEMS} queries")
+    batch_id = uuid.uuid4().hex[:12]
+    bind_request(request_id=batch_id)
+
+    first_index: Dict[tuple, int] = {}
+    duplicates: Dict[int, int] = {}
+    sessions: Dict[object, List[int]] = {}
+    for index, item in enumerate(request.items):
+        key = (sanitize_query(item.query), item.session_id)
+        if key in first_index:
+            duplicates[index] = first_index[key]
+            continue
+        first_index[key] = index
+        # Items without a session are independent of each other
+        sessions.setdefault(item.session_id or index, []).append(index)
+
+    limit = max(1, min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(limit)
+    outcomes: Dict[int, BatchItemResult] = {}
+
+    async def run_item(index: int):
+        async with semaphore:
+            bind_request(request_id=f"{batch_id}-{index}")
+            try:
+                outcomes[index] = BatchItemResult(index=index, response=await traced_answer(request.items[index]))
+            except Overloaded as e:
+                outcomes[index] = BatchItemResult(index=index, error=str(e))
+            except Exception as e:
+                logger.exception("Batch item %d failed: %s", index, e)
+                outcomes[index] = BatchItemResult(index=index, error=f"{type(e).__name__}: {e}")
+
+    async def run_session(indices: List[int]):
+        for index in indices:
+            await run_item(index)
+
+    with shared_work():
+        await asyncio.gather(*(run_session(indices) for indices in sessions.values()))
+
+    results = []
+    for index in range(len(request.items)):
+        if index in duplicates:
+            original = outcomes[duplicates[index]]
+            results.append(original.model_copy(update={"index": index, "duplicate_of": original.index}))
+        else:
+            results.append(outcomes[index])
+    logger.info("Batch answered", extra={"items": len(results), "unique": len(first_index), "concurrency": limit,
+                                         "errors": sum(1 for r in results if r.error)})
+    return BatchQueryResponse(results=results, unique=len(first_index))
+
+async def answer_query(request: QueryRequest) -> QueryResponse:
+    """Run the query pipeline for one turn."""
+    with span("sanitize"):
+        query = sanitize_query(request.query)
     session_id = request.session_id or str(uuid.uuid4())
+    bind_request(session_id=session_id)
+    # One time budget for the whole turn, shared by every stage below
+    deadline = Deadline.for_turn()
     
     # Get conversation history and session
     conversation_history = conv_state.get_conversation_history(session_id)
@@ -114,25 +268,39 @@ async def process_query(request: QueryRequest):
     if session:
         current_stage = session.get('current_stage', 'initial')
         
-    # Log information for debugging
-    print(f"Processing query: '{query}' with session ID: {session_id}")
-    print(f"Current conversation stage: {current_stage}")
+    logger.info("Processing query", extra={"stage": current_stage, "query_chars": len(query)})
+    logger.debug("Query text: %s", query)
     
     # Check if it's a legal query, passing conversation history for context
-    if not is_legal_query_gemini(query, conversation_history):
+    # Blocking pipeline stages run in worker threads so queued Gemini calls don't stall the event loop
+    with span("classify"):
+        if at_least("local_only"):
+            is_legal = is_legal_query_local(query, conversation_history)
+        else:
+            is_legal = await asyncio.to_thread(is_legal_query_gemini, query, conversation_history, deadline)
+    if not is_legal:
+        set_intent("non_legal")
+        prefetcher.cancel(session_id)
         # Get a contextual redirect response based on the conversation stage
         answer = get_contextual_redirect(current_stage)
-        print(f"Query classified as non-legal, responding with: {answer[:30]}...")
+        logger.info("Query classified as non-legal")
         
         # Update conversation state
-        conv_state.update(session_id, query, answer, [], [], "initial")
-        return QueryResponse(answer=answer, references=[], cases=[], session_id=session_id, conversation_stage="initial")
+        with span("state_update"):
+            conv_state.update(session_id, query, answer, [], [], "initial")
+        return QueryResponse(answer=answer, references=[], cases=[], session_id=session_id, conversation_stage="initial",
+                             service_tier=get_tier())
     
     # Determine the intent of the query
-    intent = detect_query_intent(query, conversation_history)
-    print(f"Query intent detected as: {intent}")
+    with span("intent"):
+        intent = detect_query_intent(query, conversation_history)
+    set_intent(intent)
+    logger.info("Query intent detected as: %s", intent)
+    if intent not in PREFETCH_CONSUMERS:
+        prefetcher.cancel(session_id)
     references = []
     cases = []
+    enrichment_id = None
     
     # Handle based on intent/stage
     if intent == "followup":
@@ -148,27 +316,28 @@ async def process_query(request: QueryRequest):
         # Re-check for specific intents in the followup
         if "case" in query_lower or "like this" in query_lower:
             followup_type = "cases"
-            print(f"Followup query contains case-related keywords, setting stage to: {followup_type}")
+            logger.debug("Followup query contains case-related keywords, setting stage to: %s", followup_type)
         elif "impact" in query_lower or "effect" in query_lower or "consequence" in query_lower:
             followup_type = "impact"
-            print(f"Followup query contains impact-related keywords, setting stage to: {followup_type}")
+            logger.debug("Followup query contains impact-related keywords, setting stage to: %s", followup_type)
         elif "section" in query_lower or "law" in query_lower or "act" in query_lower:
             followup_type = "sections"
-            print(f"Followup query contains section-related keywords, setting stage to: {followup_type}")
+            logger.debug("Followup query contains section-related keywords, setting stage to: %s", followup_type)
         
         # Build context from previous information
-        context_info = ""
+        context_lines = []
         if previous_references:
-            context_info += "Relevant legal provisions from previous conversation:\n"
+            context_lines.append("Relevant legal provisions from previous conversation:")
             for ref in previous_references[:2]:
-                context_info += f"- {ref['act']} Section {ref['section_number']}: {ref['summary'][:100]}...\n"
+                context_lines.append(f"- {ref['act']} Section {ref['section_number']}: {ref['summary'][:100]}...")
         
         if previous_cases and followup_type == "cases":
-            context_info += "\nRelevant cases from previous conversation:\n"
+            context_lines.append("\nRelevant cases from previous conversation:")
             for case in previous_cases[:2]:
                 title = case.get('title', 'Untitled Case')
                 url = case.get('url', '')
-                context_info += f"- {title} ({url})\n"
+                context_lines.append(f"- {title} ({url})")
+        context_info = "\n".join(context_lines)
                 
         # Generate a follow-up response
         prompt = f"""Based on the ongoing conversation and the user's follow-up response: '{query}', 
@@ -177,23 +346,32 @@ Don't ask further questions unless absolutely necessary.
 Focus on giving clear, concise legal advice (under 256 tokens) based on their situation.
 Use the previous legal context and their newest information to give practical guidance."""
         
-        answer = generate_direct_answer(prompt, context_info, conversation_history, is_followup=True, max_tokens=256)
+        followup_cases = previous_cases[:2] if previous_cases and followup_type == "cases" else None
+        with span("answer_generation"):
+            answer = await asyncio.to_thread(generate_direct_answer, prompt, context_info, conversation_history, is_followup=True, cases=followup_cases, deadline=deadline,
+                                           cite_cases=followup_cases is not None)
         conversation_stage = followup_type  # Set the stage based on the detected followup type
         
     elif intent == "initial":
         # Ask for more details
         prompt = f"Based on the user's query: '{query}', create a very brief response that asks for 1-2 specific details about their legal situation to help you provide better assistance. Keep it under 256 tokens."
-        answer = generate_direct_answer(prompt, "", conversation_history, is_followup=False, max_tokens=256)
+        with span("answer_generation"):
+            answer = await asyncio.to_thread(generate_direct_answer, prompt, "", conversation_history, is_followup=False, deadline=deadline)
         conversation_stage = "initial"
         
     elif intent == "sections" or intent == "details":
         # Provide legal sections and basic information
-        references = find_relevant_sections(query, conversation_history)
+        with span("section_retrieval"):
+            if at_least("cached_only"):
+                # Shedding load: reuse the provisions already found in this conversation
+                references = (session.get('references') if session else None) or []
+            else:
+                references = await asyncio.to_thread(find_relevant_sections, query, conversation_history, deadline.reserve(ANSWER_RESERVE_SECONDS))
         context_info = ""
         if references:
-            context_info += "Relevant legal provisions:\n"
-            for ref in references:
-                context_info += f"- {ref['act']} Section {ref['section_number']}: {ref['summary']}\n"
+            context_info = "Relevant legal provisions:\n" + "\n".join(
+                f"- {ref['act']} Section {ref['section_number']}: {ref['summary']}" for ref in references
+            )
                 
         if intent == "sections":
             # Directly focus on explaining the sections
@@ -202,49 +380,73 @@ Use the previous legal context and their newest information to give practical gu
             # General legal information with sections as context
             prompt = f"Based on the user's query: '{query}', provide concise legal information using these legal provisions as context. Explain how they're relevant to the situation described:\n\n{context_info}\n\nMention that they can ask about specific cases or impacts."
             
-        answer = generate_direct_answer(prompt, context_info, conversation_history, is_followup=True, max_tokens=256)
+        with span("answer_generation"):
+            answer = await asyncio.to_thread(generate_direct_answer, prompt, context_info, conversation_history, is_followup=True, deadline=deadline)
         conversation_stage = "details"
         
     elif intent == "cases":
         # Check if specific case names are mentioned
         case_names = extract_case_names(query)
         
-        if case_names:
-            print(f"Detected specific case names: {case_names}")
+        if case_names and not at_least("no_scrape"):
+            logger.debug("Detected specific case names: %s", case_names)
             
             # Use our specialized case helper for direct case lookup
             try:
-                case_response = await handle_case_lookup(query, conversation_history)
+                with span("case_lookup"):
+                    case_response = await handle_case_lookup(query, conversation_history, deadline.reserve(ANSWER_RESERVE_SECONDS))
                 if case_response and len(case_response) > 20:
                     # If we got a good response with case links, use it directly
                     answer = case_response
                     # Still fetch cases for the session state
-                    cases = fetch_kanoon_results(query, conversation_history)
+                    cases = await asyncio.to_thread(fetch_kanoon_results, query, conversation_history, deadline)
                     conversation_stage = "cases"
                     return QueryResponse(
                         answer=answer,
                         references=[],
                         cases=cases,
                         session_id=session_id,
-                        conversation_stage=conversation_stage
+                        conversation_stage=conversation_stage,
+                        service_tier=get_tier()
                     )
             except Exception as e:
-                print(f"Error using case helper: {e}")
+                logger.warning("Error using case helper: %s", e)
                 # Fall through to standard case handling
         
-        # Standard case handling
-        cases = fetch_kanoon_results(query, conversation_history)
+        # Standard case handling; "show me similar cases" reuses the cases prefetched for the last topic,
+        # and so may a degraded turn as long as it is on the same topic
+        cases = None
+        if is_generic_case_request(query) or at_least("no_scrape"):
+            cases = await prefetcher.take(session_id, wait=0 if at_least("no_scrape") else deadline.remaining() - ANSWER_RESERVE_SECONDS,
+                                          query=query)
+        if not cases and at_least("cached_only"):
+            previous_query = ((session.get('current_context') or {}).get('query', '')) if session else ''
+            cases = (session.get('cases') if session and same_topic(previous_query, query) else None) or []
+        elif not cases and request.defer_enrichment:
+            # Wait briefly; if Kanoon is slow, answer now and deliver the cases later
+            lookup = asyncio.ensure_future(run_detached(fetch_kanoon_results, query, conversation_history,
+                                                        Deadline(ENRICHMENT_BUDGET), cached_only=at_least("no_scrape")))
+            try:
+                cases = await asyncio.wait_for(asyncio.shield(lookup), timeout=ENRICHMENT_WAIT)
+                enrichment_events.inc(event="inline")
+            except asyncio.TimeoutError:
+                enrichment_id = enrichments.start(session_id, lookup).id
+                cases = []
+        elif not cases:
+            cases = await asyncio.to_thread(fetch_kanoon_results, query, conversation_history, deadline.reserve(ANSWER_RESERVE_SECONDS),
+                                            cached_only=at_least("no_scrape"))
         references = session.get('references', []) if session else []
         
         # Build case information including URLs
-        case_info = "Relevant cases:\n"
+        case_lines = ["Relevant cases:"]
         for case in cases[:2]:  # Limit to 2 cases for token efficiency
             title = case.get('title', 'Untitled Case')
             url = case.get('url', '')
             snippet = case.get('snippet', 'No summary available')
             
             # Include URL in the context for the AI
-            case_info += f"- {title}: {snippet[:100]}...\n  URL: {url}\n"
+            case_lines.append(f"- {title}: {snippet[:100]}...\n  URL: {url}")
+        case_info = "\n".join(case_lines)
             
         # Make sure to include the URLs in the prompt so the AI includes them
         prompt = f"""Based on the user's query about legal cases: '{query}', 
@@ -260,31 +462,42 @@ Format your response to include each case with its URL using this EXACT format:
 Example: "[Lalita Kumari v. Govt of UP](https://indiankanoon.org/doc/123456789/) - Established mandatory FIR registration."
 
 DO NOT describe the format; just use it."""
+        if enrichment_id:
+            prompt = f"""Based on the user's query about legal cases: '{query}', 
+briefly explain the legal position that courts apply in situations like theirs, in under 200 tokens.
+Do not name or invent specific cases; tell the user that relevant judgments are being looked up and will follow shortly."""
+            case_info = ""
             
-        answer = generate_direct_answer(prompt, case_info, conversation_history, is_followup=True, max_tokens=256)
+        with span("answer_generation"):
+            answer = await asyncio.to_thread(generate_direct_answer, prompt, case_info, conversation_history, is_followup=True, cases=cases[:2], deadline=deadline, cite_cases=True)
         conversation_stage = "cases"
         
     elif intent == "impact":
         # Explain practical impact
         references = session.get('references', []) if session else []
         cases = session.get('cases', []) if session else []
+        if not cases:
+            # Only wait briefly: the impact answer is still useful without a case
+            wait = 0 if at_least("no_scrape") else min(2.0, deadline.remaining() - ANSWER_RESERVE_SECONDS)
+            cases = await prefetcher.take(session_id, wait=wait) or []
         
         # Compile context from both sections and cases - more focused for impact
-        context_info = ""
+        context_lines = []
         if references:
-            context_info += "Key legal provisions:\n"
+            context_lines.append("Key legal provisions:")
             for ref in references[:1]:  # More focused - just use the most relevant one
-                context_info += f"- {ref['act']} Section {ref['section_number']}: {ref['summary'][:50]}...\n"
+                context_lines.append(f"- {ref['act']} Section {ref['section_number']}: {ref['summary'][:50]}...")
         
         if cases:
-            context_info += "\nKey case precedent:\n"
+            context_lines.append("\nKey case precedent:")
             for case in cases[:1]:  # Just one case
                 title = case.get('title', 'Untitled Case')
                 url = case.get('url', '')
                 # Shorter case title for token efficiency
                 short_title = title.split(' vs')[0] if ' vs' in title else title
                 # Include URL in markdown format, but with shorter case name
-                context_info += f"- [{short_title}]({url})\n"
+                context_lines.append(f"- [{short_title}]({url})")
+        context_info = "\n".join(context_lines)
                 
         # More focused prompt specifically for impact
         prompt = f"""The user is asking about legal impact: '{query}'
@@ -301,20 +514,52 @@ Context:
 {context_info}"""
         
         # Use a lower token count for more focused response
-        answer = generate_direct_answer(prompt, context_info, conversation_history, is_followup=True, max_tokens=200)
+        with span("answer_generation"):
+            answer = await asyncio.to_thread(generate_direct_answer, prompt, context_info, conversation_history, is_followup=True, deadline=deadline, route="impact_answer")
         conversation_stage = "impact"
     
     # Update conversation state with the current stage
-    conv_state.update(session_id, query, answer, references, cases, conversation_stage)
+    with span("state_update"):
+        conv_state.update(session_id, query, answer, references, cases, conversation_stage)
+    if enrichment_id:
+        enrichments.on_ready(enrichment_id, lambda found: conv_state.merge_cases(session_id, query, found))
+    # Speculative work is the first thing dropped under load
+    if get_tier() == "full":
+        prefetcher.schedule(session_id, conversation_stage if intent in ("sections", "details") else "", query, conversation_history)
     
     return QueryResponse(
         answer=answer,
         references=references if intent in ["sections", "details"] else [],
         cases=cases if intent == "cases" else [],
         session_id=session_id,
-        conversation_stage=conversation_stage
+        conversation_stage=conversation_stage,
+        service_tier=get_tier(),
+        enrichment_id=enrichment_id
     )
 
+@router.get("/enrichment/{enrichment_id}")
+async def get_enrichment(enrichment_id: str, wait: float = Query(0, ge=0, le=25)):
+    """Cases for a turn answered with an enrichment_id; waits up to `wait` seconds while they are pending."""
+    enrichment = await enrichments.wait(enrichment_id, wait)
+    if enrichment is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired enrichment id")
+    return enrichment.to_dict()
+
+@router.get("/admin/usage")
+async def get_usage(session_id: Optional[str] = None, top: int = Query(20, ge=1, le=500),
+                    x_admin_token: Optional[str] = Header(None)):
+    """Gemini token usage and cost per route, intent and session.
+
+    Needs the X-Admin-Token header to match NYAYADOOT_ADMIN_TOKEN; without
+    that variable the endpoint is disabled.
+    """
+    admin_token = os.getenv("NYAYADOOT_ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    return ledger.report(session_id=session_id, top=top)
+
 @router.get("/history/{session_id}")
 async def get_history(session_id: str):
     """Get conversation history for a given session."""
@@ -327,10 +572,10 @@ async def get_history(session_id: str):
 @router.get("/keywords")
 async def get_keywords(query: str, session_id: Optional[str] = None):
     """Extract keywords from a query with optional conversation context."""
-    conversation_history = ""
     if session_id:
-        conversation_history = conv_state.get_conversation_history(session_id)
-    keywords = extract_keywords_from_conversation(conversation_history, query)
+        keywords = format_keywords(conv_state.get_keywords(session_id, query))
+    else:
+        keywords = extract_keywords_from_conversation("", query)
     return {"keywords": keywords}
 
 @router.get("/sections")
@@ -339,7 +584,7 @@ async def get_sections(query: str, session_id: Optional[str] = None):
     conversation_history = ""
     if session_id:
         conversation_history = conv_state.get_conversation_history(session_id)
-    sections = find_relevant_sections(query, conversation_history)
+    sections = await asyncio.to_thread(find_relevant_sections, query, conversation_history)
     return {"sections": sections}
 
 @router.get("/cases")
@@ -348,5 +593,5 @@ async def get_cases(query: str, session_id: Optional[str] = None):
     conversation_history = ""
     if session_id:
         conversation_history = conv_state.get_conversation_history(session_id)
-    cases = fetch_kanoon_results(query, conversation_history)
+    cases = await asyncio.to_thread(fetch_kanoon_results, query, conversation_history)
     return {"cases": cases}
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""
+Persistent WebSocket channel for a conversation.
+
+A client connects to /nyayadoot/ws (optionally with ?session_id=...) and is
+bound to one session for the life of the connection. Messages are JSON:
+
+    client -> server   {"type": "query", "query": "...", "id": "c1", "defer_enrichment": true}
+                       {"type": "ping"} / {"type": "pong"}
+    server -> client   {"type": "session", "session_id": "..."}
+                       {"type": "token", "id": "c1", "text": "..."}      answer, in chunks
+                       {"type": "answer", "id": "c1", ...QueryResponse fields}
+                       {"type": "enrichment", "id": "c1", "enrichment_id": "...", "cases": [...]}
+                       {"type": "prefetch", "cases": [...]}              cases for the likely next turn
+                       {"type": "error", "id": "c1", "detail": "...", "retry_after": 5}
+                       {"type": "ping"}
+
+Queries on a connection are answered one at a time, in order; up to
+WS_MAX_PENDING more may wait, beyond that a query is refused with an error.
+Outgoing messages pass through a bounded queue: answers, tokens and
+enrichments wait for room (so a slow reader slows its own connection down),
+while prefetch pushes and pings are dropped when the queue is full. The server
+pings every WS_HEARTBEAT seconds and closes connections that have sent nothing
+for three intervals.
+
+Answers are generated whole (link repair and citation checks need the full
+text) and then streamed as token-sized chunks.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from typing import Dict, Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from api.router import QueryRequest, traced_answer, enrichments, prefetcher
+from conversation.enrichment import ENRICHMENT_BUDGET
+from conversation.prefetch import PREFETCH_BUDGET
+from utils import metrics
+from utils.log import get_logger, bind_request
+from utils.admission import Overloaded
+
+logger = get_logger("api.websocket")
+
+router = APIRouter(prefix="/nyayadoot")
+
+WS_HEARTBEAT = float(os.getenv("NYAYADOOT_WS_HEARTBEAT", "20"))
+WS_SEND_QUEUE = int(os.getenv("NYAYADOOT_WS_SEND_QUEUE", "64"))
+WS_MAX_PENDING = int(os.getenv("NYAYADOOT_WS_MAX_PENDING", "4"))
+# Words per streamed chunk
+WS_CHUNK_WORDS = int(os.getenv("NYAYADOOT_WS_CHUNK_WORDS", "4"))
+
+ws_connections = metrics.gauge("ws_connections", "Open WebSocket conversation channels")
+ws_messages = metrics.counter("ws_messages_total", "WebSocket messages by direction and type", ("direction", "type"))
+ws_dropped = metrics.counter("ws_dropped_total", "Optional WebSocket pushes dropped because the send queue was full", ("type",))
+
+_CHUNK_RE = re.compile(r"\S+\s*")
+
+
+def chunk_answer(answer: str, words: int = WS_CHUNK_WORDS):
+    """Split an answer into chunks of a few words, keeping its whitespace."""
+    tokens = _CHUNK_RE.findall(answer)
+    for i in range(0, len(tokens), words):
+        yield "".join(tokens[i:i + words])
+
+
+class Channel:
+    """State of one connection: its session, outgoing queue and background pushes."""
+    def __init__(self, websocket: WebSocket, session_id: str):
+        self.websocket = websocket
+        self.session_id = session_id
+        self.outgoing: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE)
+        self.incoming: asyncio.Queue = asyncio.Queue(maxsize=WS_MAX_PENDING)
+        self.last_seen = time.monotonic()
+        self.tasks = set()
+
+    async def send(self, message: Dict):
+        """Queue a message, waiting for room."""
+        await self.outgoing.put(message)
+
+    def offer(self, message: Dict) -> bool:
+        """Queue an optional message unless the queue is full."""
+        try:
+            self.outgoing.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            ws_dropped.inc(type=message["type"])
+            return False
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def writer(self):
+        while True:
+            message = await self.outgoing.get()
+            await self.websocket.send_json(message)
+            ws_messages.inc(direction="out", type=message["type"])
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT)
+            if time.monotonic() - self.last_seen > 3 * WS_HEARTBEAT:
+                logger.info("Closing idle WebSocket")
+                await self.websocket.close(code=1001)
+                return
+            self.offer({"type": "ping"})
+
+    async def worker(self):
+        """Answer queued queries one at a time."""
+        while True:
+            message = await self.incoming.get()
+            await self.answer(message)
+
+    async def answer(self, message: Dict):
+        message_id = message.get("id")
+        bind_request(request_id=uuid.uuid4().hex[:12], session_id=self.session_id)
+        request = QueryRequest(query=str(message.get("query", "")), session_id=self.session_id,
+                               defer_enrichment=bool(message.get("defer_enrichment", True)))
+        try:
+            response = await traced_answer(request)
+        except Overloaded as e:
+            await self.send({"type": "error", "id": message_id, "detail": str(e), "retry_after": e.retry_after})
+            return
+        except Exception as e:
+            logger.exception("WebSocket query failed: %s", e)
+            await self.send({"type": "error", "id": message_id, "detail": "Could not answer this query"})
+            return
+
+        for text in chunk_answer(response.answer):
+            await self.send({"type": "token", "id": message_id, "text": text})
+        await self.send(dict(response.model_dump(), type="answer", id=message_id))
+
+        if response.enrichment_id:
+            self.spawn(self.push_enrichment(message_id, response.enrichment_id))
+        if response.conversation_stage == "details":
+            self.spawn(self.push_prefetch())
+
+    async def push_enrichment(self, message_id: Optional[str], enrichment_id: str):
+        enrichment = await enrichments.wait(enrichment_id, ENRICHMENT_BUDGET)
+        if enrichment is not None and enrichment.status != "pending":
+            await self.send(dict(enrichment.to_dict(), type="enrichment", id=message_id))
+
+    async def push_prefetch(self):
+        cases = await prefetcher.peek(self.session_id, PREFETCH_BUDGET)
+        if cases:
+            self.offer({"type": "prefetch", "cases": cases})
+
+
+@router.websocket("/ws")
+async def conversation_channel(websocket: WebSocket, session_id: Optional[str] = None):
+    """Bind a WebSocket to one conversation session and answer its queries."""
+    await websocket.accept()
+    channel = Channel(websocket, session_id or str(uuid.uuid4()))
+    bind_request(session_id=channel.session_id)
+    ws_connections.inc()
+    for coro in (channel.writer(), channel.heartbeat(), channel.worker()):
+        channel.spawn(coro)
+    await channel.send({"type": "session", "session_id": channel.session_id})
+    try:
+        while True:
+            text = await websocket.receive_text()
+            channel.last_seen = time.monotonic()
+            try:
+                message = json.loads(text)
+            except ValueError:
+                message = None
+            kind = message.get("type") if isinstance(message, dict) else None
+            ws_messages.inc(direction="in", type=kind or "invalid")
+            if kind == "query":
+                try:
+                    channel.incoming.put_nowait(message)
+                except asyncio.QueueFull:
+                    await channel.send({"type": "error", "id": message.get("id"),
+                                        "detail": "Too many queries waiting on this connection"})
+            elif kind == "ping":
+                channel.offer({"type": "pong"})
+            elif kind != "pong":
+                await channel.send({"type": "error", "id": None, "detail": "Expected a JSON message with a known type"})
+    except WebSocketDisconnect:
+        pass
+    except RuntimeError as e:
+        # Receiving after the heartbeat closed the connection
+        logger.info("WebSocket closed: %s", e)
+    finally:
+        ws_connections.dec()
+        for task in list(channel.tasks):
+            task.cancel()
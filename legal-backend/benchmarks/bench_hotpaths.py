@@ -0,0 +1,239 @@
+"""
+Microbenchmarks for the CPU-bound hot paths of a /query turn.
+
+Run from the legal-backend directory:
+    python -m benchmarks.bench_hotpaths                          # print a table
+    python -m benchmarks.bench_hotpaths --json results.json      # machine-readable results
+    python -m benchmarks.bench_hotpaths --save benchmarks/baseline.json     # store a baseline
+    python -m benchmarks.bench_hotpaths --compare benchmarks/baseline.json --threshold 0.25
+
+With --compare the exit status is 1 when any benchmark's best time per call is
+more than `threshold` (a fraction) slower than in the baseline. The allowance
+grows by the run-to-run spread of either measurement (how far the median run
+was from the best), and a benchmark must also be more than --noise seconds
+per call slower, so jitter on a busy machine doesn't count as a regression.
+Times are compared after scaling the baseline by a calibration workload timed
+in both runs, which takes out drift in the machine's overall speed. Baselines are machine-specific:
+benchmarks/baseline.json is a reference run kept in the repository; record a
+fresh one with --save on the machine that runs the comparison.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.fixtures import (HISTORY, CONTEXT, JUDGMENT, QUERY, QUERIES, RAW_QUERY,
+                                 load_kanoon_page, conversation_turns)
+
+
+def _bench_detect_intent() -> Callable[[], object]:
+    from api.router import detect_query_intent
+    return lambda: [detect_query_intent(q, HISTORY) for q in QUERIES]
+
+
+def _bench_extract_case_names() -> Callable[[], object]:
+    from utils.case_helper import extract_case_names
+    text = CONTEXT + "\n" + JUDGMENT
+    return lambda: extract_case_names(text)
+
+
+def _bench_extract_keywords() -> Callable[[], object]:
+    from keywords.extractor import extract_keywords_from_conversation
+    return lambda: extract_keywords_from_conversation(HISTORY, QUERIES[0])
+
+
+def _bench_session_keywords() -> Callable[[], object]:
+    from conversation.state import ConversationState
+    state = ConversationState()
+    for query, answer in conversation_turns(20):
+        state.update("bench", query, answer, [], [], "details")
+    return lambda: state.get_keywords("bench", QUERIES[0])
+
+
+def _bench_sanitize() -> Callable[[], object]:
+    from utils.sanitize import sanitize_query
+    return lambda: sanitize_query(RAW_QUERY)
+
+
+def _bench_conversation_history() -> Callable[[], object]:
+    """Rendering the history after a new turn (the per-session cache is dropped before each call)."""
+    from conversation.state import ConversationState
+    state = ConversationState()
+    for query, answer in conversation_turns(20):
+        state.update("bench", query, answer, [], [], "details")
+    session = state.get_session("bench")
+
+    def render():
+        session.pop("rendered_history", None)
+        return state.get_conversation_history("bench")
+    return render
+
+
+def _bench_conversation_history_cached() -> Callable[[], object]:
+    """Asking again for the history of an unchanged session."""
+    from conversation.state import ConversationState
+    state = ConversationState()
+    for query, answer in conversation_turns(20):
+        state.update("bench", query, answer, [], [], "details")
+    return lambda: state.get_conversation_history("bench")
+
+
+def _bench_parse_kanoon() -> Callable[[], object]:
+    from scraping.kanoon import parse_search_results
+    page = load_kanoon_page()
+    return lambda: parse_search_results(page)
+
+
+def _bench_answer_prompt() -> Callable[[], object]:
+    from ai.prompt import build_answer_prompt
+    return lambda: build_answer_prompt(QUERY, CONTEXT, HISTORY, 256)
+
+
+def _bench_answer_prompt_judgment() -> Callable[[], object]:
+    from ai.prompt import build_answer_prompt
+    return lambda: build_answer_prompt(QUERY, JUDGMENT, HISTORY, 256)
+
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], object]]] = {
+    "detect_query_intent": _bench_detect_intent,
+    "extract_case_names": _bench_extract_case_names,
+    "extract_keywords": _bench_extract_keywords,
+    "session_keywords": _bench_session_keywords,
+    "sanitize_query": _bench_sanitize,
+    "conversation_history": _bench_conversation_history,
+    "conversation_history_cached": _bench_conversation_history_cached,
+    "parse_kanoon_page": _bench_parse_kanoon,
+    "answer_prompt": _bench_answer_prompt,
+    "answer_prompt_judgment": _bench_answer_prompt_judgment,
+}
+
+
+def measure(fn: Callable[[], object], repeat: int = 5, min_time: float = 0.2) -> Dict[str, float]:
+    """Time fn: enough loops per run to last min_time, `repeat` runs; seconds per call."""
+    timer = timeit.Timer(fn)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 1_000_000:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    runs = [t / number for t in timer.repeat(repeat, number)]
+    return {"best": min(runs), "median": statistics.median(runs), "loops": number, "repeat": repeat}
+
+
+def _calibration_workload() -> int:
+    """Fixed pure-Python work whose time tracks how fast the machine is right now."""
+    total = 0
+    for i in range(2000):
+        total += len(str(i * 7919)) + (i % 13)
+    return total
+
+
+def run(names: Optional[List[str]] = None, repeat: int = 5, min_time: float = 0.2) -> Dict:
+    results = {}
+    calibration = [measure(_calibration_workload, repeat, min_time)["best"]]
+    for name, setup in BENCHMARKS.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = measure(setup(), repeat, min_time)
+    calibration.append(measure(_calibration_workload, repeat, min_time)["best"])
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            # Before and after the benchmarks
+            "calibration": calibration,
+        },
+        "results": results,
+    }
+
+
+def _spread(result: Dict) -> float:
+    """How far the median run was from the best one, as a fraction: the run-to-run noise."""
+    return result["median"] / result["best"] - 1
+
+
+def compare(current: Dict, baseline: Dict, threshold: float, noise: float = 0.0) -> List[Dict]:
+    """Per-benchmark ratio of current to baseline best time, corrected for machine speed.
+
+    Both runs time a fixed calibration workload; the baseline is scaled by the
+    ratio of the two, so a machine that is busier overall doesn't look like a
+    regression everywhere. `regressed` when the ratio is past the threshold plus the larger spread of
+    the two measurements, and the call got more than `noise` seconds slower.
+    """
+    # Scale the baseline by how much faster or slower the machine is running now
+    speed = 1.0
+    current_cal, base_cal = current["meta"].get("calibration"), baseline.get("meta", {}).get("calibration")
+    if current_cal and base_cal:
+        speed = statistics.mean(current_cal) / statistics.mean(base_cal)
+    rows = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            rows.append({"name": name, "ratio": None, "regressed": False})
+            continue
+        expected = base["best"] * speed
+        ratio = result["best"] / expected
+        limit = 1 + threshold + max(_spread(result), _spread(base))
+        slower_by = result["best"] - expected
+        rows.append({"name": name, "ratio": ratio, "regressed": ratio > limit and slower_by > noise})
+    return rows
+
+
+def _fmt_time(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} us"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark CPU-bound hot paths")
+    parser.add_argument("names", nargs="*", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per timing run")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--save", help="write results as a baseline to this file")
+    parser.add_argument("--compare", help="baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction (0.25 = 25%%)")
+    parser.add_argument("--noise", type=float, default=5e-6,
+                        help="slowdowns below this many seconds per call are ignored as noise")
+    args = parser.parse_args(argv)
+
+    current = run(args.names, args.repeat, args.min_time)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        current["comparison"] = {"baseline": args.compare, "threshold": args.threshold, "noise": args.noise,
+                                 "rows": compare(current, baseline, args.threshold, args.noise)}
+
+    ratios = {row["name"]: row for row in current.get("comparison", {}).get("rows", [])}
+    print(f"{'benchmark':<30}{'best':>12}{'median':>12}{'loops':>9}" + (f"{'vs base':>10}" if baseline else ""))
+    for name, r in current["results"].items():
+        line = f"{name:<30}{_fmt_time(r['best']):>12}{_fmt_time(r['median']):>12}{r['loops']:>9}"
+        if baseline:
+            row = ratios[name]
+            mark = "n/a" if row["ratio"] is None else f"{row['ratio']:.2f}x" + (" !" if row["regressed"] else "")
+            line += f"{mark:>10}"
+        print(line)
+
+    for path in (args.json, args.save):
+        if path:
+            with open(path, "w") as f:
+                json.dump(current, f, indent=2)
+
+    regressed = [row["name"] for row in ratios.values() if row["regressed"]]
+    if regressed:
+        print(f"\nRegressed by more than {args.threshold:.0%} plus noise: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Import-time profile of the backend's modules, from `python -X importtime`.
+
+Each module is imported in a fresh interpreter several times; the best
+cumulative time is reported along with the slowest imports it pulled in.
+
+Run from the legal-backend directory:
+    python -m benchmarks.bench_import
+    python -m benchmarks.bench_import --save import_baseline.json
+    python -m benchmarks.bench_import --compare import_baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.bench_hotpaths import compare, _fmt_time
+
+MODULES = ["main", "api.router", "ai.gemini", "scraping.kanoon", "utils.case_helper", "retrieval.section"]
+
+# "import time:  self [us] | cumulative | imported package"
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_import(module: str) -> List[Tuple[str, int, int, int]]:
+    """(package, depth, self us, cumulative us) for every import made by `import module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-W", "ignore", "-c", f"import {module}"],
+        cwd=BACKEND_DIR, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if m:
+            rows.append((m.group(4), len(m.group(3)) // 2, int(m.group(1)), int(m.group(2))))
+    return rows
+
+
+def _module_tree(rows: List[Tuple[str, int, int, int]], module: str) -> Tuple[int, List[Tuple[str, int, int, int]]]:
+    """Cumulative time of `module` and the imports nested under it.
+
+    Children are printed before their parent, so the subtree is everything
+    between the previous top-level import and the module's own line. This
+    leaves out interpreter startup imports such as site.
+    """
+    subtree = []
+    for row in rows:
+        if row[1] == 0:
+            if row[0] == module:
+                return row[3], subtree
+            subtree = []
+        else:
+            subtree.append(row)
+    return 0, []
+
+
+def measure(module: str, repeat: int = 5, top: int = 8) -> Dict:
+    runs, heaviest = [], []
+    for _ in range(repeat):
+        total, deps = _module_tree(profile_import(module), module)
+        runs.append(total / 1e6)
+        if total / 1e6 == min(runs):
+            # Direct and indirect dependencies by cumulative time, from the fastest run
+            heaviest = sorted(deps, key=lambda r: -r[3])[:top]
+    return {
+        "best": min(runs),
+        "median": statistics.median(runs),
+        "loops": 1,
+        "repeat": repeat,
+        "heaviest": [{"module": name, "cumulative": cum / 1e6, "self": own / 1e6} for name, _, own, cum in heaviest],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile import time of backend modules")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="heaviest dependencies to list per module")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--save", help="write results as a baseline to this file")
+    parser.add_argument("--compare", help="baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction")
+    args = parser.parse_args(argv)
+
+    current = {"results": {m: measure(m, args.repeat, args.top) for m in args.modules}}
+    rows = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = {row["name"]: row for row in compare(current, baseline, args.threshold)}
+        current["comparison"] = {"baseline": args.compare, "threshold": args.threshold, "rows": list(rows.values())}
+
+    for module, r in current["results"].items():
+        line = f"{module:<22}{_fmt_time(r['best']):>12}  (median {_fmt_time(r['median'])})"
+        if module in rows and rows[module]["ratio"] is not None:
+            line += f"  {rows[module]['ratio']:.2f}x" + (" !" if rows[module]["regressed"] else "")
+        print(line)
+        for dep in r["heaviest"]:
+            print(f"    {dep['module']:<44}{_fmt_time(dep['cumulative']):>12}")
+
+    for path in (args.json, args.save):
+        if path:
+            with open(path, "w") as f:
+                json.dump(current, f, indent=2)
+
+    regressed = [name for name, row in rows.items() if row["regressed"]]
+    if regressed:
+        print(f"\nImport time regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
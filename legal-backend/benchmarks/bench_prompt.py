@@ -0,0 +1,83 @@
+"""
+Benchmark prompt assembly: legacy character trimming vs the token-aware builder.
+
+Run from the legal-backend directory:
+    python -m benchmarks.bench_prompt
+"""
+import re
+import time
+from typing import Callable, Dict
+
+from ai.prompt import build_answer_prompt, count_tokens
+from benchmarks.fixtures import HISTORY, CONTEXT, JUDGMENT, QUERY
+
+
+def legacy_answer_prompt(query: str, context: str = "", conversation_history: str = "", max_tokens: int = 256) -> str:
+    """Prompt assembly as generate_direct_answer did it before the prompt builder."""
+    if conversation_history and len(conversation_history) > 300:
+        parts = conversation_history.split("\n\n")
+        if len(parts) > 2:
+            conversation_history = "\n\n".join(parts[-2:])
+    system_prompt = (
+        "You are an Indian legal assistant powered by a large language model. "
+        "You answer ONLY questions about Indian law. "
+        "Be extremely concise (max 256 tokens). "
+        "Don't provide disclaimers unless absolutely necessary. "
+        "When case URLs are provided in your context, ALWAYS include them in your answer. "
+        "Format case references as: [Case Name](URL). "
+        "Preserve ALL URLs exactly as provided. "
+        "For non-legal questions, politely redirect to legal topics only."
+    )
+    preserved_urls = re.compile(r'\[([^\]]+)\]\(([^)]+)\)').findall(context)
+    if context and len(context) > 400:
+        context = '\n'.join(context.split('\n')[:5])
+    if preserved_urls:
+        context += "\n\nIMPORTANT: Include these case references with exact URLs:\n"
+        for case_name, url in preserved_urls:
+            context += f"- [{case_name}]({url})\n"
+    context_part = f"\nRelevant context:\n{context}" if context else ""
+    history_part = f"\nPrevious conversation:\n{conversation_history}" if conversation_history else ""
+    return f"{system_prompt}{context_part}{history_part}\n\nQuestion: {query}\n\nAnswer (be concise, under {max_tokens} tokens):"
+
+
+def builder_answer_prompt(query: str, context: str = "", conversation_history: str = "", max_tokens: int = 256) -> str:
+    return build_answer_prompt(query, context, conversation_history, max_tokens)[0]
+
+
+def time_call(fn: Callable[[], str], iterations: int) -> float:
+    """Return the mean time per call in microseconds."""
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations: int = 2000) -> Dict[str, Dict[str, float]]:
+    """Benchmark both implementations on short and long inputs."""
+    scenarios = {
+        "short": (QUERY, "", ""),
+        "long": (QUERY, CONTEXT, HISTORY),
+        "judgment": (QUERY, JUDGMENT, HISTORY),
+    }
+    results = {}
+    for name, args in scenarios.items():
+        for label, fn in (("legacy", legacy_answer_prompt), ("builder", builder_answer_prompt)):
+            prompt = fn(*args)
+            results[f"{name}/{label}"] = {
+                "us_per_build": time_call(lambda: fn(*args), iterations),
+                "prompt_tokens": count_tokens(prompt),
+                "input_tokens": count_tokens("\n".join(args)),
+            }
+    return results
+
+
+def main():
+    results = run()
+    print(f"{'scenario':<16}{'us/build':>12}{'input tok':>12}{'prompt tok':>12}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['us_per_build']:>12.1f}{r['input_tokens']:>12}{r['prompt_tokens']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Realistic inputs shared by the benchmarks: long conversation histories,
+case context with links, a pasted judgment and the saved Kanoon results page.
+"""
+import os
+
+SAMPLE_KANOON_PAGE = os.path.join(os.path.dirname(__file__), "..", "..", "kanoon_sample.html")
+
+HISTORY = "\n\n".join(
+    f"User: My two-wheeler was stolen from the market parking on day {i}. The police did not register my FIR.\n"
+    f"Assistant: Under Section 154 CrPC the police must register an FIR for a cognizable offence such as "
+    f"theft under Section 379 IPC. You can approach the Superintendent of Police under Section 154(3)."
+    for i in range(9)
+)
+
+CONTEXT = "Relevant cases:\n" + "\n".join(
+    f"- Lalita Kumari vs Govt. Of U.P. {i}: Registration of FIR is mandatory under Section 154 of the Code "
+    f"if the information discloses commission of a cognizable offence...\n  URL: https://indiankanoon.org/doc/{10000 + i}/"
+    for i in range(6)
+) + "\n- [Lalita Kumari vs Govt. Of U.P.](https://indiankanoon.org/doc/10239019/)"
+
+# A pasted judgment: few lines, each very long
+JUDGMENT = "\n".join(
+    "The appellant was convicted under Section 379 IPC for theft of a motor vehicle. " * 40
+    for _ in range(4)
+)
+
+QUERY = ("Based on the user's query about legal cases: 'what cases are similar to mine?', explain how these cases "
+         "are relevant to their situation. For each case, include the URL as a Markdown link.")
+
+# User turns covering every intent the router distinguishes
+QUERIES = [
+    "My bike was stolen from the market parking yesterday and the police refused to register my FIR, what can I do now",
+    "Which sections of the IPC apply to this?",
+    "Are there any similar cases like this?",
+    "What is the punishment and what happens to the accused?",
+    "yes I did file a written complaint",
+    "What did the court decide in Lalita Kumari vs Govt of UP?",
+    "hello",
+]
+
+# Raw user input with markup and irregular whitespace, as it arrives from the frontend
+RAW_QUERY = "  <b>My landlord</b>   is forcing me\tto vacate &   threatening me\n\nwhat are my rights?  " * 4
+
+
+def load_kanoon_page() -> str:
+    with open(SAMPLE_KANOON_PAGE, encoding="utf-8") as f:
+        return f.read()
+
+
+def conversation_turns(turns: int = 20):
+    """(query, answer) pairs for filling a ConversationState session."""
+    answer = ("Under Section 154 CrPC the police must register an FIR for a cognizable offence such as theft "
+              "under Section 379 IPC. See [Lalita Kumari vs Govt. Of U.P.](https://indiankanoon.org/doc/10239019/). ") * 4
+    return [(QUERIES[i % len(QUERIES)], answer) for i in range(turns)]
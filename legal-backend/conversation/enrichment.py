@@ -0,0 +1,118 @@
+"""
+Deferred case enrichment.
+
+A cases turn that asks for deferral waits only a short time for its Kanoon
+lookup. If the lookup is still running, the answer is generated without cases
+and returned with an enrichment_id, and the lookup carries on in the
+background. Its cases are merged into the session when they arrive and can be
+fetched from /nyayadoot/enrichment/{enrichment_id}, which can also wait for
+them. A lookup that only produced the "Kanoon unavailable" placeholder counts
+as failed and is not merged.
+"""
+import asyncio
+import os
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from scraping.kanoon import has_case_results
+from utils import metrics
+from utils.cache import TTLCache
+from utils.log import get_logger
+from utils.tracing import detach_trace
+
+logger = get_logger("conversation.enrichment")
+
+# How long a deferred turn waits for cases before answering without them
+ENRICHMENT_WAIT = float(os.getenv("NYAYADOOT_ENRICHMENT_WAIT", "2"))
+# Time budget of the background lookup, and how long finished results are kept
+ENRICHMENT_BUDGET = float(os.getenv("NYAYADOOT_ENRICHMENT_BUDGET", "30"))
+ENRICHMENT_TTL = float(os.getenv("NYAYADOOT_ENRICHMENT_TTL", "900"))
+
+enrichment_events = metrics.counter(
+    "enrichment_events_total",
+    "Deferred case lookups by event (deferred, ready, failed, inline)",
+    ("event",),
+)
+
+
+async def run_detached(fn: Callable, *args, **kwargs):
+    """Run a blocking lookup on a worker thread without recording spans on the request's trace."""
+    detach_trace()
+    return await asyncio.to_thread(fn, *args, **kwargs)
+
+
+class Enrichment:
+    __slots__ = ("id", "session_id", "task", "created", "callbacks")
+
+    def __init__(self, session_id: str, task: "asyncio.Future"):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.task = task
+        self.created = time.monotonic()
+        self.callbacks: List[Callable[[List[Dict]], None]] = []
+
+    @property
+    def status(self) -> str:
+        if not self.task.done():
+            return "pending"
+        return "ready" if self.cases is not None else "failed"
+
+    @property
+    def cases(self) -> Optional[List[Dict]]:
+        """The cases found, or None while pending or if the lookup failed or found only placeholders."""
+        if not self.task.done() or self.task.cancelled() or self.task.exception() is not None:
+            return None
+        cases = self.task.result()
+        return cases if has_case_results(cases) else None
+
+    def to_dict(self) -> Dict:
+        return {"enrichment_id": self.id, "session_id": self.session_id, "status": self.status,
+                "cases": self.cases or []}
+
+
+class EnrichmentStore:
+    """Background case lookups by enrichment id; use from the event loop."""
+    def __init__(self, ttl: float = ENRICHMENT_TTL):
+        self._items = TTLCache("enrichments", maxsize=4096, ttl=ttl)
+
+    def start(self, session_id: str, task: "asyncio.Future") -> Enrichment:
+        """Track a lookup that is still running after the turn's answer was sent."""
+        enrichment = Enrichment(session_id, task)
+        self._items.set(enrichment.id, enrichment)
+        task.add_done_callback(lambda _: self._finished(enrichment))
+        enrichment_events.inc(event="deferred")
+        return enrichment
+
+    def _finished(self, enrichment: Enrichment):
+        cases = enrichment.cases
+        enrichment_events.inc(event="ready" if cases is not None else "failed")
+        logger.info("Deferred cases resolved", extra={"enrichment_id": enrichment.id, "status": enrichment.status,
+                                                      "seconds": round(time.monotonic() - enrichment.created, 2)})
+        if cases is not None:
+            for callback in enrichment.callbacks:
+                callback(cases)
+
+    def on_ready(self, enrichment_id: str, callback: Callable[[List[Dict]], None]):
+        """Call `callback(cases)` when the lookup succeeds, or now if it already has."""
+        enrichment = self._items.get(enrichment_id)
+        if enrichment is None:
+            return
+        if enrichment.task.done():
+            if enrichment.cases is not None:
+                callback(enrichment.cases)
+        else:
+            enrichment.callbacks.append(callback)
+
+    def get(self, enrichment_id: str) -> Optional[Enrichment]:
+        return self._items.get(enrichment_id)
+
+    async def wait(self, enrichment_id: str, timeout: float) -> Optional[Enrichment]:
+        """The enrichment, after waiting up to `timeout` seconds for it to finish."""
+        enrichment = self._items.get(enrichment_id)
+        if enrichment is not None and timeout > 0 and not enrichment.task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(enrichment.task), timeout=timeout)
+            except Exception:
+                pass  # still pending or failed; the status says which
+        return enrichment
@@ -0,0 +1,167 @@
+"""
+Speculative prefetch of the next conversation stage.
+
+After a "details" turn (legal provisions for the user's situation) the next
+turn is usually a request for cases or for the impact, both of which need
+Kanoon results for the same topic. The router schedules a background Kanoon
+search for the turn's query as soon as it has answered; a later generic case
+request ("show me similar cases") or impact turn uses those results instead of
+scraping again, waiting for the prefetch if it is still running.
+
+Prefetches are bounded: at most NYAYADOOT_PREFETCH_CONCURRENCY run at once
+(further ones are skipped, not queued), each gets NYAYADOOT_PREFETCH_BUDGET
+seconds, and their Gemini calls run at background priority. When the user
+moves on to something else the session's prefetch is cancelled by expiring its
+deadline, which stops the work at its next deadline check.
+"""
+import asyncio
+import os
+import re
+from typing import Dict, List, Optional, Set
+
+from keywords.extractor import STOPWORDS
+from utils import metrics
+from utils.cache import TTLCache
+from utils.deadline import Deadline
+from utils.log import get_logger
+from utils.tracing import detach_trace
+
+logger = get_logger("conversation.prefetch")
+
+PREFETCH_ENABLED = os.getenv("NYAYADOOT_PREFETCH", "1") != "0"
+PREFETCH_CONCURRENCY = int(os.getenv("NYAYADOOT_PREFETCH_CONCURRENCY", "2"))
+PREFETCH_BUDGET = float(os.getenv("NYAYADOOT_PREFETCH_BUDGET", "15"))
+PREFETCH_TTL = float(os.getenv("NYAYADOOT_PREFETCH_TTL", "600"))
+
+# Stages after which the next turn is likely to want cases, and intents that can use them
+PREFETCH_AFTER = ("details",)
+PREFETCH_CONSUMERS = ("cases", "impact")
+
+prefetch_events = metrics.counter(
+    "prefetch_events_total",
+    "Speculative prefetches by event (started, skipped, completed, failed, cancelled, used, off_topic)",
+    ("event",),
+)
+
+# Words that can make up a case request without naming a topic ("show me some similar cases")
+CASE_REQUEST_WORDS = {
+    "show", "give", "find", "get", "list", "see", "look", "tell", "share", "provide", "want", "need", "like",
+    "please", "also", "more", "other", "similar", "mine", "related", "relevant", "examples", "example",
+    "precedent", "precedents", "case", "cases", "judgment", "judgments", "ruling", "rulings", "decision",
+    "decisions", "court", "courts", "law", "laws", "legal", "there", "yes", "sure", "okay", "thanks",
+}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def topic_words(query: str) -> Set[str]:
+    """Words of a query that name its topic: not stopwords or case-request vocabulary, plural "s" removed."""
+    words = set()
+    for word in _WORD.findall(query.lower()):
+        if word in STOPWORDS or word in CASE_REQUEST_WORDS or len(word) <= 2 and not word.isdigit():
+            continue
+        words.add(word[:-1] if word.endswith("s") and len(word) > 3 else word)
+    return words
+
+
+def is_generic_case_request(query: str) -> bool:
+    """True for case requests such as "show me similar cases" that name no topic and so refer back to the last one."""
+    return not topic_words(query)
+
+
+def same_topic(previous_query: str, query: str) -> bool:
+    """True if results found for `previous_query` can answer `query`.
+
+    A query with no topic words always can; otherwise at least half of its
+    topic words must appear in the previous query.
+    """
+    words = topic_words(query)
+    if not words:
+        return True
+    return 2 * len(words & topic_words(previous_query)) >= len(words)
+
+
+class PrefetchEntry:
+    __slots__ = ("query", "deadline", "task")
+
+    def __init__(self, query: str, deadline: Deadline, task: "asyncio.Task"):
+        self.query = query
+        self.deadline = deadline
+        self.task = task
+
+
+class Prefetcher:
+    """Background Kanoon searches per session, with a global concurrency budget."""
+    def __init__(self, max_concurrent: int = PREFETCH_CONCURRENCY, budget: float = PREFETCH_BUDGET,
+                 ttl: float = PREFETCH_TTL, enabled: bool = PREFETCH_ENABLED):
+        self.max_concurrent = max_concurrent
+        self.budget = budget
+        self.enabled = enabled
+        self.active = 0
+        self._entries = TTLCache("prefetch", maxsize=1024, ttl=ttl)
+
+    def schedule(self, session_id: str, stage: str, query: str, conversation_history: str = "") -> bool:
+        """Start prefetching after a turn that ended in `stage`; False if none was started."""
+        if not self.enabled or stage not in PREFETCH_AFTER:
+            return False
+        self.cancel(session_id)
+        if self.active >= self.max_concurrent:
+            prefetch_events.inc(event="skipped")
+            logger.debug("Prefetch skipped: %d already running", self.active)
+            return False
+        deadline = Deadline(self.budget)
+        self.active += 1
+        task = asyncio.ensure_future(self._run(query, conversation_history, deadline))
+        self._entries.set(session_id, PrefetchEntry(query, deadline, task))
+        prefetch_events.inc(event="started")
+        return True
+
+    async def _run(self, query: str, conversation_history: str, deadline: Deadline) -> Optional[List[Dict]]:
+        from scraping.kanoon import fetch_kanoon_results, has_case_results
+        detach_trace()
+        try:
+            cases = await asyncio.to_thread(fetch_kanoon_results, query, conversation_history, deadline,
+                                            "prefetch_search_phrase")
+        except Exception as e:
+            prefetch_events.inc(event="failed")
+            logger.warning("Prefetch failed: %s", e)
+            return None
+        finally:
+            self.active -= 1
+        if deadline.expired or not has_case_results(cases):
+            return None  # cancelled, out of time, or only "unavailable" placeholders
+        prefetch_events.inc(event="completed")
+        return cases
+
+    def cancel(self, session_id: str):
+        """Stop and forget the session's prefetch, if any."""
+        entry = self._entries.pop(session_id)
+        if entry is not None and not entry.task.done():
+            entry.deadline.expire()
+            prefetch_events.inc(event="cancelled")
+
+    async def peek(self, session_id: str, wait: float) -> Optional[List[Dict]]:
+        """The session's prefetched cases, waiting up to `wait` seconds if the prefetch is still running."""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry.task), timeout=max(0.0, wait))
+        except asyncio.TimeoutError:
+            return None
+
+    async def take(self, session_id: str, wait: float, query: str = "") -> Optional[List[Dict]]:
+        """Like peek, for a turn that answers `query` with the prefetched cases.
+
+        Returns None without waiting if the prefetch was for a different topic than `query`.
+        """
+        entry = self._entries.get(session_id)
+        if entry is not None and not same_topic(entry.query, query):
+            prefetch_events.inc(event="off_topic")
+            logger.debug("Not using prefetched cases for a different topic")
+            return None
+        cases = await self.peek(session_id, wait)
+        if cases:
+            prefetch_events.inc(event="used")
+            logger.info("Using prefetched cases")
+        return cases
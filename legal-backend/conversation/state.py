@@ -1,5 +1,7 @@
 from typing import List, Dict
 
+from keywords.extractor import KeywordStats
+
 class ConversationState:
     """Manages conversation sessions and histories for each user."""
     def __init__(self):
@@ -13,7 +15,8 @@ class ConversationState:
                 'current_stage': 'initial',
                 'references': None,
                 'cases': None,
-                'history': []
+                'history': [],
+                'keyword_stats': KeywordStats()
             }
         return self.sessions[session_id]
 
@@ -32,12 +35,36 @@ class ConversationState:
         session['cases'] = cases
         session['history'].append(('user', query))
         session['history'].append(('assistant', answer))
+        session['keyword_stats'].add(query)
+        session['keyword_stats'].add(answer)
+        
+    def get_keywords(self, session_id: str, query: str = "") -> List[str]:
+        """Ranked keywords for the session's whole conversation plus `query`, from its running keyword stats.
+
+        Every turn since the session started is counted, not just the last turns that
+        get_conversation_history renders.
+        """
+        return self.get_session(session_id)['keyword_stats'].keywords(query)
+
+    def merge_cases(self, session_id: str, query: str, cases: List[Dict]):
+        """Attach cases that arrived after the turn for `query` was answered, if it is still the latest turn."""
+        session = self.get_session(session_id)
+        context = session.get('current_context') or {}
+        if context.get('query') != query:
+            return
+        context['cases'] = cases
+        session['cases'] = cases
         
     def get_conversation_history(self, session_id: str, max_turns: int =9) -> str:
         """Get formatted conversation history for context."""
         session = self.get_session(session_id)
         history = session['history']
         
+        # Reuse the last rendering until the history changes
+        cached = session.get('rendered_history')
+        if cached and cached[0] == (len(history), max_turns):
+            return cached[1]
+        
         # Get the most recent turns (limited by max_turns)
         recent_history = history[-max_turns*2:] if history else []
         
@@ -53,4 +80,6 @@ class ConversationState:
                 
                 formatted_history += f"User: {user_msg}\nAssistant: {assistant_msg}\n\n"
         
-        return formatted_history.strip()
+        formatted_history = formatted_history.strip()
+        session['rendered_history'] = ((len(history), max_turns), formatted_history)
+        return formatted_history
@@ -0,0 +1,32 @@
+"""
+Gunicorn settings for production (used by serve.py).
+
+The app is imported once in the master (preload_app) and forked into uvicorn
+workers. Everything that owns threads or sockets is started per worker:
+logging is set up again after the fork, and warmup (connection pools, caches)
+runs in each worker's lifespan hook. Gemini concurrency limits apply per worker.
+"""
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("NYAYADOOT_WORKERS", str(min(4, multiprocessing.cpu_count()))))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("NYAYADOOT_WORKER_TIMEOUT", "60"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None
+
+
+def on_starting(server):
+    # Load the lazily imported dependencies once in the master so every forked
+    # worker starts with them already in memory
+    from utils.warmup import import_dependencies
+    import_dependencies()
+
+
+def post_fork(server, worker):
+    # The log writer thread started in the master does not survive the fork
+    from utils.log import setup_logging
+    setup_logging()
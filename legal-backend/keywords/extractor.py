@@ -1,7 +1,8 @@
 import re
 import html
+import heapq
 from collections import Counter
-from typing import Set
+from typing import Dict, List, Set
 
 # Define common stopwords
 STOPWORDS: Set[str] = {'the', 'a', 'an', 'and', 'or', 'but', 'is', 'are', 'was', 'were', 
@@ -33,35 +34,91 @@ LEGAL_TERMS = ['law', 'legal', 'right', 'duty', 'obligation', 'liability', 'cont
               'agreement', 'court', 'judge', 'judgment', 'case', 'precedent', 'statute',
               'act', 'section', 'clause', 'provision', 'regulation', 'rule']
 
+# Words that suggest a legal matter even without legal vocabulary
+LEGAL_SIGNALS: Set[str] = set(LEGAL_TERMS) | {
+    'police', 'fir', 'complaint', 'ipc', 'crpc', 'bail', 'arrest', 'theft', 'stolen', 'fraud', 'cheating',
+    'property', 'tenant', 'landlord', 'rent', 'deposit', 'divorce', 'custody', 'maintenance', 'dowry',
+    'harassment', 'assault', 'accident', 'insurance', 'employer', 'salary', 'wages', 'notice', 'lawyer',
+    'advocate', 'petition', 'rights', 'cheque', 'loan', 'consumer', 'refund', 'will', 'inheritance'}
+# Queries made only of these words are small talk
+SMALL_TALK: Set[str] = {'hi', 'hello', 'hey', 'thanks', 'thank', 'you', 'ok', 'okay', 'bye', 'good', 'morning',
+                        'evening', 'how', 'are', 'who', 'what', 'is', 'your', 'name', 'weather', 'joke', 'tell',
+                        'me', 'a', 'the', 'today', 'there', 'doing'}
+
+def is_legal_query_local(query: str, conversation_history: str = "") -> bool:
+    """Keyword-only stand-in for the Gemini classifier when it is being shed; leans towards legal."""
+    words = set(re.findall(r"[a-z]+", query.lower()))
+    if words & LEGAL_SIGNALS or conversation_history:
+        return True
+    return not words or not words <= SMALL_TALK
+
 def sanitize_query(query: str) -> str:
     """Sanitize and normalize user query for safe processing."""
     query = html.escape(query.strip())
     return re.sub(r'\s+', ' ', query)
 
+# Keywords reported by extract_keywords_from_conversation, and how many of them are frequent words
+MAX_KEYWORDS = 15
+TOP_WORDS = 10
+DEFAULT_KEYWORDS = "legal rights obligations duties"
+
+
+class KeywordStats:
+    """Keyword counts for a conversation, updated one message at a time.
+
+    Keeps the word counts, the order in which words were first seen, the
+    legal terms seen so far and the current top words by count (ties go to
+    the word seen first). Counts only grow, so a word can only enter the top
+    list when it is counted, and add() costs O(len(text)) rather than a
+    recount of the whole conversation.
+    """
+    __slots__ = ("counts", "first_seen", "legal_terms", "top")
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self.first_seen: Dict[str, int] = {}
+        self.legal_terms: Set[str] = set()
+        self.top: List[str] = []
+
+    def _rank(self, word: str, extra: Counter = None):
+        count = self.counts[word] + (extra[word] if extra else 0)
+        return -count, self.first_seen.get(word, len(self.first_seen))
+
+    def add(self, text: str):
+        """Count the words and legal terms of one more message."""
+        text = text.lower()
+        new_counts = Counter(word for word in text.split() if word not in STOPWORDS and len(word) > 2)
+        for word in new_counts:
+            if word not in self.first_seen:
+                self.first_seen[word] = len(self.first_seen)
+        self.counts.update(new_counts)
+        # Only the words just counted can have moved into the top
+        counts, first_seen = self.counts, self.first_seen
+        candidates = self.top + [word for word in new_counts if word not in self.top]
+        self.top = heapq.nsmallest(TOP_WORDS, candidates, key=lambda word: (-counts[word], first_seen[word]))
+        self.legal_terms.update(term for term in LEGAL_TERMS if term not in self.legal_terms and term in text)
+
+    def keywords(self, query: str = "") -> List[str]:
+        """Legal terms (in LEGAL_TERMS order) then words seen more than once, most frequent first.
+
+        The query is counted along with the conversation without being added to it.
+        """
+        query = query.lower()
+        extra = Counter(word for word in query.split() if word not in STOPWORDS and len(word) > 2)
+        # Only words already on top or in the query can be in the top once the query is counted
+        candidates = self.top + [word for word in extra if word not in self.top]
+        candidates.sort(key=lambda word: self._rank(word, extra))
+        common = [word for word in candidates[:TOP_WORDS] if self.counts[word] + extra[word] > 1]
+        legal = [term for term in LEGAL_TERMS if term in self.legal_terms or term in query]
+        return list(dict.fromkeys(legal + common))[:MAX_KEYWORDS]
+
+
 def extract_keywords_from_conversation(conversation_history: str, query: str) -> str:
     """Extract keywords with a focus on legal relevance from conversation and query."""
-    # Combine conversation and query
-    all_text = f"{conversation_history} {query}".lower()
-    
-    # Split the text into words and filter out stopwords
-    words = all_text.split()
-    filtered_words = [w for w in words if w not in STOPWORDS and len(w) > 2]
-    
-    # Count word frequencies
-    word_counts = Counter(filtered_words)
-    
-    # Get common words as keywords
-    common_keywords = [word for word, count in word_counts.most_common(10) if count > 1]
-    
-    # Add legal-specific terms if found in the text
-    legal_keywords = [term for term in LEGAL_TERMS if term in all_text]
-    
-    # Combine all keywords
-    all_keywords = legal_keywords + common_keywords
-    
-    unique_keywords = list(set(all_keywords))
-    
-    if not unique_keywords:
-        return "legal rights obligations duties"
-    
-    return ", ".join(unique_keywords[:15])
+    stats = KeywordStats()
+    stats.add(conversation_history)
+    return format_keywords(stats.keywords(query))
+
+
+def format_keywords(keywords: List[str]) -> str:
+    return ", ".join(keywords) if keywords else DEFAULT_KEYWORDS
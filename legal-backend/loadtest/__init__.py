@@ -0,0 +1 @@
+# Initialize the loadtest package
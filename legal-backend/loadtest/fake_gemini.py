@@ -0,0 +1,113 @@
+"""
+A local stand-in for the Gemini API with configurable latency and failures.
+
+Install it in-process with ai.gemini.set_backend(FakeGemini(...)), or in a
+separately started server with
+    GEMINI_BACKEND=loadtest.fake_gemini:FakeGemini
+in which case the FAKE_GEMINI_* environment variables below configure it.
+"""
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+from ai.prompt import CASE_LINK_PATTERN
+
+# Canned output per route; the answer routes are templated from the prompt
+CANNED = {
+    "classification": "LEGAL",
+    "search_phrase": "theft FIR IPC 379",
+    "section_suggestions": (
+        "Indian Penal Code|379|Punishment for theft\n"
+        "Code of Criminal Procedure|154|Registration of FIR for cognizable offences\n"
+        "Indian Penal Code|411|Dishonestly receiving stolen property"
+    ),
+    "summary": "The user reported a theft and asked about FIR registration and relevant IPC sections.",
+}
+
+ANSWER_TEMPLATE = (
+    "Under Indian law, theft is punishable under Section 379 IPC and the police must register an FIR "
+    "for a cognizable offence under Section 154 CrPC. If they refuse, you can approach the Superintendent "
+    "of Police or file a complaint before the Magistrate under Section 156(3) CrPC."
+)
+
+# Rough median latency per route in seconds, before `latency_scale`
+DEFAULT_LATENCY = {
+    "classification": 0.25,
+    "search_phrase": 0.35,
+    "section_suggestions": 0.6,
+    "answer": 1.2,
+    "impact_answer": 1.0,
+    "summary": 1.5,
+}
+
+
+class FakeThrottle(Exception):
+    """Raised for simulated rate limiting; the client treats it like a 429."""
+    code = 429
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+        self.usage_metadata = None
+
+
+class FakeGemini:
+    """Callable backend returning canned text after a log-normal delay."""
+    def __init__(self, latency_scale: Optional[float] = None, sigma: Optional[float] = None,
+                 error_rate: Optional[float] = None, throttle_rate: Optional[float] = None,
+                 not_legal_rate: Optional[float] = None, seed: Optional[int] = None,
+                 latency: Optional[Dict[str, float]] = None):
+        env = os.getenv
+        self.latency_scale = float(env("FAKE_GEMINI_LATENCY_SCALE", "1.0")) if latency_scale is None else latency_scale
+        self.sigma = float(env("FAKE_GEMINI_SIGMA", "0.5")) if sigma is None else sigma
+        self.error_rate = float(env("FAKE_GEMINI_ERROR_RATE", "0")) if error_rate is None else error_rate
+        self.throttle_rate = float(env("FAKE_GEMINI_THROTTLE_RATE", "0")) if throttle_rate is None else throttle_rate
+        self.not_legal_rate = float(env("FAKE_GEMINI_NOT_LEGAL_RATE", "0")) if not_legal_rate is None else not_legal_rate
+        self.latency = dict(DEFAULT_LATENCY, **(latency or {}))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls: Dict[str, int] = {}
+
+    def _draw(self):
+        with self._lock:
+            return self._random.random(), self._random.gauss(0, 1)
+
+    def delay_for(self, route_name: str) -> float:
+        _, z = self._draw()
+        median = self.latency.get(route_name, DEFAULT_LATENCY["answer"]) * self.latency_scale
+        return median * math.exp(self.sigma * z)
+
+    def respond(self, prompt: str, route_name: str, max_tokens: Optional[int]) -> str:
+        if route_name == "classification":
+            roll, _ = self._draw()
+            return "NOT LEGAL" if roll < self.not_legal_rate else "LEGAL"
+        if route_name in CANNED:
+            return CANNED[route_name]
+        # Answers cite the first case link found in the prompt, like the real model is asked to
+        text = ANSWER_TEMPLATE
+        link = CASE_LINK_PATTERN.search(prompt)
+        if link:
+            text += f" See [{link.group(1)}]({link.group(2)})."
+        if max_tokens:
+            words = re.findall(r"\S+", text)
+            text = " ".join(words[:max_tokens])
+        return text
+
+    def __call__(self, prompt: str, route_name: str, model_name: str, generation_config: Dict, timeout: float):
+        with self._lock:
+            self.calls[route_name] = self.calls.get(route_name, 0) + 1
+        delay = self.delay_for(route_name)
+        time.sleep(min(delay, timeout))
+        if delay > timeout:
+            raise TimeoutError(f"Fake Gemini timed out after {timeout:.1f}s")
+        roll, _ = self._draw()
+        if roll < self.throttle_rate:
+            raise FakeThrottle("429 Resource has been exhausted (fake)")
+        if roll < self.throttle_rate + self.error_rate:
+            raise RuntimeError("500 Internal error (fake)")
+        return FakeResponse(self.respond(prompt, route_name, generation_config.get("max_output_tokens")))
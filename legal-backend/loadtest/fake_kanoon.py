@@ -0,0 +1,94 @@
+"""
+A local HTTP stand-in for Indian Kanoon search.
+
+Serves a saved search results page (kanoon_sample.html by default) for every
+/search/ request after a configurable delay, and fails a configurable share
+of requests with 503. Point the backend at it with KANOON_BASE_URL.
+
+Standalone:
+    python -m loadtest.fake_kanoon --port 8090 --latency 0.3
+"""
+import argparse
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+SAMPLE_PAGE = os.path.join(os.path.dirname(__file__), "..", "..", "kanoon_sample.html")
+
+
+class _KanoonHandler(BaseHTTPRequestHandler):
+    server_version = "FakeKanoon/1.0"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            roll = server.random.random()
+            jitter = server.random.uniform(0.5, 1.5)
+        time.sleep(server.latency * jitter)
+        if not self.path.startswith("/search/"):
+            self._send(404, b"Not found")
+        elif roll < server.error_rate:
+            self._send(503, b"Service unavailable")
+        else:
+            self._send(200, server.page)
+
+    def _send(self, status: int, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeKanoonServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], page: bytes, latency: float, error_rate: float, seed: Optional[int]):
+        super().__init__(address, _KanoonHandler)
+        self.page = page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_kanoon(port: int = 0, latency: float = 0.3, error_rate: float = 0.0,
+                      page_path: str = SAMPLE_PAGE, seed: Optional[int] = None) -> FakeKanoonServer:
+    """Start the server on a background thread and return it (see .base_url)."""
+    with open(page_path, "rb") as f:
+        page = f.read()
+    server = FakeKanoonServer(("127.0.0.1", port), page, latency, error_rate, seed)
+    threading.Thread(target=server.serve_forever, name="fake-kanoon", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a saved Indian Kanoon results page locally")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.3, help="mean response delay in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--page", default=SAMPLE_PAGE)
+    args = parser.parse_args()
+    server = start_fake_kanoon(args.port, args.latency, args.error_rate, args.page)
+    print(f"Fake Kanoon listening on {server.base_url} (KANOON_BASE_URL={server.base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
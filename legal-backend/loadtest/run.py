@@ -0,0 +1,207 @@
+"""
+Replay multi-turn conversation scripts against the app with local fake backends.
+
+Starts a fake Kanoon server and installs the fake Gemini backend, serves the
+FastAPI app with uvicorn on a local port, then runs conversations at the given
+concurrency and reports throughput and p50/p95/p99 latency per intent (the
+conversation stage the router answered with). Nothing leaves the machine.
+
+Run from the legal-backend directory:
+    python -m loadtest.run --concurrency 16 --conversations 200
+    python -m loadtest.run --gemini-latency-scale 2 --gemini-throttle-rate 0.05 --json results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+DEFAULT_SCRIPT = os.path.join(os.path.dirname(__file__), "scripts", "conversations.json")
+
+# Answers that mean a stage failed and the user got a fallback message
+DEGRADED_MARKERS = ("unable to generate a response", "currently unavailable", "having trouble connecting")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an unsorted list; None when it is empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def load_app():
+    """The production app, or just the API router if the frontend build is missing."""
+    try:
+        from main import app
+        return app
+    except RuntimeError as e:
+        # StaticFiles refuses to mount a directory that doesn't exist
+        print(f"Serving the API router only ({e})")
+        from fastapi import FastAPI
+        from api.router import router
+        app = FastAPI()
+        app.include_router(router)
+        return app
+
+
+def start_app(app, port: int):
+    """Serve the app on a background thread and wait until it accepts connections."""
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="loadtest-app", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("App server failed to start")
+        time.sleep(0.05)
+    return server, thread
+
+
+async def run_conversation(http, base_url: str, script: Dict, results: List[Dict], think_time: float):
+    session_id = None
+    for turn, query in enumerate(script["turns"]):
+        payload = {"query": query, "session_id": session_id}
+        start = time.perf_counter()
+        try:
+            async with http.post(f"{base_url}/nyayadoot/query", json=payload) as resp:
+                status = resp.status
+                body = await resp.json() if status == 200 else {}
+        except Exception as e:
+            status, body = 0, {"error": str(e)}
+        latency = time.perf_counter() - start
+        session_id = body.get("session_id", session_id)
+        answer = (body.get("answer") or "").lower()
+        results.append({
+            "script": script["name"],
+            "turn": turn,
+            "intent": body.get("conversation_stage", "error"),
+            "status": status,
+            "latency": latency,
+            "degraded": status != 200 or any(m in answer for m in DEGRADED_MARKERS),
+        })
+        if think_time:
+            await asyncio.sleep(think_time)
+
+
+async def drive(base_url: str, scripts: List[Dict], concurrency: int, conversations: int, think_time: float):
+    """Run `conversations` scripts round-robin with at most `concurrency` in flight."""
+    import aiohttp
+    results: List[Dict] = []
+    pending = asyncio.Queue()
+    for i in range(conversations):
+        pending.put_nowait(scripts[i % len(scripts)])
+
+    async def user(http):
+        while True:
+            try:
+                script = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await run_conversation(http, base_url, script, results, think_time)
+
+    timeout = aiohttp.ClientTimeout(total=120)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(user(http) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return results, elapsed
+
+
+def summarize(results: List[Dict], elapsed: float) -> Dict:
+    by_intent = defaultdict(list)
+    for r in results:
+        by_intent[r["intent"]].append(r)
+    by_intent["all"] = results
+
+    def stats(rows):
+        latencies = [r["latency"] for r in rows]
+        return {
+            "requests": len(rows),
+            "degraded": sum(r["degraded"] for r in rows),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max": max(latencies) if latencies else None,
+        }
+
+    return {
+        "elapsed": elapsed,
+        "throughput": len(results) / elapsed if elapsed else 0.0,
+        "intents": {intent: stats(rows) for intent, rows in sorted(by_intent.items())},
+    }
+
+
+def print_report(summary: Dict):
+    print(f"\n{'intent':<12}{'requests':>10}{'degraded':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for intent, s in summary["intents"].items():
+        ms = lambda v: f"{v * 1000:.0f}" if v is not None else "-"
+        print(f"{intent:<12}{s['requests']:>10}{s['degraded']:>10}{ms(s['p50']):>10}{ms(s['p95']):>10}{ms(s['p99']):>10}{ms(s['max']):>10}")
+    print(f"\n{summary['intents']['all']['requests']} turns in {summary['elapsed']:.1f}s "
+          f"({summary['throughput']:.1f} turns/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test with fake Gemini and Kanoon backends")
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="JSON list of {name, turns}")
+    parser.add_argument("--concurrency", type=int, default=8, help="conversations in flight")
+    parser.add_argument("--conversations", type=int, default=40, help="conversations to run in total")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause between turns in seconds")
+    parser.add_argument("--gemini-latency-scale", type=float, default=1.0)
+    parser.add_argument("--gemini-sigma", type=float, default=0.5, help="log-normal spread of Gemini latency")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--kanoon-latency", type=float, default=0.3)
+    parser.add_argument("--kanoon-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    with open(args.script) as f:
+        scripts = json.load(f)
+
+    from loadtest.fake_kanoon import start_fake_kanoon
+    kanoon = start_fake_kanoon(latency=args.kanoon_latency, error_rate=args.kanoon_error_rate, seed=args.seed)
+    # Must be set before the scraper is imported
+    os.environ["KANOON_BASE_URL"] = kanoon.base_url
+    os.environ.setdefault("NYAYADOOT_LOG_LEVEL", "ERROR")
+
+    from ai.gemini import set_backend
+    from loadtest.fake_gemini import FakeGemini
+    gemini = FakeGemini(latency_scale=args.gemini_latency_scale, sigma=args.gemini_sigma,
+                        error_rate=args.gemini_error_rate, throttle_rate=args.gemini_throttle_rate, seed=args.seed)
+    set_backend(gemini)
+
+    port = _free_port()
+    server, thread = start_app(load_app(), port)
+    try:
+        results, elapsed = asyncio.run(drive(f"http://127.0.0.1:{port}", scripts, args.concurrency,
+                                             args.conversations, args.think_time))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+        kanoon.shutdown()
+
+    summary = summarize(results, elapsed)
+    summary["backends"] = {"gemini_calls": dict(gemini.calls), "kanoon_requests": kanoon.requests}
+    summary["config"] = vars(args)
+    print_report(summary)
+    print(f"Gemini calls: {gemini.calls}  Kanoon requests: {kanoon.requests}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
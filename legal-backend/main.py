@@ -1,12 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, JSONResponse
+import asyncio
 import uvicorn
 import os
 from dotenv import load_dotenv
 
 # Import custom modules
 from api.router import router
+from api.websocket import router as websocket_router
+from utils.metrics import render_prometheus
+from utils.log import setup_logging
+from utils.warmup import run_warmup, is_ready, report as warmup_report
+from utils.static import PrecompressedStaticFiles
+from utils.executor import monitor_loop_lag, shutdown_pool
 
 # Memory optimization settings
 os.environ['PYTHONUNBUFFERED'] = '1'
@@ -15,11 +23,28 @@ os.environ['PYTHONDONTWRITEBYTECODE'] = '1'
 # Load environment variables
 load_dotenv()
 
+# Structured logging through a background writer thread (see utils/log.py)
+setup_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up once per worker (see utils/warmup.py). By default it runs in the
+    # background so liveness checks pass while /ready still reports 503.
+    warmup = asyncio.create_task(asyncio.to_thread(run_warmup))
+    if os.getenv("NYAYADOOT_WARMUP_BLOCKING", "0") == "1":
+        await warmup
+    # Event loop lag, exported as event_loop_lag_seconds (see utils/executor.py)
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+    yield
+    lag_monitor.cancel()
+    shutdown_pool()
+
 # Create FastAPI app
 app = FastAPI(
     title="Indian Legal Assistant API",
     description="API for Indian legal assistant with Gemini integration",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -33,9 +58,10 @@ app.add_middleware(
 
 # Include router
 app.include_router(router)
+app.include_router(websocket_router)
 
-# Serve the frontend static files
-app.mount("/nyayadoot", StaticFiles(directory="../l-frontend/dist", html=True), name="frontend")
+# Serve the frontend bundle from memory, precompressed (see utils/static.py)
+app.mount("/nyayadoot", PrecompressedStaticFiles(directory="../l-frontend/dist"), name="frontend")
 
 # Root endpoint
 @app.get("/")
@@ -45,6 +71,18 @@ async def root():
         "frontend": "Access the frontend at /nyayadoot"
     }
 
-# Run the application
+# Readiness probe: 200 only once this worker has finished warming up
+@app.get("/ready")
+async def ready():
+    if not is_ready():
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return {"status": "ready", "warmup": warmup_report()}
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# Run the application (development: single worker with auto-reload; see serve.py for production)
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
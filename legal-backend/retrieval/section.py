@@ -1,7 +1,11 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from ai.gemini import generate_with_gemini
+from utils.deadline import Deadline
+from utils.log import get_logger
 
-def find_relevant_sections(query: str, conversation_history: str = "") -> List[Dict]:
+logger = get_logger("retrieval.section")
+
+def find_relevant_sections(query: str, conversation_history: str = "", deadline: Optional[Deadline] = None) -> List[Dict]:
     """Use Gemini to suggest relevant Act/Section pairs directly (no local mapping)."""
     try:
         context = f"Previous: {conversation_history}\n" if conversation_history else ""
@@ -11,7 +15,7 @@ def find_relevant_sections(query: str, conversation_history: str = "") -> List[D
             "Only output lines in this exact pipe-delimited format, no extra text.\n"
             f"{context}Question: {query}"
         )
-        raw = generate_with_gemini(prompt)
+        raw = generate_with_gemini(prompt, route="section_suggestions", deadline=deadline)
         lines = [l.strip() for l in raw.split('\n') if '|' in l]
 
         suggestions = []
@@ -34,5 +38,5 @@ def find_relevant_sections(query: str, conversation_history: str = "") -> List[D
                 
         return results
     except Exception as e:
-        print(f"Gemini section retrieval error: {e}")
+        logger.warning("Gemini section retrieval error: %s", e)
         return []
@@ -1,12 +1,217 @@
-import requests
-from bs4 import BeautifulSoup
+import os
+import threading
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional
+from urllib.parse import quote
 from keywords.extractor import extract_keywords_from_conversation
-from ai.gemini import generate_with_gemini
+from utils.deadline import Deadline, timeout_for
+from utils.tracing import span
+from utils.log import get_logger
+from utils.shared_cache import SharedCache
+from utils.cassette import Cassette, RecordedResponse, get_cassette, http_get
+from utils.memo import shared
+from utils.singleflight import SingleFlight, FlightTimeout
+from utils.executor import run_cpu
 
-def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dict]:
-    """Fetch case law results from Indian Kanoon using a Gemini-generated search phrase and filter for relevance. Retry on timeout."""
+logger = get_logger("scraping.kanoon")
+
+# Where searches are sent; point this at a local stand-in for load tests.
+# Result links always use the public indiankanoon.org host.
+KANOON_BASE_URL = os.getenv("KANOON_BASE_URL", "https://indiankanoon.org").rstrip("/")
+KANOON_SEARCH_URL = f"{KANOON_BASE_URL}/search/?formInput="
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Connection": "keep-alive",
+    "Upgrade-Insecure-Requests": "1"
+}
+
+# requests, BeautifulSoup and the Gemini client are imported on first use (or
+# during warmup) so importing this module stays cheap.
+
+# One pooled session per process, created on first use, so a server that forks
+# workers after importing this module gives each worker its own pool.
+KANOON_POOL_SIZE = int(os.getenv("KANOON_POOL_SIZE", "10"))
+_session = None
+_session_lock = threading.Lock()
+
+def _get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.headers.update(HEADERS)
+                for scheme in ("https://", "http://"):
+                    session.mount(scheme, HTTPAdapter(pool_connections=2, pool_maxsize=KANOON_POOL_SIZE))
+                _session = session
+    return _session
+
+# Successful search pages by URL, shared with the other workers; retries bypass it
+_page_cache = SharedCache("kanoon_pages", maxsize=int(os.getenv("KANOON_PAGE_CACHE_SIZE", "256")),
+                          ttl=float(os.getenv("KANOON_PAGE_CACHE_TTL", "3600")),
+                          l2_maxsize=int(os.getenv("KANOON_SHARED_CACHE_SIZE", "5000")),
+                          encode=lambda response: response.text, decode=RecordedResponse)
+
+# Concurrent requests for a URL that is already being fetched wait for that fetch
+_inflight = SingleFlight("kanoon")
+
+def fetch_page(url: str, timeout: float = 20, refresh: bool = False):
+    """GET a Kanoon page through the page cache and the record/replay cassette."""
+    if not refresh:
+        cached = _page_cache.get(url)
+        if cached is not None:
+            return cached
+    try:
+        return _inflight.do(url, _fetch_uncached, url, timeout, wait_timeout=timeout)
+    except FlightTimeout as e:
+        import requests
+        raise requests.exceptions.Timeout(str(e)) from None
+
+def _fetch_uncached(url: str, timeout: float):
+    resp = http_get(url, _get_session().get, timeout=timeout)
+    if resp.status_code == 200 and resp.text:
+        _page_cache.set(url, RecordedResponse(resp.text, resp.status_code))
+    return resp
+
+def warm_connection(timeout: float = 3) -> bool:
+    """Open a pooled connection to Kanoon ahead of the first search; False if it failed."""
+    if get_cassette().replaying:
+        return False
+    import requests
+    try:
+        _get_session().head(f"{KANOON_BASE_URL}/", timeout=timeout)
+        return True
+    except requests.RequestException as e:
+        logger.warning("Could not pre-connect to Kanoon: %s", e)
+        return False
+
+def warm_page_cache(cassette: Optional[Cassette] = None) -> int:
+    """Load recorded Kanoon pages into the page cache; returns how many were loaded."""
+    cassette = cassette or get_cassette()
+    loaded = 0
+    for entry, body in cassette.iter_entries("http"):
+        if entry.get("status") == 200 and body:
+            _page_cache.set(entry["request"], RecordedResponse(body, 200), local_only=True)
+            loaded += 1
+    return loaded
+
+def _retry_pause(deadline: Optional[Deadline], seconds: float = 2) -> bool:
+    """Sleep before a retry if the deadline leaves room for it; returns False otherwise."""
+    if deadline is not None and deadline.remaining() <= seconds + 1:
+        return False
+    time.sleep(seconds)
+    return True
+
+def parse_search_results(html: str, limit: int = 3) -> List[Dict]:
+    """Parse an Indian Kanoon search results page into up to `limit` case dicts."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    
+    # Try the primary selector
+    case_elements = soup.select("div.result_title > a")
+    logger.debug("Number of case elements found: %d", len(case_elements))
+    
+    # If no results, try alternative selectors
+    if len(case_elements) == 0:
+        logger.debug("Looking for results with different selectors")
+        
+        # Check for result containers
+        result_divs = soup.select('div.result')
+        logger.debug("Result divs found: %d", len(result_divs))
+        
+        if len(result_divs) > 0:
+            # Extract case elements from result divs
+            case_elements = []
+            for div in result_divs:
+                links = div.select('div.result_title > a')
+                if links:
+                    case_elements.extend(links)
+        
+        # If still no results, try direct link selector
+        if len(case_elements) == 0:
+            case_elements = soup.select('a[href*="/doc/"]')
+            logger.debug("Using doc links selector: %d results", len(case_elements))
+    
+    case_results = []
+    seen_titles = set()
+    seen_urls = set()
+    
+    for element in case_elements:
+        title = element.get_text(strip=True)
+        case_url = element.get("href")
+        if case_url and not case_url.startswith("http"):
+            case_url = f"https://indiankanoon.org{case_url}"
+        
+        # Find snippet - look in parent result div
+        snippet = ""
+        parent_result = element.find_parent("div", class_="result")
+        if parent_result:
+            headline = parent_result.select_one("div.headline")
+            if headline:
+                snippet = headline.get_text(strip=True)
+        
+        # Fall back to looking for snippet directly
+        if not snippet:
+            snippet_element = None
+            if element.find_parent("div", class_="result_title"):
+                snippet_element = element.find_parent("div", class_="result_title").find_next_sibling("div", class_="snippet") or \
+                                  element.find_parent("div", class_="result_title").find_next_sibling("div", class_="headline")
+            
+            if snippet_element:
+                snippet = snippet_element.get_text(strip=True)
+            else:
+                snippet = title
+        
+        # Filter out duplicate cases by title and URL
+        title_key = title.lower().replace("...", "").strip()
+        if title_key in seen_titles or (case_url and case_url in seen_urls):
+            continue
+        
+        case_results.append({
+            "title": title[:80],
+            "url": case_url,
+            "snippet": snippet[:250] if snippet else ""
+        })
+        seen_titles.add(title_key)
+        if case_url:
+            seen_urls.add(case_url)
+        if len(case_results) == limit:
+            break
+    
+    return case_results
+
+def has_case_results(cases: List[Dict]) -> bool:
+    """True if `cases` holds at least one real judgment link, not just an "unavailable" placeholder."""
+    return any("/doc/" in (case.get("url") or "") for case in cases or [])
+
+def parse_search_page(content: bytes, limit: int = 3) -> List[Dict]:
+    """parse_search_results for a raw page body; the form run in the CPU pool (utils/executor.py)."""
+    return parse_search_results(content.decode("utf-8", errors="replace"), limit)
+
+def fetch_kanoon_results(query: str, conversation_history: str = "", deadline: Optional[Deadline] = None,
+                         phrase_route: str = "search_phrase", cached_only: bool = False) -> List[Dict]:
+    """Fetch case law results from Indian Kanoon using a Gemini-generated search phrase and filter for relevance. Retry on timeout.
+
+    Within a shared-work scope (a batch of queries) each query gets one search
+    phrase and each distinct search phrase is scraped once. With cached_only,
+    only pages already in the page cache are used (load shedding).
+    """
+    search_phrase = shared("search_phrase", (query, conversation_history),
+                           generate_search_phrase, query, conversation_history, deadline, phrase_route)
+    if cached_only:
+        cached = _page_cache.get(f"{KANOON_SEARCH_URL}{quote(search_phrase)}")
+        return run_cpu(parse_search_page, cached.content) if cached is not None else []
+    return shared("kanoon_search", search_phrase, search_kanoon, search_phrase, query, deadline)
+
+def generate_search_phrase(query: str, conversation_history: str = "", deadline: Optional[Deadline] = None,
+                           route: str = "search_phrase") -> str:
+    """Ask Gemini for an Indian Kanoon search phrase, falling back to legal terms from the query."""
+    from ai.gemini import generate_with_gemini, GEMINI_ERROR_RESPONSE
     # Improve Gemini prompt for more relevant case law search
     context = f"Query: {query}\nHistory: {conversation_history}" if conversation_history else query
     prompt = (
@@ -24,16 +229,17 @@ def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dic
             legal_terms.append(f"{word} {query_words[i+1]}")
     
     try:
-        search_phrase = generate_with_gemini(prompt)
-        print(f"Gemini search phrase: {search_phrase}")
+        with span("search_phrase"):
+            search_phrase = generate_with_gemini(prompt, route=route, deadline=deadline)
+        logger.info("Gemini search phrase: %s", search_phrase)
         # Fallback to original query if Gemini output is too generic or short
-        if not search_phrase or len(search_phrase.strip()) < 5 or search_phrase == "Error generating response":
+        if not search_phrase or len(search_phrase.strip()) < 5 or search_phrase == GEMINI_ERROR_RESPONSE:
             if legal_terms:
                 search_phrase = " ".join(legal_terms) + " " + query
             else:
                 search_phrase = query
     except Exception as e:
-        print(f"Gemini search phrase error: {e}")
+        logger.warning("Gemini search phrase error: %s", e)
         # If Gemini fails, use extracted legal terms if available, otherwise use original query
         if legal_terms:
             search_phrase = " ".join(legal_terms)
@@ -59,28 +265,32 @@ def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dic
         important_words = [word for word in search_phrase.split() if len(word) > 3 or word.upper() in ["IPC", "FIR", "CrPC"]]
         search_phrase = " ".join(important_words[:8])  # Limit to 8 important terms
     
-    print(f"[DEBUG] Simplified search phrase: {search_phrase}")
-    url = f"https://indiankanoon.org/search/?formInput={requests.utils.quote(search_phrase)}"
+    logger.debug("Simplified search phrase: %s", search_phrase)
+    return search_phrase
+
+def search_kanoon(search_phrase: str, query: str = "", deadline: Optional[Deadline] = None) -> List[Dict]:
+    """Scrape Indian Kanoon for a search phrase, retrying with simpler terms; `query` drives the last-resort IPC search."""
+    import requests
+    url = f"{KANOON_SEARCH_URL}{quote(search_phrase)}"
     max_retries = 2
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-        "Accept-Language": "en-US,en;q=0.5",
-        "Connection": "keep-alive",
-        "Upgrade-Insecure-Requests": "1"
-    }
     for attempt in range(max_retries + 1):
+        if deadline is not None and deadline.expired:
+            logger.warning("Kanoon search skipped: request deadline exceeded")
+            return [{
+                "title": "Indian Kanoon is currently unavailable",
+                "url": "https://indiankanoon.org/",
+                "snippet": "Sorry, we could not retrieve case law results due to a timeout. Please try again later."
+            }]
         try:
-            print(f"[DEBUG] Fetching URL: {url}")
-            resp = requests.get(url, headers=headers, timeout=20)
-            print(f"[DEBUG] Response status code: {resp.status_code}")
-            print(f"[DEBUG] First 500 chars of response:\n{resp.text[:500]}")
+            logger.debug("Fetching URL: %s", url)
+            with span("scrape"):
+                resp = fetch_page(url, timeout=timeout_for(deadline, 20), refresh=attempt > 0)
+            logger.debug("Kanoon response", extra={"status": resp.status_code, "bytes": len(resp.content)})
             
             # Ensure we got a valid response
             if resp.status_code != 200 or not resp.text:
-                print(f"[DEBUG] Invalid response: status={resp.status_code}, content_length={len(resp.text)}")
-                if attempt < max_retries:
-                    time.sleep(2)
+                logger.warning("Invalid Kanoon response: status=%s, content_length=%d", resp.status_code, len(resp.text))
+                if attempt < max_retries and _retry_pause(deadline):
                     continue
                 else:
                     return [{
@@ -89,88 +299,17 @@ def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dic
                         "snippet": f"Sorry, we could not retrieve case law results. Status code: {resp.status_code}"
                     }]
             
-            soup = BeautifulSoup(resp.text, "html.parser")
-            
-            # Try the primary selector
-            case_elements = soup.select("div.result_title > a")
-            print(f"[DEBUG] Number of case elements found: {len(case_elements)}")
-            
-            # If no results, try alternative selectors
-            if len(case_elements) == 0:
-                print("[DEBUG] Looking for results with different selectors")
-                
-                # Check for result containers
-                result_divs = soup.select('div.result')
-                print(f"[DEBUG] Result divs found: {len(result_divs)}")
-                
-                if len(result_divs) > 0:
-                    # Extract case elements from result divs
-                    case_elements = []
-                    for div in result_divs:
-                        links = div.select('div.result_title > a')
-                        if links:
-                            case_elements.extend(links)
-                
-                # If still no results, try direct link selector
-                if len(case_elements) == 0:
-                    case_elements = soup.select('a[href*="/doc/"]')
-                    print(f"[DEBUG] Using doc links selector: {len(case_elements)} results")
-            
-            case_results = []
-            seen_titles = set()
-            seen_urls = set()
-            
-            for element in case_elements:
-                title = element.get_text(strip=True)
-                case_url = element.get("href")
-                if case_url and not case_url.startswith("http"):
-                    case_url = f"https://indiankanoon.org{case_url}"
-                
-                # Find snippet - look in parent result div
-                snippet = ""
-                parent_result = element.find_parent("div", class_="result")
-                if parent_result:
-                    headline = parent_result.select_one("div.headline")
-                    if headline:
-                        snippet = headline.get_text(strip=True)
-                
-                # Fall back to looking for snippet directly
-                if not snippet:
-                    snippet_element = None
-                    if element.find_parent("div", class_="result_title"):
-                        snippet_element = element.find_parent("div", class_="result_title").find_next_sibling("div", class_="snippet") or \
-                                          element.find_parent("div", class_="result_title").find_next_sibling("div", class_="headline")
-                    
-                    if snippet_element:
-                        snippet = snippet_element.get_text(strip=True)
-                    else:
-                        snippet = title
-                
-                # Filter out duplicate cases by title and URL
-                title_key = title.lower().replace("...", "").strip()
-                if title_key in seen_titles or (case_url and case_url in seen_urls):
-                    continue
-                
-                case_results.append({
-                    "title": title[:80],
-                    "url": case_url,
-                    "snippet": snippet[:250] if snippet else ""
-                })
-                seen_titles.add(title_key)
-                if case_url:
-                    seen_urls.add(case_url)
-                if len(case_results) == 3:
-                    break
+            with span("parse"):
+                case_results = run_cpu(parse_search_page, resp.content)
                     
             if case_results:
                 return case_results
             else:
-                if attempt < max_retries:
-                    time.sleep(2)
+                if attempt < max_retries and _retry_pause(deadline):
                     # If this is the last retry and we're using a complex search phrase
                     # Try with a simpler search query by extracting key terms
                     if attempt == max_retries - 1 and " " in search_phrase:
-                        print("[DEBUG] No results with complex query, trying with simpler keywords")
+                        logger.debug("No results with complex query, trying with simpler keywords")
                         # Extract key legal terms like IPC sections, Acts, etc.
                         key_terms = []
                         for word in search_phrase.split():
@@ -184,8 +323,8 @@ def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dic
                         # If we found key terms, retry with them
                         if key_terms:
                             simple_query = " ".join(key_terms[:5])  # Use top 5 key terms
-                            url = f"https://indiankanoon.org/search/?formInput={requests.utils.quote(simple_query)}"
-                            print(f"[DEBUG] Retrying with simplified query: {simple_query}")
+                            url = f"{KANOON_SEARCH_URL}{quote(simple_query)}"
+                            logger.debug("Retrying with simplified query: %s", simple_query)
                 else:
                     # Try one last desperate attempt with just the most important keywords
                     # This is outside the retry loop as a last resort
@@ -199,10 +338,11 @@ def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dic
                             ipc_terms = [word for word in original_query.split() if word.isdigit() and len(word) == 3]
                             if ipc_terms:
                                 last_query = f"IPC {ipc_terms[0]}"
-                                print(f"[DEBUG] Last resort query: {last_query}")
-                                last_url = f"https://indiankanoon.org/search/?formInput={requests.utils.quote(last_query)}"
-                                last_resp = requests.get(last_url, headers=headers, timeout=10)
+                                logger.debug("Last resort query: %s", last_query)
+                                last_url = f"{KANOON_SEARCH_URL}{quote(last_query)}"
+                                last_resp = fetch_page(last_url, timeout=timeout_for(deadline, 10))
                                 if last_resp.status_code == 200:
+                                    from bs4 import BeautifulSoup
                                     last_soup = BeautifulSoup(last_resp.text, "html.parser")
                                     last_elements = last_soup.select("div.result_title > a") or last_soup.select('a[href*="/doc/"]')
                                     if last_elements and len(last_elements) > 0:
@@ -218,7 +358,7 @@ def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dic
                                             "snippet": f"Related to {last_query}. Note: This result is based on simplified search terms."
                                         }]
                     except Exception as e:
-                        print(f"[DEBUG] Last resort search failed: {e}")
+                        logger.warning("Last resort search failed: %s", e)
                         
                     # If all else fails, return the standard error message
                     return [{
@@ -227,161 +367,48 @@ def fetch_kanoon_results(query: str, conversation_history: str = "") -> List[Dic
                         "snippet": "Sorry, we could not retrieve case law results at this time. Please try again later."
                     }]
         except requests.exceptions.Timeout:
-            print(f"Kanoon timeout on attempt {attempt+1}")
-            if attempt < max_retries:
-                time.sleep(2)
-            else:
+            logger.warning("Kanoon timeout on attempt %d", attempt + 1)
+            if attempt >= max_retries or not _retry_pause(deadline):
                 return [{
                     "title": "Indian Kanoon is currently unavailable",
                     "url": "https://indiankanoon.org/",
                     "snippet": "Sorry, we could not retrieve case law results due to a timeout. Please try again later."
                 }]
         except Exception as e:
-            print(f"Kanoon error: {e}")
+            logger.exception("Kanoon error: %s", e)
             return [{
                 "title": "Indian Kanoon is currently unavailable",
                 "url": "https://indiankanoon.org/",
                 "snippet": "Sorry, we could not retrieve case law results due to a technical error. Please try again later."
             }]
 
-def fetch_specific_case_from_kanoon(case_name: str) -> Dict:
+def fetch_specific_case_from_kanoon(case_name: str, deadline: Optional[Deadline] = None) -> Dict:
     """Search for a specific case name on Indian Kanoon and return the most relevant result."""
-    print(f"Searching for specific case: {case_name}")
+    logger.info("Searching for specific case: %s", case_name)
     try:
         search_query = f'"{case_name}"'
-        url = f"https://indiankanoon.org/search/?formInput={requests.utils.quote(search_query)}"
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.5",
-            "Connection": "keep-alive",
-            "Upgrade-Insecure-Requests": "1"
-        }
-        
-        print(f"[DEBUG] Fetching URL: {url}")
-        resp = requests.get(url, headers=headers, timeout=10)
-        print(f"[DEBUG] Response status code: {resp.status_code}")
-        print(f"[DEBUG] First 500 chars of response:\n{resp.text[:500]}")
-        
-        soup = BeautifulSoup(resp.text, "html.parser")
+        url = f"{KANOON_SEARCH_URL}{quote(search_query)}"
+        logger.debug("Fetching URL: %s", url)
+        with span("scrape"):
+            resp = fetch_page(url, timeout=timeout_for(deadline, 10))
+        logger.debug("Kanoon response", extra={"status": resp.status_code, "bytes": len(resp.content)})
         
-        # Try different selectors to find case elements
-        case_elements = soup.select("div.result_title > a")
-        print(f"[DEBUG] Number of case elements found: {len(case_elements)}")
+        with span("parse"):
+            results = run_cpu(parse_search_page, resp.content, 1)
         
-        # If no results with original selector, try alternative approaches
-        if len(case_elements) == 0:
-            # Try checking result divs first
-            result_divs = soup.select('div.result')
-            print(f"[DEBUG] Result divs found: {len(result_divs)}")
-            
-            if len(result_divs) > 0:
-                # Extract case elements from result divs
-                for div in result_divs:
-                    links = div.select('div.result_title > a')
-                    if links:
-                        case_elements = links
-                        break
-            
-            # If still no results, try direct link selector
-            if len(case_elements) == 0:
-                case_elements = soup.select('a[href*="/doc/"]')
-                print(f"[DEBUG] Using doc links selector: {len(case_elements)} results")
-        
-        if case_elements:
-            element = case_elements[0]
-            title = element.get_text(strip=True)
-            case_url = element.get("href")
-            if case_url and not case_url.startswith("http"):
-                case_url = f"https://indiankanoon.org{case_url}"
-            
-            # Find snippet - look in parent result div
-            snippet = ""
-            parent_result = element.find_parent("div", class_="result")
-            if parent_result:
-                headline = parent_result.select_one("div.headline")
-                if headline:
-                    snippet = headline.get_text(strip=True)
-            
-            # Fall back to looking for snippet directly
-            if not snippet:
-                snippet_element = None
-                if element.find_parent("div", class_="result_title"):
-                    snippet_element = element.find_parent("div", class_="result_title").find_next_sibling("div", class_="snippet") or \
-                                      element.find_parent("div", class_="result_title").find_next_sibling("div", class_="headline")
-                
-                if snippet_element:
-                    snippet = snippet_element.get_text(strip=True)
-                else:
-                    snippet = title
-            
-            return {
-                "title": title[:80],
-                "url": case_url,
-                "snippet": snippet[:250] if snippet else "",
-                "case_name": case_name
-            }
-        else:
+        if not results:
             # Try without quotes if no results found
-            url = f"https://indiankanoon.org/search/?formInput={requests.utils.quote(case_name)}"
-            print(f"[DEBUG] Trying without quotes. Fetching URL: {url}")
-            resp = requests.get(url, headers=headers, timeout=10)
-            print(f"[DEBUG] Response status code: {resp.status_code}")
+            url = f"{KANOON_SEARCH_URL}{quote(case_name)}"
+            logger.debug("Trying without quotes. Fetching URL: %s", url)
+            with span("scrape"):
+                resp = fetch_page(url, timeout=timeout_for(deadline, 10))
+            logger.debug("Kanoon response", extra={"status": resp.status_code, "bytes": len(resp.content)})
             
-            soup = BeautifulSoup(resp.text, "html.parser")
-            
-            # Try the same selector hierarchy as above
-            case_elements = soup.select("div.result_title > a")
-            print(f"[DEBUG] Number of case elements found: {len(case_elements)}")
-            
-            if len(case_elements) == 0:
-                # Try checking result divs first
-                result_divs = soup.select('div.result')
-                if result_divs:
-                    for div in result_divs:
-                        links = div.select('div.result_title > a')
-                        if links:
-                            case_elements = links
-                            break
-                
-                # If still no results, try direct link selector
-                if len(case_elements) == 0:
-                    case_elements = soup.select('a[href*="/doc/"]')
-                    print(f"[DEBUG] Using doc links selector: {len(case_elements)} results")
-            
-            if case_elements:
-                element = case_elements[0]
-                title = element.get_text(strip=True)
-                case_url = element.get("href")
-                if case_url and not case_url.startswith("http"):
-                    case_url = f"https://indiankanoon.org{case_url}"
-                
-                # Find snippet - look in parent result div
-                snippet = ""
-                parent_result = element.find_parent("div", class_="result")
-                if parent_result:
-                    headline = parent_result.select_one("div.headline")
-                    if headline:
-                        snippet = headline.get_text(strip=True)
-                
-                # Fall back to looking for snippet directly
-                if not snippet:
-                    snippet_element = None
-                    if element.find_parent("div", class_="result_title"):
-                        snippet_element = element.find_parent("div", class_="result_title").find_next_sibling("div", class_="snippet") or \
-                                          element.find_parent("div", class_="result_title").find_next_sibling("div", class_="headline")
-                    
-                    if snippet_element:
-                        snippet = snippet_element.get_text(strip=True)
-                    else:
-                        snippet = title
-                
-                return {
-                    "title": title[:80],
-                    "url": case_url,
-                    "snippet": snippet[:250] if snippet else "",
-                    "case_name": case_name
-                }
+            with span("parse"):
+                results = run_cpu(parse_search_page, resp.content, 1)
+        
+        if results:
+            return dict(results[0], case_name=case_name)
                 
         # If all attempts failed, return a fallback
         return {
@@ -391,7 +418,7 @@ def fetch_specific_case_from_kanoon(case_name: str) -> Dict:
             "case_name": case_name
         }
     except Exception as e:
-        print(f"Error searching for specific case: {e}")
+        logger.warning("Error searching for specific case: %s", e)
         return {
             "title": f"Case: {case_name}",
             "url": f"https://indiankanoon.org/search/?formInput={case_name.replace(' ', '+')}",
@@ -399,11 +426,11 @@ def fetch_specific_case_from_kanoon(case_name: str) -> Dict:
             "case_name": case_name
         }
 
-def fetch_cases_from_api_suggestions(api_response: str) -> List[Dict]:
+def fetch_cases_from_api_suggestions(api_response: str, deadline: Optional[Deadline] = None) -> List[Dict]:
     """Use extracted keywords to fetch top 3 cases from Indian Kanoon."""
     # Extract keywords from the API response
-    keywords = extract_keywords_from_conversation("", api_response)
-    print(f"[DEBUG] Extracted keywords for case search: {keywords}")
+    keywords = run_cpu(extract_keywords_from_conversation, "", api_response)
+    logger.debug("Extracted keywords for case search: %s", keywords)
     # Fetch top 3 cases using keyword search
-    results = fetch_kanoon_results(keywords)
+    results = fetch_kanoon_results(keywords, deadline=deadline)
     return results[:3]  # Return up to 3 results
@@ -0,0 +1,45 @@
+"""
+Production entry point: multiple workers, no reloader, app preloaded.
+
+    python serve.py
+
+Uses gunicorn with uvicorn workers and gunicorn.conf.py when gunicorn is
+installed; otherwise falls back to uvicorn's own process manager (which
+imports the app in each worker instead of preloading it). Settings come from
+HOST, PORT and NYAYADOOT_WORKERS. With more than one worker the workers share
+a cache database (utils/shared_cache.py) unless NYAYADOOT_SHARED_CACHE names
+another file.
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+
+
+def main():
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "8000"))
+    workers = int(os.getenv("NYAYADOOT_WORKERS", str(min(4, multiprocessing.cpu_count()))))
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    if workers > 1:
+        os.environ.setdefault("NYAYADOOT_SHARED_CACHE", os.path.join(tempfile.gettempdir(), f"nyayadoot-cache-{port}.sqlite3"))
+
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        import uvicorn
+        print("gunicorn not installed; starting uvicorn workers without preloading")
+        if workers == 1:
+            # A single worker can still import the app before serving
+            from main import app
+            uvicorn.run(app, host=host, port=port, log_level="warning")
+        else:
+            uvicorn.run("main:app", host=host, port=port, workers=workers, reload=False, log_level="warning")
+        return
+
+    sys.argv = ["gunicorn", "--config", "gunicorn.conf.py", "main:app"]
+    run()
+
+
+if __name__ == "__main__":
+    main()
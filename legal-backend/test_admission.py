@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from ai.gemini import GeminiScheduler
+from keywords.extractor import is_legal_query_local
+from utils.admission import (AdmissionController, DEFAULT_THRESHOLDS, Overloaded, at_least, get_tier,
+                             parse_thresholds)
+
+
+def test_parse_thresholds_overrides_defaults():
+    thresholds = parse_thresholds("no_scrape=4/1.5, reject=10")
+    assert thresholds["no_scrape"] == (4, 1.5)
+    # A missing wait keeps the default one
+    assert thresholds["reject"] == (10, DEFAULT_THRESHOLDS["reject"][1])
+    assert thresholds["cached_only"] == DEFAULT_THRESHOLDS["cached_only"]
+
+
+def test_parse_thresholds_ignores_unknown_and_malformed_items():
+    assert parse_thresholds("bogus=1/1,local_only=x/2") == DEFAULT_THRESHOLDS
+    assert parse_thresholds(None) == DEFAULT_THRESHOLDS
+    assert parse_thresholds(" OFF ") is None
+
+
+def _controller(wait=0.0, **overrides):
+    thresholds = dict(DEFAULT_THRESHOLDS, **overrides)
+    return AdmissionController(lambda: wait, thresholds, retry_after=7)
+
+
+@pytest.mark.parametrize("in_flight, wait, tier", [
+    (0, 0.0, "full"),
+    (16, 0.0, "no_scrape"),
+    (0, 4.0, "cached_only"),
+    (24, 9.0, "local_only"),
+    (0, 20.0, "reject"),
+])
+def test_choose_tier_takes_the_most_degraded_match(in_flight, wait, tier):
+    controller = _controller(wait)
+    controller.in_flight = in_flight
+    assert controller.choose_tier() == tier
+
+
+def test_disabled_controller_admits_everything_in_full():
+    controller = AdmissionController(lambda: 100.0, enabled=False)
+    controller.in_flight = 1000
+    with controller.admit() as tier:
+        assert tier == "full"
+
+
+def test_admit_sets_the_tier_for_the_block():
+    controller = _controller(wait=2.0)
+    assert get_tier() == "full"
+    with controller.admit() as tier:
+        assert tier == "no_scrape"
+        assert get_tier() == "no_scrape"
+        assert at_least("no_scrape") and not at_least("cached_only")
+        assert controller.in_flight == 1
+    assert get_tier() == "full"
+    assert controller.in_flight == 0
+
+
+def test_floor_only_degrades():
+    controller = _controller()
+    with controller.admit(floor="cached_only") as tier:
+        assert tier == "cached_only"
+    controller = _controller(wait=9.0)
+    with controller.admit(floor="no_scrape") as tier:
+        assert tier == "local_only"
+
+
+def test_reject_raises_overloaded_without_counting_the_turn():
+    controller = _controller(wait=30.0)
+    with pytest.raises(Overloaded) as raised:
+        with controller.admit():
+            pass
+    assert raised.value.retry_after == 7
+    assert controller.in_flight == 0
+
+
+def test_exception_restores_in_flight_and_tier():
+    controller = _controller(wait=4.0)
+    with pytest.raises(RuntimeError):
+        with controller.admit():
+            assert controller.in_flight == 1
+            raise RuntimeError("turn failed")
+    assert controller.in_flight == 0
+    assert get_tier() == "full"
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("my landlord won't return the deposit", True),
+    ("hello, how are you", False),
+    ("what is the weather today", False),
+    ("", True),
+    ("what can I do about my neighbour's construction", True),
+])
+def test_is_legal_query_local(query, expected):
+    assert is_legal_query_local(query) is expected
+
+
+def test_is_legal_query_local_follows_an_ongoing_conversation():
+    assert is_legal_query_local("thanks", conversation_history="User: my employer withheld my salary")
+
+
+def test_admission_recovers_once_queue_wait_decays():
+    # Shedding lets no calls through to report new waits; the average must still fall back
+    scheduler = GeminiScheduler(wait_half_life=0.05)
+    controller = AdmissionController(lambda: scheduler.recent_wait, dict(DEFAULT_THRESHOLDS))
+    for _ in range(30):
+        scheduler.note_wait(20.0)
+    with pytest.raises(Overloaded):
+        with controller.admit():
+            pass
+    time.sleep(0.6)
+    with controller.admit() as tier:
+        assert tier == "full"
+
+
+def test_recent_wait_counts_calls_still_queued():
+    scheduler = GeminiScheduler(initial_limit=1, min_limit=1, wait_half_life=0.05)
+    assert scheduler.acquire()
+    waiter = threading.Thread(target=scheduler.acquire)
+    waiter.start()
+    time.sleep(0.2)
+    # No wait has been reported yet, but the queued call's age counts
+    assert scheduler.recent_wait >= 0.15
+    scheduler.release(latency=0.1)
+    waiter.join(2)
+    scheduler.release(latency=0.1)
+    time.sleep(0.5)
+    assert scheduler.recent_wait < 0.05
@@ -1,4 +1,14 @@
-from scraping.kanoon import fetch_kanoon_results
+import os
+
+# Parser fixture test: by default this replays cassettes/kanoon_fixture.jsonl.gz,
+# which was built from kanoon_sample.html rather than recorded from the live
+# site, so it checks the parser against that saved page, not Kanoon's current
+# markup. NYAYADOOT_CASSETTE_MODE=off runs against the live services; =record
+# with NYAYADOOT_CASSETTE pointing at a new file captures a real recording.
+os.environ.setdefault("NYAYADOOT_CASSETTE_MODE", "replay")
+os.environ.setdefault("NYAYADOOT_CASSETTE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "kanoon_fixture.jsonl.gz"))
+
+from scraping.kanoon import fetch_kanoon_results, fetch_page, KANOON_SEARCH_URL
 import requests
 from bs4 import BeautifulSoup
 import time
@@ -10,12 +20,9 @@ def test_direct_search():
     query = "IPC 379"
     print(f"Searching for: '{query}'")
     
-    url = f"https://indiankanoon.org/search/?formInput={requests.utils.quote(query)}"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+    url = f"{KANOON_SEARCH_URL}{requests.utils.quote(query)}"
     
-    resp = requests.get(url, headers=headers, timeout=20)
+    resp = fetch_page(url, timeout=20)
     print(f"Response status code: {resp.status_code}")
     
     soup = BeautifulSoup(resp.text, "html.parser")
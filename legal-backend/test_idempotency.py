@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+from fastapi import Response
+
+from utils.idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+
+
+def _counting_work(result="answer", delay=0.0, error=None):
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return work, calls
+
+
+def test_completed_result_is_replayed():
+    async def scenario():
+        store = IdempotencyStore()
+        work, calls = _counting_work()
+        first = await store.run("k", fingerprint("q"), work)
+        second = await store.run("k", fingerprint("q"), work)
+        return first, second, len(calls)
+
+    assert asyncio.run(scenario()) == (("answer", "new"), ("answer", "replayed"), 1)
+
+
+def test_retry_joins_the_running_request():
+    async def scenario():
+        store = IdempotencyStore()
+        work, calls = _counting_work(delay=0.05)
+        results = await asyncio.gather(store.run("k", "f", work), store.run("k", "f", work))
+        return results, len(calls)
+
+    results, calls = asyncio.run(scenario())
+    assert results == [("answer", "new"), ("answer", "joined")]
+    assert calls == 1
+
+
+@pytest.mark.parametrize("running", [True, False])
+def test_key_reused_for_a_different_request_conflicts(running):
+    async def scenario():
+        store = IdempotencyStore()
+        work, _ = _counting_work(delay=0.05)
+        first = asyncio.ensure_future(store.run("k", fingerprint("q1"), work))
+        if not running:
+            await first
+        else:
+            await asyncio.sleep(0)
+        with pytest.raises(IdempotencyConflict):
+            await store.run("k", fingerprint("q2"), work)
+        return await first
+
+    assert asyncio.run(scenario()) == ("answer", "new")
+
+
+def test_failures_are_not_cached():
+    async def scenario():
+        store = IdempotencyStore()
+        failing, _ = _counting_work(error=RuntimeError("boom"))
+        with pytest.raises(RuntimeError):
+            await store.run("k", "f", failing)
+        work, calls = _counting_work()
+        return await store.run("k", "f", work), len(calls), len(store)
+
+    assert asyncio.run(scenario()) == (("answer", "new"), 1, 1)
+
+
+def test_cancelled_caller_does_not_cancel_the_shared_work():
+    async def scenario():
+        store = IdempotencyStore()
+        work, calls = _counting_work(delay=0.05)
+        first = asyncio.ensure_future(store.run("k", "f", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        # The client gave up and retried with the same key
+        retry = await store.run("k", "f", work)
+        return first.cancelled(), retry, len(calls)
+
+    assert asyncio.run(scenario()) == (True, ("answer", "joined"), 1)
+
+
+def test_router_ignores_keys_without_a_session(monkeypatch):
+    from api import router
+    from api.router import QueryRequest
+
+    calls = []
+
+    async def fake_answer(request):
+        calls.append(request.session_id)
+        return f"answer for {request.session_id}"
+
+    monkeypatch.setattr(router, "traced_answer", fake_answer)
+    monkeypatch.setattr(router, "idempotency", IdempotencyStore())
+
+    async def scenario():
+        anonymous = [await router.process_query(QueryRequest(query="q", idempotency_key="same"), Response())
+                     for _ in range(2)]
+        response = Response()
+        sessions = [await router.process_query(QueryRequest(query="q", session_id=sid, idempotency_key="same"),
+                                               response) for sid in ("a", "b", "a")]
+        return anonymous, sessions, response
+
+    anonymous, sessions, response = asyncio.run(scenario())
+    assert anonymous == ["answer for None", "answer for None"]
+    # The same key in another session is a different request; only the retry in "a" is replayed
+    assert sessions == ["answer for a", "answer for b", "answer for a"]
+    assert calls == [None, None, "a", "b"]
+    assert response.headers["Idempotent-Replayed"] == "true"
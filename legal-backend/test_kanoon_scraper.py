@@ -1,3 +1,13 @@
+import os
+
+# Parser fixture test: by default this replays cassettes/kanoon_fixture.jsonl.gz,
+# which was built from kanoon_sample.html rather than recorded from the live
+# site, so it checks the parser against that saved page, not Kanoon's current
+# markup. NYAYADOOT_CASSETTE_MODE=off runs against the live services; =record
+# with NYAYADOOT_CASSETTE pointing at a new file captures a real recording.
+os.environ.setdefault("NYAYADOOT_CASSETTE_MODE", "replay")
+os.environ.setdefault("NYAYADOOT_CASSETTE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "kanoon_fixture.jsonl.gz"))
+
 from scraping.kanoon import fetch_kanoon_results
 from ai.gemini import generate_with_gemini
 
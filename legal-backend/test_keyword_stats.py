@@ -0,0 +1,68 @@
+import random
+from collections import Counter
+
+import pytest
+
+from conversation.state import ConversationState
+from keywords.extractor import LEGAL_TERMS, MAX_KEYWORDS, STOPWORDS, TOP_WORDS, KeywordStats
+
+# Few enough words that counts tie often; includes stopwords, short words and legal terms
+VOCABULARY = ["tenant", "landlord", "deposit", "notice", "rent", "police", "fir", "theft", "bail", "salary",
+              "employer", "wages", "refund", "the", "and", "is", "an", "of", "it", "contract", "court",
+              "section", "act", "lawful", "rights", "judgment", "Deposit", "NOTICE"]
+
+
+def _recount(messages, query):
+    """The whole conversation and the query counted in one go, as before the stats were kept."""
+    text = " ".join(messages + [query]).lower()
+    counts = Counter(word for word in text.split() if word not in STOPWORDS and len(word) > 2)
+    common = [word for word, count in counts.most_common(TOP_WORDS) if count > 1]
+    legal = [term for term in LEGAL_TERMS if term in text]
+    return list(dict.fromkeys(legal + common))[:MAX_KEYWORDS]
+
+
+def _message(rng):
+    return " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(0, 12)))
+
+
+def test_running_stats_match_a_full_recount():
+    rng = random.Random(11)
+    for _ in range(300):
+        stats, messages = KeywordStats(), []
+        for _ in range(rng.randint(0, 12)):
+            message = _message(rng)
+            stats.add(message)
+            messages.append(message)
+            query = _message(rng)
+            assert stats.keywords(query) == _recount(messages, query)
+
+
+def test_ties_go_to_the_word_seen_first():
+    stats = KeywordStats()
+    messages = ["zebra yak xenon", "xenon yak zebra", " ".join(f"word{i} word{i}" for i in range(12))]
+    for message in messages:
+        stats.add(message)
+    assert stats.keywords() == _recount(messages, "")
+    assert stats.keywords()[:3] == ["zebra", "yak", "xenon"]
+
+
+def test_query_only_words_count_without_being_added():
+    stats = KeywordStats()
+    stats.add("my landlord kept the deposit")
+    # "eviction" is only in the query, but twice; "landlord" reaches two with the query's help
+    assert stats.keywords("eviction eviction landlord court") == ["court", "landlord", "eviction"]
+    assert stats.keywords() == []
+    assert stats.keywords("eviction eviction landlord court") == _recount(["my landlord kept the deposit"],
+                                                                         "eviction eviction landlord court")
+
+
+@pytest.mark.parametrize("query", ["", "deposit refund", "court section act"])
+def test_session_keywords_cover_the_whole_session(query):
+    state = ConversationState()
+    messages = []
+    for turn in range(15):
+        question, answer = f"deposit refund turn{turn}", f"landlord notice turn{turn} tenant"
+        state.update("s", question, answer, [], [])
+        messages += [question, answer]
+    # Turns older than the rendered history window still count
+    assert state.get_keywords("s", query) == _recount(messages, query)
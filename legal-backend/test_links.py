@@ -0,0 +1,63 @@
+from ai.links import append_missing_citations, canonical_kanoon_url, repair_case_links
+
+KNOWN = [
+    ("Lalita Kumari vs Govt. Of U.P.", "https://indiankanoon.org/doc/10000/"),
+    ("State of Maharashtra vs Ramesh", "https://indiankanoon.org/doc/20000/"),
+]
+
+
+def test_completes_a_link_cut_inside_its_url():
+    answer, unresolved = repair_case_links("See [Lalita Kumari vs Govt. Of U.P.](https://indiankanoon.org/do", KNOWN)
+    assert answer == "See [Lalita Kumari vs Govt. Of U.P.](https://indiankanoon.org/doc/10000/)"
+    assert unresolved == 0
+
+
+def test_completes_a_link_cut_inside_its_name():
+    answer, unresolved = repair_case_links("See [State of Mahar", KNOWN)
+    assert answer == "See [State of Maharashtra vs Ramesh](https://indiankanoon.org/doc/20000/)"
+    assert unresolved == 0
+
+
+def test_unknown_cut_url_is_reduced_to_text_and_counted():
+    answer, unresolved = repair_case_links("See [Ram v Shyam](https://indiankanoon.org/doc/99", [])
+    assert answer == "See Ram v Shyam"
+    assert unresolved == 1
+
+
+def test_brackets_without_a_url_are_left_alone():
+    for text in ("Under Section 379 [IPC", "Cite [Ram v Shyam]", "Cite [Ram v Shyam] and more"):
+        assert repair_case_links(text, []) == (text, 0)
+        assert repair_case_links(text, KNOWN)[1] == 0
+
+
+def test_repairs_mangled_kanoon_urls():
+    answer, _ = repair_case_links("[Lalita Kumari](indiankanoon.org/doc/10000)", KNOWN)
+    assert answer == "[Lalita Kumari](https://indiankanoon.org/doc/10000/)"
+    answer, _ = repair_case_links("[State of Maharashtra vs Ramesh](https://indiankanoon.org/doc/2000)", KNOWN)
+    assert answer == "[State of Maharashtra vs Ramesh](https://indiankanoon.org/doc/20000/)"
+    # Unknown cases are only normalised
+    answer, _ = repair_case_links("[Other](http://www.indiankanoon.org/docfragment/555/?q=x)", KNOWN)
+    assert answer == "[Other](https://indiankanoon.org/doc/555/)"
+
+
+def test_complete_links_and_other_urls_are_untouched():
+    text = "[Lalita Kumari vs Govt. Of U.P.](https://indiankanoon.org/doc/10000/) and [Act](https://example.org/act)"
+    assert repair_case_links(text, KNOWN) == (text, 0)
+
+
+def test_canonical_kanoon_url():
+    assert canonical_kanoon_url("indiankanoon.org/doc/42") == "https://indiankanoon.org/doc/42/"
+    assert canonical_kanoon_url("https://example.org/x") == "https://example.org/x"
+
+
+def test_append_missing_citations_lists_only_uncited_cases():
+    answer = append_missing_citations("Read [Lalita Kumari](https://indiankanoon.org/doc/10000/).", KNOWN)
+    assert answer.endswith("\n\nRelevant cases:\n- [State of Maharashtra vs Ramesh](https://indiankanoon.org/doc/20000/)")
+    assert answer.count("doc/10000") == 1
+
+
+def test_append_missing_citations_leaves_fully_cited_or_caseless_answers():
+    cited = "[a](https://indiankanoon.org/doc/10000/) [b](https://indiankanoon.org/doc/20000/)"
+    assert append_missing_citations(cited, KNOWN) == cited
+    assert append_missing_citations("No cases here.", []) == "No cases here."
+    assert append_missing_citations("", KNOWN) == ""
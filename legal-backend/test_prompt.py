@@ -0,0 +1,106 @@
+import random
+import re
+import string
+
+import pytest
+
+from ai.prompt import (_fit, build_answer_prompt, count_tokens, fit_prompt, truncate_to_tokens, PromptBuilder,
+                       _TRIM_MARKER)
+from benchmarks.fixtures import CONTEXT, HISTORY, JUDGMENT, QUERY
+
+TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+
+def _texts(count=500, seed=7):
+    rng = random.Random(seed)
+    alphabet = string.ascii_letters + string.digits + string.punctuation + "    \n\t_"
+    for _ in range(count):
+        yield "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 400)))
+
+
+def test_ascii_count_matches_the_token_regex():
+    for text in [CONTEXT, HISTORY, JUDGMENT, QUERY, "\x00\x1c\x1f", *_texts()]:
+        assert count_tokens(text) == len(TOKEN_RE.findall(text))
+
+
+def test_non_ascii_text_is_counted_with_the_regex():
+    text = "धारा 379 के तहत चोरी — ₹5,000 का जुर्माना"
+    assert count_tokens(text) == len(TOKEN_RE.findall(text))
+
+
+@pytest.mark.parametrize("keep", ["head", "tail", "both"])
+def test_fit_stays_within_budget_and_reports_its_count(keep):
+    for text in [CONTEXT, HISTORY, JUDGMENT, *_texts(200)]:
+        for budget in (1, 7, 50, 300):
+            fitted, used = _fit(text, budget, keep)
+            assert used == count_tokens(fitted)
+            assert used <= budget
+            if count_tokens(text) <= budget:
+                assert fitted == text
+
+
+def test_head_cut_stays_inside_a_long_first_line():
+    text = "Relevant case: " + " ".join(f"word{i}" for i in range(400)) + "\nsecond line"
+    fitted = truncate_to_tokens(text, 100)
+    assert fitted.startswith("Relevant case: word0")
+    # Nearly the whole budget is used rather than falling back to an empty line
+    assert count_tokens(fitted) >= 95
+    assert not fitted.endswith("wor")
+
+
+def test_head_and_tail_cut_between_words():
+    text = "alpha " + "abcdefghijklmnop " * 50 + "omega"
+    assert truncate_to_tokens(text, 10).split()[-1] == "abcdefghijklmnop"
+    assert truncate_to_tokens(text, 10, keep="tail").split()[0] == "abcdefghijklmnop"
+    assert truncate_to_tokens(text, 10, keep="tail").endswith("omega")
+
+
+def test_both_keeps_the_ends_around_a_marker():
+    fitted = fit_prompt(JUDGMENT, budget=200)
+    assert fitted.startswith(JUDGMENT[:20])
+    assert _TRIM_MARKER in fitted
+    assert fitted.rstrip().endswith(JUDGMENT.rstrip()[-20:])
+
+
+def test_builder_fills_sections_in_priority_order():
+    builder = PromptBuilder(total_budget=60)
+    builder.add("low", "filler " * 100, priority=2, keep="tail", header="Old:")
+    builder.add("high", "keep this", priority=0)
+    prompt = builder.build()
+    assert prompt.startswith("Old:\n")
+    assert prompt.endswith("keep this")
+    assert builder.tokens_used == count_tokens(prompt)
+    assert builder.tokens_used <= 60
+    assert builder.stats["low"]["trimmed"] and not builder.stats["high"]["trimmed"]
+
+
+@pytest.mark.parametrize("context, history", [("", ""), (CONTEXT, HISTORY), (JUDGMENT, HISTORY)])
+def test_answer_prompt_keeps_question_and_case_links(context, history):
+    prompt, links = build_answer_prompt(QUERY, context, history)
+    assert f"Question: {QUERY}" in prompt
+    for name, url in links:
+        assert f"[{name}]({url})" in prompt
+    assert count_tokens(prompt) <= 1200
+
+
+def _linked_context(count):
+    return "\n".join(f"- [State of Maharashtra v. Accused Person Number {i}](https://indiankanoon.org/doc/100000{i}/): "
+                     + "the court considered the evidence at length " * 5 for i in range(count))
+
+
+def test_answer_prompt_keeps_every_case_link_whole():
+    prompt, links = build_answer_prompt(QUERY, _linked_context(8), HISTORY)
+    assert len(links) == 8
+    citations = prompt.split("IMPORTANT: Include these case references with exact URLs:\n")[1]
+    for name, url in links:
+        assert f"- [{name}]({url})" in citations
+
+
+def test_citations_only_lose_whole_links_when_the_prompt_is_full():
+    prompt, links = build_answer_prompt(QUERY, _linked_context(40), HISTORY, budget=500)
+    assert count_tokens(prompt) <= 500
+    citations = prompt.split("IMPORTANT: Include these case references with exact URLs:\n")[1]
+    lines = [line for line in citations.split("\n\n")[0].split("\n") if line]
+    assert 0 < len(lines) < len(links)
+    for line, (name, url) in zip(lines, links):
+        assert line == f"- [{name}]({url})"
@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import sqlite3
+import time
+
+import pytest
+
+from utils import shared_cache
+from utils.shared_cache import SharedCache
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "shared.db")
+
+
+def _pair(path, **kwargs):
+    """Two caches with the same name and database, standing in for two workers."""
+    return SharedCache("test", path=path, **kwargs), SharedCache("test", path=path, **kwargs)
+
+
+def _rows(path, name="test"):
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM entries WHERE cache = ?", (name,)).fetchone()[0]
+
+
+def test_value_written_by_one_worker_is_read_by_another(db_path):
+    first, second = _pair(db_path)
+    first.set("k", {"cases": [1, 2]})
+    assert len(second) == 0
+    assert second.get("k") == {"cases": [1, 2]}
+    # The L2 hit is kept in the reader's L1
+    assert len(second) == 1
+
+
+def test_local_only_values_stay_in_l1(db_path):
+    first, second = _pair(db_path)
+    first.set("k", "mine", local_only=True)
+    assert first.get("k") == "mine"
+    assert second.get("k") is None
+    assert second.get("k", "default") == "default"
+
+
+def test_pop_and_clear_reach_both_tiers(db_path):
+    first, second = _pair(db_path)
+    first.set("a", 1)
+    first.set("b", 2)
+    assert second.pop("a") is None
+    assert first.get("a") == 1  # still in the first worker's L1
+    assert SharedCache("test", path=db_path).get("a") is None
+    second.clear()
+    assert SharedCache("test", path=db_path).get("b") is None
+
+
+def test_caches_with_different_names_do_not_share_keys(db_path):
+    SharedCache("one", path=db_path).set("k", 1)
+    assert SharedCache("two", path=db_path).get("k") is None
+
+
+def test_expired_entries_are_misses(db_path):
+    first, second = _pair(db_path)
+    first.set("k", "soon gone", ttl=0.05)
+    time.sleep(0.1)
+    assert first.get("k") is None
+    assert second.get("k") is None
+
+
+def test_l1_copy_expires_with_the_shared_entry(db_path):
+    first, second = _pair(db_path, ttl=60)
+    first.set("k", "v", ttl=0.2)
+    assert second.get("k") == "v"
+    time.sleep(0.3)
+    assert second.get("k") is None
+
+
+def test_prune_drops_expired_rows_then_keeps_the_latest_expiring(db_path):
+    cache = SharedCache("test", path=db_path, l2_maxsize=3)
+    cache.set("expired", 0, ttl=0.01)
+    for i in range(5):
+        cache.set(f"k{i}", i, ttl=100 + i)
+    time.sleep(0.02)
+    cache.prune()
+    assert _rows(db_path) == 3
+    reader = SharedCache("test", path=db_path)
+    assert [reader.get(f"k{i}") for i in range(5)] == [None, None, 2, 3, 4]
+    assert reader.get("expired") is None
+
+
+def test_writes_prune_periodically(db_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, "PRUNE_EVERY", 5)
+    cache = SharedCache("test", path=db_path, l2_maxsize=2)
+    for i in range(5):
+        cache.set(f"k{i}", i)
+    assert _rows(db_path) == 2
+
+
+def _read_in_child(path, queue):
+    queue.put(SharedCache("test", path=path).get("k"))
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_forked_worker_opens_its_own_connection(db_path):
+    cache = SharedCache("test", path=db_path)
+    cache.set("k", "from parent")
+    parent_connection = shared_cache._connect(db_path)
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    child = context.Process(target=_read_in_child, args=(db_path, queue))
+    child.start()
+    assert queue.get(timeout=10) == "from parent"
+    child.join(10)
+    assert child.exitcode == 0
+    # The parent's connection is untouched and still usable
+    assert shared_cache._connect(db_path) is parent_connection
+    assert SharedCache("test", path=db_path).get("k") == "from parent"
+
+
+def test_connection_is_reopened_when_the_pid_changes(db_path, monkeypatch):
+    connection = shared_cache._connect(db_path)
+    monkeypatch.setattr(os, "getpid", lambda: -1)
+    assert shared_cache._connect(db_path) is not connection
+
+
+def test_sqlite_errors_are_misses(tmp_path):
+    # A directory can't be opened as a database
+    cache = SharedCache("test", path=str(tmp_path))
+    errors = shared_cache.cache_errors.value(cache="test")
+    cache.set("k", "v")
+    assert cache.get("k") == "v"  # served from L1
+    assert SharedCache("test", path=str(tmp_path)).get("k") is None
+    cache.pop("k")
+    cache.prune()
+    cache.clear()
+    assert shared_cache.cache_errors.value(cache="test") > errors
+
+
+def test_undecodable_entries_are_misses(db_path):
+    SharedCache("test", path=db_path, encode=lambda value: value).set("k", "not json{")
+    assert SharedCache("test", path=db_path).get("k", "default") == "default"
+
+
+def test_without_a_path_it_is_just_l1():
+    cache = SharedCache("test", path=None)
+    cache.set("k", 1)
+    assert cache.get("k") == 1
+    assert SharedCache("test", path=None).get("k") is None
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from utils.singleflight import SingleFlight, Abandoned, FlightTimeout
+
+
+def _start(fn, *args):
+    """Run fn in a thread; returns (thread, outcome dict with 'result' or 'error')."""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = fn(*args)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread, outcome
+
+
+def _wait_for_followers(flight, count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while flight.followers < count and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert flight.followers >= count
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight("test_share")
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        release.wait(2)
+        return "answer"
+
+    threads = [_start(flight.do, "k", work) for _ in range(5)]
+    _wait_for_followers(flight, 4)
+    release.set()
+    for thread, _ in threads:
+        thread.join(2)
+    assert [outcome["result"] for _, outcome in threads] == ["answer"] * 5
+    assert len(calls) == 1
+    assert flight.leaders == 1 and flight.followers == 4
+
+
+def test_leader_exception_reaches_followers():
+    flight = SingleFlight("test_error")
+    release = threading.Event()
+
+    def work():
+        release.wait(2)
+        raise ValueError("boom")
+
+    threads = [_start(flight.do, "k", work) for _ in range(3)]
+    _wait_for_followers(flight, 2)
+    release.set()
+    for thread, _ in threads:
+        thread.join(2)
+    errors = [outcome.get("error") for _, outcome in threads]
+    assert all(isinstance(e, ValueError) and str(e) == "boom" for e in errors)
+
+
+@pytest.mark.parametrize("failure", [Abandoned("deadline"), KeyboardInterrupt()])
+def test_follower_retries_when_leader_gives_up(failure):
+    flight = SingleFlight("test_retry")
+    leader_running = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            leader_running.set()
+            release.wait(2)
+            raise failure
+        return "retried"
+
+    leader, leader_outcome = _start(flight.do, "k", work)
+    assert leader_running.wait(2)
+    follower, follower_outcome = _start(flight.do, "k", work)
+    _wait_for_followers(flight, 1)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+    assert type(leader_outcome["error"]) is type(failure)
+    assert follower_outcome == {"result": "retried"}
+    assert len(calls) == 2
+    assert flight.leaders == 2
+
+
+def test_follower_timeout_leaves_leader_running():
+    flight = SingleFlight("test_timeout")
+    release = threading.Event()
+
+    def work():
+        release.wait(2)
+        return "late"
+
+    leader, leader_outcome = _start(flight.do, "k", work)
+    while len(flight) == 0:
+        time.sleep(0.005)
+    with pytest.raises(FlightTimeout):
+        flight.do("k", work, wait_timeout=0.05)
+    assert leader.is_alive()
+    assert len(flight) == 1
+    release.set()
+    leader.join(2)
+    assert leader_outcome == {"result": "late"}
+
+
+def test_key_is_forgotten_after_completion():
+    flight = SingleFlight("test_cleanup")
+    assert flight.do("k", lambda: 1) == 1
+    assert len(flight) == 0
+    with pytest.raises(RuntimeError):
+        flight.do("k", _raise)
+    assert len(flight) == 0
+    # A later call runs again instead of reusing the earlier result
+    assert flight.do("k", lambda: 2) == 2
+    assert flight.leaders == 3 and flight.followers == 0
+
+
+def _raise():
+    raise RuntimeError("fails")
@@ -0,0 +1 @@
+# Initialize the tools package
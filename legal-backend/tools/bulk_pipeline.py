@@ -0,0 +1,270 @@
+"""
+Run many queries through the section, case and answer stages without the web server.
+
+Reads JSON lines from the input (objects with a "query" and optional "id" and
+"history", or bare strings) and writes one JSON line per input line, in input
+order, with the sections, cases and answer for that query or an "error".
+
+Work runs on a thread pool with at most --concurrency queries in flight, and
+only a fixed window of queries is held in memory at once, so memory use does
+not grow with the input. Every --checkpoint-every results the output is flushed
+and the input offset reached is written next to the output file; rerunning the
+same command after a crash resumes from there (output written after the last
+checkpoint is discarded and redone).
+
+Run from the legal-backend directory:
+    python -m tools.bulk_pipeline queries.jsonl results.jsonl --concurrency 8
+    python -m tools.bulk_pipeline queries.jsonl results.jsonl --stages sections,cases
+    python -m tools.bulk_pipeline queries.jsonl results.jsonl --fake-backends   # no network, for dry runs
+
+With NYAYADOOT_CASSETTE_MODE=record the run also records every Gemini call and
+Kanoon page into a cassette that can later warm a server's caches.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+STAGES = ("sections", "cases", "answer")
+
+# Seconds of each query's budget kept back for answer generation, as in the router
+ANSWER_RESERVE_SECONDS = 8
+
+
+def parse_line(line: bytes) -> Dict:
+    """The query record on one input line."""
+    record = json.loads(line)
+    if isinstance(record, str):
+        record = {"query": record}
+    if not isinstance(record, dict) or not str(record.get("query", "")).strip():
+        raise ValueError("expected a JSON string or an object with a non-empty \"query\"")
+    return record
+
+
+def build_context(references: List[Dict], cases: List[Dict]) -> str:
+    lines = []
+    if references:
+        lines.append("Relevant legal provisions:")
+        lines += [f"- {ref['act']} Section {ref['section_number']}: {ref['summary']}" for ref in references]
+    if cases:
+        lines.append("Relevant cases:")
+        lines += [f"- {case.get('title', 'Untitled Case')}: {case.get('snippet', '')[:100]}...\n  URL: {case.get('url', '')}"
+                  for case in cases[:2]]
+    return "\n".join(lines)
+
+
+def process_record(record: Dict, stages: List[str], budget: float) -> Dict:
+    """Run the selected stages for one query."""
+    from ai.gemini import generate_direct_answer
+    from retrieval.section import find_relevant_sections
+    from scraping.kanoon import fetch_kanoon_results
+    from utils.deadline import Deadline
+    from utils.sanitize import sanitize_query
+
+    query = sanitize_query(str(record["query"]))
+    history = record.get("history") or ""
+    deadline = Deadline(budget)
+    retrieval_deadline = deadline.reserve(ANSWER_RESERVE_SECONDS) if "answer" in stages else deadline
+    result: Dict = {}
+    if "sections" in stages:
+        result["sections"] = find_relevant_sections(query, history, retrieval_deadline)
+    if "cases" in stages:
+        result["cases"] = fetch_kanoon_results(query, history, retrieval_deadline)
+    if "answer" in stages:
+        cases = result.get("cases", [])
+        prompt = (f"Based on the user's query: '{query}', provide concise legal information using these legal "
+                  f"provisions and cases as context. Explain how they're relevant to the situation described.")
+        result["answer"] = generate_direct_answer(prompt, build_context(result.get("sections", []), cases), history,
+                                                  is_followup=True, cases=cases[:2] or None, deadline=deadline)
+    return result
+
+
+def run_item(line_no: int, line: bytes, stages: List[str], budget: float) -> Dict:
+    start = time.perf_counter()
+    output: Dict = {"line": line_no}
+    try:
+        record = parse_line(line)
+        output.update(id=record.get("id"), query=record["query"])
+        output.update(process_record(record, stages, budget))
+    except Exception as e:
+        output["error"] = f"{type(e).__name__}: {e}"
+    output["seconds"] = round(time.perf_counter() - start, 3)
+    return output
+
+
+class Checkpoint:
+    """Input offset and output size reached, stored as JSON next to the output file."""
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, state: Dict):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+class Progress:
+    """Throughput reporting to stderr every `interval` seconds."""
+    def __init__(self, interval: float, already_done: int = 0):
+        self.interval = interval
+        self.start = self.last = time.monotonic()
+        self.done = self.errors = 0
+        self.already_done = already_done
+        self.done_at_last = 0
+
+    def add(self, result: Dict):
+        self.done += 1
+        self.errors += "error" in result
+        now = time.monotonic()
+        if self.interval and now - self.last >= self.interval:
+            recent = (self.done - self.done_at_last) / (now - self.last)
+            print(f"{self.already_done + self.done} lines  {self.errors} errors  "
+                  f"{recent:.1f} q/s now  {self.rate():.1f} q/s overall", file=sys.stderr)
+            self.last, self.done_at_last = now, self.done
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.start
+        return self.done / elapsed if elapsed else 0.0
+
+
+def run(input_path: str, output_path: str, stages: List[str], concurrency: int = 4, budget: float = 60.0,
+        checkpoint_every: int = 50, progress_interval: float = 10.0, restart: bool = False,
+        limit: Optional[int] = None) -> Dict:
+    """Process the input file into the output file, resuming from a checkpoint if there is one."""
+    checkpoint = Checkpoint(f"{output_path}.checkpoint")
+    state = None if restart else checkpoint.load()
+    if state is not None and state.get("input") != os.path.abspath(input_path):
+        raise SystemExit(f"{checkpoint.path} belongs to {state.get('input')}; use --restart to start over")
+    if state is None:
+        state = {"input": os.path.abspath(input_path), "offset": 0, "lines": 0, "output_bytes": 0, "errors": 0}
+    elif state.get("done"):
+        print(f"{input_path} was already fully processed ({state['lines']} lines); use --restart to redo it",
+              file=sys.stderr)
+        return state
+    else:
+        # Truncating a deleted, rotated or replaced output to the checkpointed
+        # size would pad it with NULs instead of keeping the finished results
+        size = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+        if size < state["output_bytes"]:
+            raise SystemExit(f"{output_path} has {size} bytes but its checkpoint expects at least "
+                             f"{state['output_bytes']}; use --restart to start over")
+        print(f"Resuming at line {state['lines']} (byte {state['offset']})", file=sys.stderr)
+
+    # At most this many queries are read ahead of the oldest unfinished one
+    window_size = concurrency * 4
+    window: deque = deque()
+    progress = Progress(progress_interval, state["lines"])
+    since_checkpoint = 0
+
+    with open(input_path, "rb") as src, open(output_path, "ab") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bulk") as pool:
+        # Drop anything written after the last checkpoint; it is redone below
+        out.truncate(state["output_bytes"])
+        out.seek(state["output_bytes"])
+        src.seek(state["offset"])
+        line_no = state["lines"]
+        submitted = 0
+        exhausted = False
+
+        while window or not exhausted:
+            while not exhausted and len(window) < window_size:
+                line = src.readline()
+                if not line or (limit is not None and submitted >= limit):
+                    exhausted = True
+                    break
+                line_no += 1
+                offset = src.tell()
+                if not line.strip():
+                    window.append((None, offset, line_no))
+                    continue
+                window.append((pool.submit(run_item, line_no, line, stages, budget), offset, line_no))
+                submitted += 1
+            if not window:
+                break
+
+            future, offset, done_line = window.popleft()
+            if future is not None:
+                result = future.result()
+                out.write(json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n")
+                progress.add(result)
+                state["errors"] += "error" in result
+                since_checkpoint += 1
+            state.update(offset=offset, lines=done_line)
+            if since_checkpoint >= checkpoint_every:
+                out.flush()
+                os.fsync(out.fileno())
+                checkpoint.save(dict(state, output_bytes=out.tell()))
+                since_checkpoint = 0
+
+        out.flush()
+        os.fsync(out.fileno())
+        state.update(output_bytes=out.tell(), done=not (limit is not None and src.readline()))
+        checkpoint.save(state)
+
+    print(f"{progress.done} queries in {time.monotonic() - progress.start:.1f}s "
+          f"({progress.rate():.2f} q/s), {progress.errors} errors; {state['lines']} lines done in total",
+          file=sys.stderr)
+    return state
+
+
+def install_fake_backends(seed: Optional[int] = None):
+    """Answer Gemini and Kanoon calls locally, as the load test does."""
+    from loadtest.fake_kanoon import start_fake_kanoon
+    kanoon = start_fake_kanoon(latency=0.05, seed=seed)
+    os.environ["KANOON_BASE_URL"] = kanoon.base_url
+    from ai.gemini import set_backend
+    from loadtest.fake_gemini import FakeGemini
+    set_backend(FakeGemini(latency_scale=0.1, seed=seed))
+    return kanoon
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run queries from a JSONL file through the pipeline stages")
+    parser.add_argument("input", help="JSONL file of queries")
+    parser.add_argument("output", help="JSONL results file (a .checkpoint file is kept beside it)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--concurrency", type=int, default=4, help="queries in flight")
+    parser.add_argument("--budget", type=float, default=60.0, help="time budget per query in seconds")
+    parser.add_argument("--checkpoint-every", type=int, default=50, help="results between checkpoints")
+    parser.add_argument("--progress", type=float, default=10.0, help="seconds between throughput reports (0: off)")
+    parser.add_argument("--limit", type=int, help="stop after this many queries")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start from the beginning")
+    parser.add_argument("--fake-backends", action="store_true", help="use the load test's fake Gemini and Kanoon")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    from dotenv import load_dotenv
+    from utils.log import setup_logging
+    load_dotenv()
+    os.environ.setdefault("NYAYADOOT_LOG_LEVEL", "WARNING")
+    setup_logging(stream=sys.stderr)
+    kanoon = install_fake_backends(args.seed) if args.fake_backends else None
+    try:
+        run(args.input, args.output, stages, max(1, args.concurrency), args.budget, max(1, args.checkpoint_every),
+            args.progress, args.restart, args.limit)
+    finally:
+        if kanoon is not None:
+            kanoon.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
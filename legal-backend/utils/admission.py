@@ -0,0 +1,128 @@
+"""
+Admission control with tiered load shedding for the query pipeline.
+
+Each turn is admitted at a service tier chosen from the turns already in
+flight in this worker and the recent Gemini queue wait. Past each tier's
+threshold the pipeline gives up more of its external work:
+
+    full         everything
+    no_scrape    no live Kanoon requests; cases come from the session, prefetch or page cache
+    cached_only  also no Gemini calls for retrieval (sections, search phrases); only
+                 data already in the session or caches is used
+    local_only   also classifies queries locally, leaving only the answer call
+    reject       503 with Retry-After
+
+Thresholds are "in-flight turns / queue wait seconds" per tier, overridable
+with NYAYADOOT_ADMISSION, e.g. "no_scrape=16/2,cached_only=24/4,local_only=32/8,reject=48/15".
+NYAYADOOT_ADMISSION=off admits everything at the full tier.
+"""
+import contextvars
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger("utils.admission")
+
+TIERS = ("full", "no_scrape", "cached_only", "local_only", "reject")
+DEFAULT_THRESHOLDS: Dict[str, Tuple[int, float]] = {
+    "no_scrape": (16, 2.0),
+    "cached_only": (24, 4.0),
+    "local_only": (32, 8.0),
+    "reject": (48, 15.0),
+}
+RETRY_AFTER_SECONDS = int(os.getenv("NYAYADOOT_RETRY_AFTER", "5"))
+
+admitted = metrics.counter("admission_requests_total", "Turns by the service tier they were admitted at", ("tier",))
+turns_in_flight = metrics.gauge("admission_in_flight", "Turns currently admitted")
+observed_wait = metrics.gauge("admission_queue_wait_seconds", "Gemini queue wait seen by the last admission decision")
+
+_tier: contextvars.ContextVar = contextvars.ContextVar("service_tier", default="full")
+
+
+class Overloaded(Exception):
+    """The request was rejected; retry after `retry_after` seconds."""
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server is overloaded; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def parse_thresholds(spec: Optional[str]) -> Optional[Dict[str, Tuple[int, float]]]:
+    """Parse "tier=inflight/wait,..." over the defaults; None when admission control is off."""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    if spec and spec.strip().lower() == "off":
+        return None
+    for item in (spec or "").split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in thresholds:
+            continue
+        limit, _, wait = value.partition("/")
+        try:
+            thresholds[name] = (int(limit), float(wait) if wait else thresholds[name][1])
+        except ValueError:
+            logger.warning("Ignoring malformed admission threshold %r", item)
+    return thresholds
+
+
+def get_tier() -> str:
+    """The service tier of the turn being processed ("full" outside admission)."""
+    return _tier.get()
+
+
+def at_least(tier: str) -> bool:
+    """True if the current turn is degraded to `tier` or further."""
+    return TIERS.index(get_tier()) >= TIERS.index(tier)
+
+
+class AdmissionController:
+    """Counts admitted turns and picks each new turn's tier; use from the event loop."""
+    def __init__(self, queue_wait: Callable[[], float], thresholds: Optional[Dict[str, Tuple[int, float]]] = None,
+                 retry_after: int = RETRY_AFTER_SECONDS, enabled: bool = True):
+        self.queue_wait = queue_wait
+        self.thresholds = thresholds or dict(DEFAULT_THRESHOLDS)
+        self.retry_after = retry_after
+        self.enabled = enabled
+        self.in_flight = 0
+
+    @classmethod
+    def from_env(cls, queue_wait: Callable[[], float]) -> "AdmissionController":
+        thresholds = parse_thresholds(os.getenv("NYAYADOOT_ADMISSION"))
+        return cls(queue_wait, thresholds, enabled=thresholds is not None)
+
+    def choose_tier(self) -> str:
+        if not self.enabled:
+            return "full"
+        wait = self.queue_wait()
+        observed_wait.set(wait)
+        tier = "full"
+        for name in TIERS[1:]:
+            limit, max_wait = self.thresholds[name]
+            if self.in_flight >= limit or wait >= max_wait:
+                tier = name
+        return tier
+
+    @contextmanager
+    def admit(self, floor: str = "full") -> Iterator[str]:
+        """Admit a turn for the duration of the block; raises Overloaded at the reject tier.
+
+        `floor` is the least degraded tier the turn may get, e.g. for sessions over their token budget.
+        """
+        tier = max(self.choose_tier(), floor, key=TIERS.index)
+        admitted.inc(tier=tier)
+        if tier == "reject":
+            logger.warning("Rejected turn", extra={"in_flight": self.in_flight})
+            raise Overloaded(self.retry_after)
+        if tier != "full":
+            logger.info("Admitted degraded turn", extra={"tier": tier, "in_flight": self.in_flight})
+        self.in_flight += 1
+        turns_in_flight.set(self.in_flight)
+        token = _tier.set(tier)
+        try:
+            yield tier
+        finally:
+            _tier.reset(token)
+            self.in_flight -= 1
+            turns_in_flight.set(self.in_flight)
@@ -1,11 +1,9 @@
-from fastapi import APIRouter, HTTPException, Query, Request
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Literal
-import uuid
+from typing import List, Optional
+import asyncio
 import re
 
-from conversation.state import ConversationState
 from scraping.kanoon import fetch_kanoon_results, fetch_specific_case_from_kanoon
+from utils.deadline import Deadline
 
 # Function to extract case names from text
 def extract_case_names(text: str) -> List[str]:
@@ -23,7 +21,7 @@ def extract_case_names(text: str) -> List[str]:
     return case_names
 
 # Function to handle specific case lookup requests
-async def handle_case_lookup(query: str, conversation_history: str = ""):
+async def handle_case_lookup(query: str, conversation_history: str = "", deadline: Optional[Deadline] = None):
     """Handle requests specifically looking for case information."""
     
     # Extract case names from the query
@@ -32,7 +30,7 @@ async def handle_case_lookup(query: str, conversation_history: str = ""):
     # If no case names found in the direct format, search using the query
     if not case_names:
         # Use general search
-        results = fetch_kanoon_results(query, conversation_history)
+        results = await asyncio.to_thread(fetch_kanoon_results, query, conversation_history, deadline)
         if results:
             # Format the response with proper links
             response_parts = []
@@ -52,7 +50,7 @@ async def handle_case_lookup(query: str, conversation_history: str = ""):
         # Look up specific cases
         results = []
         for case_name in case_names[:2]:  # Limit to 2 for token efficiency
-            case = fetch_specific_case_from_kanoon(case_name)
+            case = await asyncio.to_thread(fetch_specific_case_from_kanoon, case_name, deadline)
             if case and case.get('url'):
                 title = case.get('title', case_name)
                 url = case.get('url', '')
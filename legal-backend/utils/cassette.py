@@ -0,0 +1,181 @@
+"""
+Record/replay of Gemini calls and Kanoon pages.
+
+A cassette is a gzipped JSON-lines file. Each response body is stored once
+under its hash; entries map a request (an HTTP GET URL, or a Gemini route,
+model, generation config and prompt) to a body, status and the latency
+observed when it was recorded.
+
+Environment:
+    NYAYADOOT_CASSETTE_MODE     "off" (default), "record" or "replay"
+    NYAYADOOT_CASSETTE          cassette path (default cassettes/default.jsonl.gz)
+    NYAYADOOT_CASSETTE_LATENCY  in replay, sleep this multiple of the recorded
+                                latency (default 0: answer immediately)
+
+In replay mode a request missing from the cassette raises CassetteMiss, which
+callers handle like any other backend failure.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from utils.log import get_logger
+
+logger = get_logger("utils.cassette")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(__file__), "..", "cassettes", "default.jsonl.gz")
+MODES = ("off", "record", "replay")
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+class RecordedResponse:
+    """Stands in for requests.Response and Gemini responses during replay."""
+    def __init__(self, text: str, status_code: int = 200):
+        self.text = text
+        self.status_code = status_code
+        self.usage_metadata = None
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode("utf-8")
+
+
+def _hash(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:24]
+
+
+def request_key(kind: str, *parts) -> str:
+    """Stable key for a request from its kind and identifying parts."""
+    return _hash(json.dumps([kind, *parts], sort_keys=True, ensure_ascii=False))
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = "replay", latency_factor: float = 0.0):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.latency_factor = latency_factor
+        self.entries: Dict[str, Dict] = {}
+        self.bodies: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if mode != "off" and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["type"] == "body":
+                    self.bodies[record["sha"]] = record["data"]
+                else:
+                    self.entries[record["key"]] = record
+        logger.info("Loaded cassette %s", self.path, extra={"entries": len(self.entries), "mode": self.mode})
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def lookup(self, key: str) -> Optional[Tuple[Dict, str]]:
+        """The recorded entry and body for a key, or None."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        return entry, self.bodies[entry["body"]]
+
+    def replay(self, key: str, kind: str, description: str) -> RecordedResponse:
+        found = self.lookup(key)
+        if found is None:
+            raise CassetteMiss(f"No recorded {kind} response for {description[:120]!r} in {self.path}")
+        entry, body = found
+        if self.latency_factor > 0:
+            time.sleep(entry.get("latency", 0) * self.latency_factor)
+        return RecordedResponse(body, entry.get("status", 200))
+
+    def record(self, key: str, kind: str, description: str, body: str, status: int = 200, latency: float = 0.0):
+        """Store a response, appending it to the cassette file."""
+        sha = _hash(body)
+        # Keep URLs whole so recorded pages can be put back into the page cache by URL
+        request = description if kind == "http" else description[:200]
+        entry = {"type": "entry", "key": key, "kind": kind, "request": request,
+                 "body": sha, "status": status, "latency": round(latency, 4)}
+        lines = []
+        with self._lock:
+            if sha not in self.bodies:
+                self.bodies[sha] = body
+                lines.append({"type": "body", "sha": sha, "data": body})
+            self.entries[key] = entry
+            lines.append(entry)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # Each append adds a gzip member; readers see one continuous stream
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                for line in lines:
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+    def iter_entries(self, kind: Optional[str] = None) -> Iterator[Tuple[Dict, str]]:
+        for entry in list(self.entries.values()):
+            if kind is None or entry["kind"] == kind:
+                yield entry, self.bodies[entry["body"]]
+
+
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Cassette:
+    """The process-wide cassette configured from the environment."""
+    global _cassette
+    if _cassette is None:
+        _cassette = Cassette(
+            os.getenv("NYAYADOOT_CASSETTE", DEFAULT_PATH),
+            os.getenv("NYAYADOOT_CASSETTE_MODE", "off").lower(),
+            float(os.getenv("NYAYADOOT_CASSETTE_LATENCY", "0")),
+        )
+    return _cassette
+
+
+def use_cassette(path: str, mode: str = "replay", latency_factor: float = 0.0) -> Cassette:
+    """Replace the process-wide cassette, e.g. from a test script."""
+    global _cassette
+    _cassette = Cassette(path, mode, latency_factor)
+    return _cassette
+
+
+def http_get(url: str, fetch, **kwargs):
+    """GET through the cassette: `fetch(url, **kwargs)` does the real request when not replaying."""
+    cassette = get_cassette()
+    if cassette.mode == "off":
+        return fetch(url, **kwargs)
+    key = request_key("http", "GET", url)
+    if cassette.replaying:
+        return cassette.replay(key, "http", url)
+    start = time.monotonic()
+    resp = fetch(url, **kwargs)
+    cassette.record(key, "http", url, resp.text, resp.status_code, time.monotonic() - start)
+    return resp
+
+
+def wrap_gemini_backend(backend):
+    """Wrap a Gemini backend so calls are recorded or replayed per the cassette mode."""
+    def cassette_backend(prompt: str, route_name: str, model_name: str, generation_config: Dict, timeout: float):
+        cassette = get_cassette()
+        if cassette.mode == "off":
+            return backend(prompt, route_name, model_name, generation_config, timeout)
+        key = request_key("gemini", route_name, model_name, generation_config, prompt)
+        if cassette.replaying:
+            return cassette.replay(key, "gemini", f"{route_name}: {prompt}")
+        start = time.monotonic()
+        response = backend(prompt, route_name, model_name, generation_config, timeout)
+        cassette.record(key, "gemini", f"{route_name}: {prompt}", response.text, 200, time.monotonic() - start)
+        return response
+    return cassette_backend
@@ -0,0 +1,51 @@
+"""
+Per-request time budgets passed down through the query pipeline
+"""
+import os
+import time
+from typing import Optional
+
+# Overall budget for one /query turn, in seconds
+TURN_BUDGET_SECONDS = float(os.getenv("NYAYADOOT_TURN_BUDGET", "25"))
+
+
+class Deadline:
+    """An absolute point in time (monotonic clock) by which work must finish."""
+    def __init__(self, budget: float):
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def for_turn(cls) -> "Deadline":
+        return cls(TURN_BUDGET_SECONDS)
+
+    def remaining(self) -> float:
+        """Seconds left, never negative."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """A timeout for one blocking call: the remaining budget, capped at cap."""
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def expire(self):
+        """End the budget now; stages still running give up at their next deadline check."""
+        self.expires_at = time.monotonic()
+
+    def reserve(self, seconds: float) -> "Deadline":
+        """A deadline that expires earlier, leaving `seconds` for later stages."""
+        child = Deadline(0)
+        child.expires_at = self.expires_at - seconds
+        return child
+
+
+# Smallest timeout handed to an HTTP client; zero or negative timeouts are rejected
+MIN_TIMEOUT = 0.1
+
+
+def timeout_for(deadline: Optional[Deadline], default: float) -> float:
+    """The timeout a stage should use: its own default, or less if the deadline is closer."""
+    return default if deadline is None else max(MIN_TIMEOUT, deadline.timeout(default))
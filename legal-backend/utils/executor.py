@@ -0,0 +1,150 @@
+"""
+Process pool for CPU-heavy pure functions.
+
+Parsing Kanoon pages with BeautifulSoup, regex case extraction and keyword
+counting hold the GIL for tens of milliseconds on large inputs, which stalls
+the event loop and every other request thread in the worker. run_cpu() sends
+such calls to a small pool of worker processes instead. Arguments and results
+cross the process boundary by pickling, so callers pass raw bytes or strings
+and get back small lists and dicts; functions must be importable at module
+level.
+
+Inputs smaller than NYAYADOOT_CPU_INLINE_BYTES run inline, where the pickling
+round trip would cost more than the work. NYAYADOOT_CPU_WORKERS=0 runs
+everything inline. If the pool breaks, the call runs inline and the pool is
+recreated on the next use; if its processes cannot be started at all, the
+process runs everything inline from then on.
+
+monitor_loop_lag() samples how late the event loop wakes up from a sleep,
+exported as event_loop_lag_seconds.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from utils import metrics
+from utils.log import get_logger
+
+logger = get_logger("utils.executor")
+
+CPU_WORKERS = int(os.getenv("NYAYADOOT_CPU_WORKERS", str(min(2, os.cpu_count() or 1))))
+INLINE_BYTES = int(os.getenv("NYAYADOOT_CPU_INLINE_BYTES", "16384"))
+# forkserver children don't inherit the parent's threads or locks (the log writer, HTTP pools)
+START_METHOD = os.getenv("NYAYADOOT_CPU_START_METHOD", "forkserver")
+LOOP_LAG_INTERVAL = float(os.getenv("NYAYADOOT_LOOP_LAG_INTERVAL", "0.5"))
+
+cpu_tasks = metrics.counter("cpu_tasks_total", "CPU-heavy calls by function and where they ran", ("fn", "where"))
+cpu_task_seconds = metrics.histogram("cpu_task_seconds", "Wall time of CPU-heavy calls including pool overhead", ("fn", "where"))
+loop_lag = metrics.histogram("event_loop_lag_seconds", "How late the event loop woke up from a timed sleep")
+loop_lag_last = metrics.gauge("event_loop_lag_last_seconds", "Event loop lag at the last sample")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+# Process in which the pool could not start workers; that process runs everything inline
+_disabled_pid: Optional[int] = None
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """This process's pool, created on first use (and again after a fork)."""
+    global _pool, _pool_pid
+    if CPU_WORKERS <= 0 or _disabled_pid == os.getpid():
+        return None
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                method = START_METHOD if START_METHOD in multiprocessing.get_all_start_methods() else "spawn"
+                _pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context(method))
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _disable_pool(pool: ProcessPoolExecutor):
+    global _disabled_pid
+    _disabled_pid = os.getpid()
+    _discard_pool(pool)
+
+
+def input_size(args) -> int:
+    return sum(len(arg) for arg in args if isinstance(arg, (str, bytes)))
+
+
+def _name(fn: Callable) -> str:
+    return getattr(fn, "__name__", "fn")
+
+
+def run_cpu(fn: Callable, *args: Any, size: Optional[int] = None) -> Any:
+    """Call `fn(*args)` in the pool, or inline for small inputs; blocks, so call it off the event loop."""
+    size = input_size(args) if size is None else size
+    pool = _get_pool() if size >= INLINE_BYTES else None
+    started = time.perf_counter()
+    where = "inline"
+    if pool is not None:
+        try:
+            future = pool.submit(fn, *args)
+        except (RuntimeError, OSError) as e:
+            # The worker processes could not be started (e.g. a __main__ without the
+            # multiprocessing guard); stop trying in this process
+            logger.warning("CPU pool unavailable, running CPU work inline: %s", e)
+            _disable_pool(pool)
+            future = None
+            where = "fallback"
+        if future is not None:
+            try:
+                result = future.result()
+                where = "pool"
+            except BrokenProcessPool as e:
+                logger.warning("CPU pool broke, running %s inline: %s", _name(fn), e)
+                _discard_pool(pool)
+                where = "fallback"
+    if where != "pool":
+        result = fn(*args)
+    cpu_tasks.inc(fn=_name(fn), where=where)
+    cpu_task_seconds.observe(time.perf_counter() - started, fn=_name(fn), where=where)
+    return result
+
+
+def _noop() -> int:
+    return os.getpid()
+
+
+def warm_pool() -> int:
+    """Start the pool's worker processes ahead of the first large input; returns the pool size."""
+    pool = _get_pool()
+    if pool is None:
+        return 0
+    for future in [pool.submit(_noop) for _ in range(CPU_WORKERS)]:
+        future.result()
+    return CPU_WORKERS
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def monitor_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Record how late each timed wake-up of the event loop is, until cancelled."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        loop_lag.observe(lag)
+        loop_lag_last.set(lag)
@@ -0,0 +1,82 @@
+"""
+Idempotency keys for retried requests.
+
+A client that retries a request with the same key gets the original's
+response: from memory if it completed within the last few minutes, or by
+waiting on the original if it is still running. Work is never started twice
+for one key. The original runs in its own task, so a client that gives up
+and retries doesn't cancel the work the retry is waiting for.
+
+Entries live in this worker's memory; with several workers a retry that lands
+on another worker runs the request again.
+"""
+import asyncio
+import hashlib
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from utils import metrics
+from utils.cache import TTLCache
+
+IDEMPOTENCY_TTL = float(os.getenv("NYAYADOOT_IDEMPOTENCY_TTL", "300"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("NYAYADOOT_IDEMPOTENCY_MAX_KEYS", "2048"))
+
+idempotent_requests = metrics.counter(
+    "idempotency_requests_total",
+    "Requests carrying an idempotency key, by outcome (new, replayed, joined, conflict)",
+    ("outcome",),
+)
+
+
+class IdempotencyConflict(ValueError):
+    """The key was already used for a different request."""
+
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:24]
+
+
+class IdempotencyStore:
+    """Completed results and running tasks by key; use from a single event loop."""
+    def __init__(self, ttl: float = IDEMPOTENCY_TTL, maxsize: int = IDEMPOTENCY_MAX_KEYS):
+        self._completed = TTLCache("idempotency", maxsize=maxsize, ttl=ttl)
+        self._running: Dict[Hashable, Tuple[str, asyncio.Task]] = {}
+
+    async def run(self, key: Hashable, request_fingerprint: str,
+                  work: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """The result for `key` and how it was obtained: "new", "replayed" or "joined".
+
+        Raises IdempotencyConflict if the key was used with a different fingerprint.
+        """
+        completed = self._completed.get(key)
+        if completed is not None:
+            owner_fingerprint, result = completed
+            self._check(owner_fingerprint, request_fingerprint)
+            idempotent_requests.inc(outcome="replayed")
+            return result, "replayed"
+        running = self._running.get(key)
+        if running is not None:
+            owner_fingerprint, task = running
+            self._check(owner_fingerprint, request_fingerprint)
+            idempotent_requests.inc(outcome="joined")
+            return await asyncio.shield(task), "joined"
+
+        idempotent_requests.inc(outcome="new")
+        task = asyncio.ensure_future(work())
+        self._running[key] = (request_fingerprint, task)
+        task.add_done_callback(lambda t: self._finish(key, request_fingerprint, t))
+        return await asyncio.shield(task), "new"
+
+    def _finish(self, key: Hashable, request_fingerprint: str, task: asyncio.Task):
+        self._running.pop(key, None)
+        # Failures aren't kept, so a retry after an error runs the request again
+        if not task.cancelled() and task.exception() is None:
+            self._completed.set(key, (request_fingerprint, task.result()))
+
+    def _check(self, owner_fingerprint: str, request_fingerprint: str):
+        if owner_fingerprint != request_fingerprint:
+            idempotent_requests.inc(outcome="conflict")
+            raise IdempotencyConflict("Idempotency key was already used for a different request")
+
+    def __len__(self) -> int:
+        return len(self._running) + len(self._completed)
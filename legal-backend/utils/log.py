@@ -0,0 +1,164 @@
+"""
+Structured, non-blocking logging for the backend.
+
+Records go through a QueueHandler so request threads never block on stdout;
+a QueueListener thread formats and writes them. Every record carries the
+request and session IDs bound for the current request. Noisy categories can
+be sampled below WARNING, and debug calls use lazy %-formatting so nothing
+is built for records that are filtered out.
+
+Environment:
+    NYAYADOOT_LOG_LEVEL     minimum level (default INFO)
+    NYAYADOOT_LOG_FORMAT    "json" (default) or "text"
+    NYAYADOOT_LOG_SAMPLING  per-category keep rates below WARNING,
+                            e.g. "scraping.kanoon=0.1,api.router=0.5"
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Dict, Optional
+
+ROOT_LOGGER = "nyayadoot"
+
+request_id_var: contextvars.ContextVar = contextvars.ContextVar("request_id", default="-")
+session_id_var: contextvars.ContextVar = contextvars.ContextVar("session_id", default="-")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id", "session_id", "category"}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """A logger under the nyayadoot namespace, e.g. get_logger("scraping.kanoon")."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def bind_request(request_id: Optional[str] = None, session_id: Optional[str] = None):
+    """Attach correlation IDs to every record logged from the current context."""
+    if request_id is not None:
+        request_id_var.set(request_id)
+    if session_id is not None:
+        session_id_var.set(session_id)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the bound request/session IDs onto the record (runs in the caller's thread)."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        record.session_id = session_id_var.get()
+        record.category = record.name[len(ROOT_LOGGER) + 1:] if record.name.startswith(ROOT_LOGGER + ".") else record.name
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of sub-WARNING records for the configured categories."""
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def rate_for(self, category: str) -> float:
+        # Longest configured prefix wins: "scraping" covers "scraping.kanoon"
+        while category:
+            if category in self.rates:
+                return self.rates[category]
+            category = category.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rate_for(getattr(record, "category", record.name))
+        return rate >= 1.0 or random.random() < rate
+
+
+def parse_sampling(spec: Optional[str]) -> Dict[str, float]:
+    """Parse "category=rate,..." into a dict, ignoring malformed entries."""
+    rates = {}
+    for item in (spec or "").split(","):
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, level, category, IDs and any extra fields."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "category": getattr(record, "category", record.name),
+            "msg": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "session_id": getattr(record, "session_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(category)s [%(request_id)s/%(session_id)s] %(message)s"
+
+
+class _ContextQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args into msg before crossing threads, but keep exc_info for the formatter
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level: Optional[str] = None, fmt: Optional[str] = None, sampling: Optional[str] = None, stream=None):
+    """Install the queue-backed handler on the nyayadoot logger. Safe to call more than once."""
+    global _listener
+    level = (level or os.getenv("NYAYADOOT_LOG_LEVEL", "INFO")).upper()
+    fmt = (fmt or os.getenv("NYAYADOOT_LOG_FORMAT", "json")).lower()
+    rates = parse_sampling(sampling if sampling is not None else os.getenv("NYAYADOOT_LOG_SAMPLING"))
+
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    if fmt == "text":
+        formatter = logging.Formatter(TEXT_FORMAT)
+        formatter.converter = time.gmtime
+    else:
+        formatter = JsonFormatter()
+    output.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    handler = _ContextQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers = [handler]
+    root.setLevel(level)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    return root
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
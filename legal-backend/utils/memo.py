@@ -0,0 +1,72 @@
+"""
+Request-group memoization: share identical work across the items of a batch.
+
+Inside `with shared_work():` calls made through `shared(namespace, key, fn, ...)`
+run once per key; concurrent and later callers with the same key wait for and
+reuse the first call's result (or exception). Outside a scope `shared` simply
+calls `fn`. The scope lives in a context variable, so tasks created inside it
+and `asyncio.to_thread` workers see it too.
+"""
+import contextvars
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+from utils import metrics
+
+shared_calls = metrics.counter(
+    "shared_work_calls_total",
+    "Calls made through a shared-work scope, by whether they ran or reused another call's result",
+    ("namespace", "result"),
+)
+
+
+class SharedWork:
+    """Results of calls made within one scope, keyed by (namespace, key)."""
+    def __init__(self):
+        self._futures: Dict[Tuple[str, Hashable], Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, namespace: str, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._futures.get((namespace, key))
+            owner = future is None
+            if owner:
+                future = self._futures[(namespace, key)] = Future()
+        if not owner:
+            shared_calls.inc(namespace=namespace, result="reused")
+            return future.result()
+        shared_calls.inc(namespace=namespace, result="ran")
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def __len__(self) -> int:
+        return len(self._futures)
+
+
+_scope: contextvars.ContextVar[Optional[SharedWork]] = contextvars.ContextVar("shared_work", default=None)
+
+
+@contextmanager
+def shared_work() -> Iterator[SharedWork]:
+    """Open a scope in which `shared` calls are deduplicated."""
+    scope = SharedWork()
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def shared(namespace: str, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+    """Call `fn(*args, **kwargs)`, or reuse the result of an earlier call with the same key in this scope."""
+    scope = _scope.get()
+    if scope is None:
+        return fn(*args, **kwargs)
+    return scope.run(namespace, key, fn, *args, **kwargs)
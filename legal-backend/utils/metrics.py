@@ -0,0 +1,160 @@
+"""
+Lightweight in-process metrics (counters, gauges and histograms with labels)
+"""
+import threading
+from typing import Dict, List, Tuple
+
+_lock = threading.Lock()
+REGISTRY: Dict[str, "Metric"] = {}
+
+
+class Metric:
+    """Base class for a named metric keyed by a fixed set of label names."""
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str = "", labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[Dict[str, str], object]]:
+        """Return (labels, value) pairs for every label combination seen so far."""
+        with self._lock:
+            items = [(key, dict(value, buckets=list(value["buckets"])) if isinstance(value, dict) else value)
+                     for key, value in self._values.items()]
+        return [(dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str = "", labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+
+def _get_or_create(cls, name: str, help: str, labelnames: Tuple[str, ...], **kwargs) -> Metric:
+    with _lock:
+        metric = REGISTRY.get(name)
+        if metric is None:
+            metric = REGISTRY[name] = cls(name, help, labelnames, **kwargs)
+        return metric
+
+
+def counter(name: str, help: str = "", labelnames: Tuple[str, ...] = ()) -> Counter:
+    """Get or create a counter by name."""
+    return _get_or_create(Counter, name, help, labelnames)
+
+
+def gauge(name: str, help: str = "", labelnames: Tuple[str, ...] = ()) -> Gauge:
+    """Get or create a gauge by name."""
+    return _get_or_create(Gauge, name, help, labelnames)
+
+
+def histogram(name: str, help: str = "", labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    """Get or create a histogram by name."""
+    return _get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+
+def snapshot() -> Dict[str, List[Dict]]:
+    """Return every registered metric as plain JSON-serializable data."""
+    with _lock:
+        metrics = list(REGISTRY.values())
+    return {
+        m.name: [{"labels": labels, "value": value} for labels, value in m.samples()]
+        for m in metrics
+    }
+
+
+cache_requests = counter("cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+
+
+def record_cache(cache: str, hit: bool):
+    """Count a cache lookup as a hit or a miss."""
+    cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str], extra: Dict[str, str] = None) -> str:
+    labels = dict(labels, **(extra or {}))
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_prometheus() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    with _lock:
+        registered = list(REGISTRY.values())
+    lines = []
+    for m in registered:
+        lines.append(f"# HELP {m.name} {m.help}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        for labels, value in m.samples():
+            if m.kind != "histogram":
+                lines.append(f"{m.name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(m.buckets, value["buckets"]):
+                cumulative += count
+                lines.append(f"{m.name}_bucket{_format_labels(labels, {'le': repr(float(bound))})} {cumulative}")
+            lines.append(f"{m.name}_bucket{_format_labels(labels, {'le': '+Inf'})} {value['count']}")
+            lines.append(f"{m.name}_sum{_format_labels(labels)} {value['sum']}")
+            lines.append(f"{m.name}_count{_format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
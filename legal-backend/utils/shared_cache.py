@@ -0,0 +1,157 @@
+"""
+Two-tier cache shared by the workers on one host.
+
+Each SharedCache keeps an in-process TTLCache (L1) in front of a SQLite file
+(L2) that every worker process opens, so a Kanoon page or Gemini response
+computed by one worker is a disk read for the others. The database runs in
+WAL mode: readers never block the writer and each worker writes in short
+transactions. Entries expire by wall-clock time, and each cache's rows are
+pruned to `l2_maxsize` (oldest expiry first) every PRUNE_EVERY writes.
+
+L2 is enabled by NYAYADOOT_SHARED_CACHE=<path to the database file>; serve.py
+sets it when running several workers. Without it a SharedCache is just its L1.
+Any SQLite error makes the lookup a miss; the cache never fails a request.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Hashable, Optional
+
+from utils import metrics
+from utils.cache import TTLCache
+from utils.log import get_logger
+from utils.metrics import record_cache
+
+logger = get_logger("utils.shared_cache")
+
+SHARED_CACHE_PATH = os.getenv("NYAYADOOT_SHARED_CACHE") or None
+# Writes per cache between prunes of its expired and excess rows
+PRUNE_EVERY = 200
+
+cache_errors = metrics.counter("shared_cache_errors_total", "SQLite errors in the shared cache tier", ("cache",))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    cache TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (cache, key)
+) WITHOUT ROWID
+"""
+
+_local = threading.local()
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """This thread's connection to the database, reopened after a fork."""
+    connections = getattr(_local, "connections", None)
+    if connections is None or _local.pid != os.getpid():
+        connections = _local.connections = {}
+        _local.pid = os.getpid()
+    connection = connections.get(path)
+    if connection is None:
+        connection = sqlite3.connect(path, timeout=2.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(_SCHEMA)
+        connections[path] = connection
+    return connection
+
+
+def cache_key(*parts: Any) -> str:
+    """A fixed-length key for arbitrary (e.g. prompt-sized) key parts."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SharedCache:
+    """TTLCache-like cache with a SQLite tier shared across worker processes.
+
+    Keys are strings; values go through `encode`/`decode` (JSON by default)
+    on their way to and from the database.
+    """
+    def __init__(self, name: str, maxsize: int = 256, ttl: float = 3600.0, l2_maxsize: int = 10000,
+                 path: Optional[str] = SHARED_CACHE_PATH, encode: Callable[[Any], str] = json.dumps,
+                 decode: Callable[[str], Any] = json.loads):
+        self.name = name
+        self.ttl = ttl
+        self.l2_maxsize = l2_maxsize
+        self.path = path
+        self.encode = encode
+        self.decode = decode
+        self._l1 = TTLCache(name, maxsize=maxsize, ttl=ttl)
+        self._writes = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        value = self._l1.get(key)
+        if value is not None or self.path is None:
+            return default if value is None else value
+        row = self._execute("SELECT value, expires_at FROM entries WHERE cache = ? AND key = ?",
+                            (self.name, key), fetch=True)
+        now = time.time()
+        hit = row is not None and row[1] > now
+        record_cache(f"{self.name}_shared", hit)
+        if not hit:
+            return default
+        try:
+            value = self.decode(row[0])
+        except (ValueError, TypeError) as e:
+            logger.warning("Undecodable shared cache entry in %s: %s", self.name, e)
+            return default
+        # Keep it locally for whatever is left of its lifetime
+        self._l1.set(key, value, ttl=min(self.ttl, row[1] - now))
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, local_only: bool = False):
+        """Store a value in both tiers (only in L1 with `local_only`)."""
+        ttl = self.ttl if ttl is None else ttl
+        self._l1.set(key, value, ttl=ttl)
+        if self.path is None or local_only:
+            return
+        try:
+            encoded = self.encode(value)
+        except (ValueError, TypeError) as e:
+            logger.warning("Not sharing unencodable value in %s: %s", self.name, e)
+            return
+        self._execute("INSERT OR REPLACE INTO entries (cache, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                      (self.name, key, encoded, time.time() + ttl))
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        value = self._l1.pop(key, default)
+        if self.path is not None:
+            self._execute("DELETE FROM entries WHERE cache = ? AND key = ?", (self.name, key))
+        return value
+
+    def prune(self):
+        """Drop expired rows, then the rows past l2_maxsize that expire soonest."""
+        self._execute("DELETE FROM entries WHERE cache = ? AND expires_at <= ?", (self.name, time.time()))
+        self._execute(
+            "DELETE FROM entries WHERE cache = ? AND key NOT IN "
+            "(SELECT key FROM entries WHERE cache = ? ORDER BY expires_at DESC LIMIT ?)",
+            (self.name, self.name, self.l2_maxsize))
+
+    def clear(self):
+        self._l1.clear()
+        if self.path is not None:
+            self._execute("DELETE FROM entries WHERE cache = ?", (self.name,))
+
+    def _execute(self, sql: str, params: tuple, fetch: bool = False):
+        try:
+            cursor = _connect(self.path).execute(sql, params)
+            return cursor.fetchone() if fetch else None
+        except sqlite3.Error as e:
+            cache_errors.inc(cache=self.name)
+            logger.warning("Shared cache %s unavailable: %s", self.name, e)
+            return None
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._l1)
@@ -0,0 +1,102 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+While a call for a key is in flight, other callers with the same key wait for
+its result instead of repeating the work; once it finishes the key is
+forgotten, so later calls run again (caching is a separate concern). The
+leader's exception is raised in every waiting caller.
+
+A waiting caller can give up after its own timeout (FlightTimeout) without
+affecting the call it was waiting on. If the leader is interrupted, or its
+function raises Abandoned to say the failure was its own (e.g. its deadline
+ran out), waiting callers don't inherit it: they retry, and one of them
+becomes the new leader.
+"""
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from utils import metrics
+
+flight_calls = metrics.counter(
+    "singleflight_calls_total",
+    "Coalesced calls by group and role (leader ran the call, follower shared its result)",
+    ("group", "role"),
+)
+dedup_ratio = metrics.gauge(
+    "singleflight_dedup_ratio",
+    "Share of calls in a group answered by another caller's in-flight call",
+    ("group",),
+)
+inflight = metrics.gauge("singleflight_inflight", "Calls in flight per group", ("group",))
+
+
+class FlightTimeout(TimeoutError):
+    """A waiting caller's timeout expired before the in-flight call finished."""
+
+
+class Abandoned(Exception):
+    """Raised by a coalesced function when its failure is specific to the calling leader."""
+
+
+class _LeaderGone(Exception):
+    pass
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key; safe to use from many threads."""
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: Hashable, fn: Callable, *args, wait_timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)`, or wait for an identical call already in flight."""
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = Future()
+                self._count(leader)
+            if leader:
+                return self._lead(key, future, fn, args, kwargs)
+            try:
+                return future.result(timeout=wait_timeout)
+            except FutureTimeout:
+                raise FlightTimeout(f"Gave up waiting for in-flight {self.group} call after {wait_timeout}s") from None
+            except _LeaderGone:
+                continue
+
+    def _lead(self, key: Hashable, future: Future, fn: Callable, args, kwargs) -> Any:
+        inflight.inc(group=self.group)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            future.set_exception(_LeaderGone() if isinstance(e, Abandoned) else e)
+            raise
+        except BaseException:
+            future.set_exception(_LeaderGone())
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            inflight.dec(group=self.group)
+            with self._lock:
+                if self._calls.get(key) is future:
+                    del self._calls[key]
+
+    def _count(self, leader: bool):
+        """Update the counters and dedup ratio; called with the lock held."""
+        if leader:
+            self.leaders += 1
+        else:
+            self.followers += 1
+        flight_calls.inc(group=self.group, role="leader" if leader else "follower")
+        dedup_ratio.set(self.followers / (self.leaders + self.followers), group=self.group)
+
+    def __len__(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,283 @@
+"""
+Precompressed, in-memory serving of the frontend bundle.
+
+At startup every file under the dist directory is read once, given a strong
+ETag from its content hash, and compressed with gzip (and brotli when the
+`brotli` package is installed). Requests are answered from memory on the
+event loop: no per-request disk I/O, compression or thread-pool hand-off, so
+asset traffic doesn't compete with /query for worker threads. Files Vite
+emitted with a content hash in their name are served as immutable for a year:
+the files listed in the build manifest (.vite/manifest.json, when the build
+writes one), otherwise assets/name-[hash].ext. Everything else, including
+files copied from public/ such as icons, must be revalidated via its ETag.
+
+Running `python -m utils.static ../l-frontend/dist` after a build writes
+.gz/.br files next to each asset at maximum compression; they are picked up
+instead of compressing at startup.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+from starlette.responses import FileResponse, PlainTextResponse
+
+from utils.log import get_logger
+
+logger = get_logger("utils.static")
+
+# Vite names bundled assets like assets/index-BxY3_k9Q.js (an 8-character hash)
+HASHED_ASSET_RE = re.compile(r"^assets/(?:[^/]+/)*[^/]+-[A-Za-z0-9_-]{8}\.[a-z0-9]+$")
+VITE_MANIFESTS = (".vite/manifest.json", "manifest.json")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml",
+                      "application/xml", "application/wasm", "font/ttf", "font/otf")
+MIN_COMPRESS_SIZE = 512
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Files larger than this, or beyond the total budget, are streamed from disk
+MAX_MEMORY_FILE = int(os.getenv("STATIC_MAX_MEMORY_FILE_MB", "4")) * 1024 * 1024
+MEMORY_BUDGET = int(os.getenv("STATIC_MEMORY_BUDGET_MB", "64")) * 1024 * 1024
+
+
+class Asset:
+    """One file and its encoded variants, keyed by content-coding ("identity", "br", "gzip")."""
+    __slots__ = ("path", "content_type", "etag", "cache_control", "variants", "size")
+
+    def __init__(self, path: str, content_type: str, etag: str, cache_control: str, size: int):
+        self.path = path
+        self.content_type = content_type
+        self.etag = etag
+        self.cache_control = cache_control
+        self.size = size
+        self.variants: Dict[str, bytes] = {}
+
+
+def load_hashed_files(directory: str) -> Optional[Set[str]]:
+    """Paths of the hashed files listed in a Vite build manifest; None when there is no manifest."""
+    for name in VITE_MANIFESTS:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+            files = set()
+            for chunk in manifest.values():
+                files.add(chunk["file"])
+                files.update(chunk.get("css", []))
+                files.update(chunk.get("assets", []))
+            return files
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning("Ignoring unreadable Vite manifest %s: %s", path, e)
+    return None
+
+
+def is_hashed(rel_path: str, hashed_files: Optional[Set[str]] = None) -> bool:
+    """True for files whose name changes with their content, so they can be cached forever."""
+    if hashed_files is not None:
+        return rel_path in hashed_files
+    return bool(HASHED_ASSET_RE.match(rel_path))
+
+
+def _is_compressible(content_type: str) -> bool:
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, best: bool = False) -> Dict[str, bytes]:
+    """gzip and brotli encodings of data, kept only when they are smaller."""
+    encoded = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        encoded["br"] = brotli.compress(data, quality=11 if best else 9)
+    return {coding: body for coding, body in encoded.items() if len(body) < len(data)}
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Content-codings from an Accept-Encoding header with their q-values."""
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(accept: str, available) -> str:
+    """Best available coding the client accepts, preferring br, then gzip."""
+    codings = parse_accept_encoding(accept)
+    for coding in ("br", "gzip"):
+        q = codings.get(coding, codings.get("*", 0.0))
+        if coding in available and q > 0:
+            return coding
+    return "identity"
+
+
+class PrecompressedStaticFiles:
+    """ASGI app serving a directory from memory with content negotiation and ETags.
+
+    Like StaticFiles(html=True), directory paths serve their index.html. A
+    missing directory is logged and every request gets 404, instead of
+    failing at import.
+    """
+    def __init__(self, directory: str):
+        self.directory = os.path.abspath(directory)
+        self.assets: Dict[str, Asset] = {}
+        self.memory_used = 0
+        self.hashed_files: Optional[Set[str]] = None
+        if os.path.isdir(self.directory):
+            self._load()
+        else:
+            logger.warning("Static directory %s does not exist; frontend requests will 404", self.directory)
+
+    def _load(self):
+        self.hashed_files = load_hashed_files(self.directory)
+        for root, _, files in os.walk(self.directory):
+            for name in sorted(files):
+                if name.endswith((".gz", ".br")):
+                    continue
+                full_path = os.path.join(root, name)
+                rel_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                self.assets[rel_path] = self._load_asset(full_path, rel_path)
+        logger.info("Loaded static assets", extra={"files": len(self.assets), "bytes_in_memory": self.memory_used,
+                                                    "brotli": brotli is not None})
+
+    def _load_asset(self, full_path: str, rel_path: str) -> Asset:
+        with open(full_path, "rb") as f:
+            data = f.read()
+        content_type = mimetypes.guess_type(rel_path)[0] or "application/octet-stream"
+        if content_type.startswith("text/") or content_type == "application/javascript":
+            content_type += "; charset=utf-8"
+        cache_control = IMMUTABLE if is_hashed(rel_path, self.hashed_files) else REVALIDATE
+        asset = Asset(full_path, content_type, hashlib.sha256(data).hexdigest()[:32], cache_control, len(data))
+
+        if len(data) > MAX_MEMORY_FILE or self.memory_used + len(data) > MEMORY_BUDGET:
+            return asset  # served from disk, uncompressed
+        asset.variants["identity"] = data
+        if _is_compressible(content_type) and len(data) >= MIN_COMPRESS_SIZE:
+            encoded = {}
+            for coding, suffix in (("gzip", ".gz"), ("br", ".br")):
+                if os.path.exists(full_path + suffix):
+                    with open(full_path + suffix, "rb") as f:
+                        encoded[coding] = f.read()
+            if len(encoded) < (2 if brotli is not None else 1):
+                encoded = dict(compress(data), **encoded)
+            asset.variants.update(encoded)
+        self.memory_used += sum(len(v) for v in asset.variants.values())
+        return asset
+
+    def lookup(self, path: str) -> Optional[Asset]:
+        path = path.lstrip("/")
+        if path in self.assets:
+            return self.assets[path]
+        index = f"{path.rstrip('/')}/index.html" if path else "index.html"
+        return self.assets.get(index.lstrip("/"))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+            await response(scope, receive, send)
+            return
+        root_path = scope.get("root_path", "")
+        path = scope["path"][len(root_path):] if scope["path"].startswith(root_path) else scope["path"]
+        asset = self.lookup(path)
+        if asset is None:
+            await PlainTextResponse("Not Found", status_code=404)(scope, receive, send)
+            return
+        if not asset.variants:
+            response = FileResponse(asset.path, media_type=asset.content_type,
+                                    headers={"Cache-Control": asset.cache_control})
+            await response(scope, receive, send)
+            return
+
+        headers = _headers(scope)
+        coding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), asset.variants)
+        etag = f'"{asset.etag}"' if coding == "identity" else f'"{asset.etag}-{coding}"'
+        response_headers: List[Tuple[bytes, bytes]] = [
+            (b"etag", etag.encode()),
+            (b"cache-control", asset.cache_control.encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        if _etag_matches(headers.get(b"if-none-match", b"").decode("latin-1"), asset.etag):
+            await send({"type": "http.response.start", "status": 304, "headers": response_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        body = asset.variants[coding]
+        response_headers += [
+            (b"content-type", asset.content_type.encode()),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        if coding != "identity":
+            response_headers.append((b"content-encoding", coding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": response_headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+
+def _headers(scope) -> Dict[bytes, bytes]:
+    return {name.lower(): value for name, value in scope.get("headers", [])}
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if If-None-Match names any representation of this content."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag == etag or tag.startswith(f"{etag}-"):
+            return True
+    return False
+
+
+def precompress_directory(directory: str) -> Tuple[int, int, int]:
+    """Write .gz/.br files next to every compressible asset; returns (files, original, compressed) bytes."""
+    files = original = compressed = 0
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith((".gz", ".br")):
+                continue
+            full_path = os.path.join(root, name)
+            content_type = mimetypes.guess_type(name)[0] or ""
+            if not _is_compressible(content_type):
+                continue
+            with open(full_path, "rb") as f:
+                data = f.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+            for coding, body in compress(data, best=True).items():
+                with open(full_path + (".br" if coding == "br" else ".gz"), "wb") as f:
+                    f.write(body)
+                compressed += len(body)
+            files += 1
+            original += len(data)
+    return files, original, compressed
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join("..", "l-frontend", "dist")
+    count, before, after = precompress_directory(target)
+    print(f"Precompressed {count} files in {target}: {before} bytes -> {after} bytes across encodings")
@@ -0,0 +1,116 @@
+"""
+Span-based latency tracing for the query pipeline.
+
+Each request opens a Trace; stages wrap their work in span("stage"). Spans are
+collected on the trace and recorded into the per-intent stage histogram when
+the request finishes, since the intent is only known part-way through.
+Set NYAYADOOT_TRACING=0 to turn spans into a shared no-op object; requests
+still get a Trace, which then only carries the intent to its on_finish
+callbacks (the usage ledger's per-intent totals) and records no histograms.
+"""
+import contextvars
+import os
+import time
+from typing import Callable, List, Optional, Tuple
+
+from utils import metrics
+
+TRACING_ENABLED = os.getenv("NYAYADOOT_TRACING", "1") != "0"
+
+stage_latency = metrics.histogram("pipeline_stage_seconds", "Latency of each query pipeline stage", ("stage", "intent"))
+request_latency = metrics.histogram("pipeline_request_seconds", "End-to-end latency of /query turns", ("intent",))
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+
+
+class _NoopSpan:
+    """Returned when tracing is disabled; entering and leaving it does nothing."""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Trace:
+    """Stage timings for one request."""
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float]] = []
+        self.intent = "unknown"
+        self._on_finish: List[Callable[[str], None]] = []
+        self.finished = False
+
+    def on_finish(self, callback: Callable[[str], None]):
+        """Call `callback(intent)` when the request finishes and its intent is final (now if it has)."""
+        if self.finished:
+            callback(self.intent)
+        else:
+            self._on_finish.append(callback)
+
+    def finish(self, intent: Optional[str] = None):
+        """Record the collected spans and the total latency under the request's intent."""
+        intent = self.intent = intent or self.intent
+        self.finished = True
+        if self.enabled:
+            for stage, duration in self.spans:
+                stage_latency.observe(duration, stage=stage, intent=intent)
+            request_latency.observe(time.perf_counter() - self.started, intent=intent)
+        self.spans = []
+        callbacks, self._on_finish = self._on_finish, []
+        for callback in callbacks:
+            callback(intent)
+
+
+class Span:
+    __slots__ = ("stage", "trace", "started")
+
+    def __init__(self, stage: str, trace: Optional[Trace]):
+        self.stage = stage
+        self.trace = trace
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.started
+        if self.trace is not None:
+            self.trace.spans.append((self.stage, duration))
+        else:
+            # Outside a request (e.g. the /cases endpoint): record straight away
+            stage_latency.observe(duration, stage=self.stage, intent="none")
+        return False
+
+
+def start_trace() -> Trace:
+    """Begin tracing the current request (only its intent when tracing is disabled)."""
+    trace = Trace(enabled=TRACING_ENABLED)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def detach_trace():
+    """Stop recording spans in the current context on the request's trace, e.g. in a background task."""
+    _current_trace.set(None)
+
+
+def set_intent(intent: str):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.intent = intent
+
+
+def span(stage: str):
+    """Context manager timing one pipeline stage."""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return Span(stage, _current_trace.get())
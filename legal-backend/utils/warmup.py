@@ -0,0 +1,119 @@
+"""
+Startup warmup so the first user request doesn't pay for cold paths.
+
+Runs once per worker process (from the app's lifespan hook, i.e. after any
+fork): imports the heavy dependencies that the app loads lazily, exercises
+the regexes, parsers and prompt builder on sample input, loads caches, starts
+the CPU worker pool and opens the Kanoon and Gemini connection pools. The
+/ready endpoint reports ready only once this has finished.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict
+
+from utils.log import get_logger
+
+logger = get_logger("utils.warmup")
+
+_ready = threading.Event()
+_report: Dict[str, object] = {}
+
+SAMPLE_QUERY = "My bike was stolen and the police refused to register my FIR under Section 154 CrPC, see Lalita Kumari vs Govt of UP"
+SAMPLE_PAGE = ('<div class="result"><div class="result_title"><a href="/doc/1/">Sample vs State</a></div>'
+               '<div class="headline">Theft under Section 379 IPC</div></div>')
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def report() -> Dict[str, object]:
+    """Per-step timings (seconds) or errors from the last warmup."""
+    return dict(_report)
+
+
+def import_dependencies():
+    """Import the dependencies that modules defer to first use.
+
+    Safe to call before forking workers: it loads code but opens no
+    connections or threads.
+    """
+    import requests  # noqa: F401
+    import bs4  # noqa: F401
+    if not os.getenv("GEMINI_BACKEND"):
+        import google.generativeai  # noqa: F401
+
+
+def warm_code_paths():
+    """Run each CPU-bound stage once so regexes are compiled and parsers initialised."""
+    from api.router import detect_query_intent
+    from utils.sanitize import sanitize_query
+    from utils.case_helper import extract_case_names
+    from keywords.extractor import extract_keywords_from_conversation
+    from ai.prompt import build_answer_prompt, fit_prompt
+    from ai.links import repair_case_links
+    from scraping.kanoon import parse_search_results
+
+    query = sanitize_query(SAMPLE_QUERY)
+    detect_query_intent(query, "User: hello\nAssistant: Have you filed a complaint?")
+    extract_case_names(query)
+    extract_keywords_from_conversation("", query)
+    prompt, urls = build_answer_prompt(query, "[Sample vs State](https://indiankanoon.org/doc/1/)", "", 256)
+    fit_prompt(prompt)
+    repair_case_links("See [Sample vs State](https://indiankanoon.org/doc/1", urls)
+    parse_search_results(SAMPLE_PAGE)
+
+
+def warm_caches():
+    """Load the routing table and any cassette named by NYAYADOOT_WARM_CASSETTE."""
+    from ai.routes import reload_routes
+    from scraping.kanoon import warm_page_cache
+    from utils.cassette import Cassette
+
+    reload_routes()
+    warm_path = os.getenv("NYAYADOOT_WARM_CASSETTE")
+    if warm_path:
+        loaded = warm_page_cache(Cassette(warm_path, mode="replay"))
+        logger.info("Warmed Kanoon page cache with %d pages from %s", loaded, warm_path)
+
+
+def warm_connections():
+    """Open the Kanoon HTTP pool and create the Gemini client."""
+    from scraping.kanoon import warm_connection
+    from ai.gemini import warm_client
+
+    if os.getenv("NYAYADOOT_WARMUP_CONNECT", "1") == "0":
+        return
+    warm_connection(timeout=float(os.getenv("NYAYADOOT_WARMUP_CONNECT_TIMEOUT", "3")))
+    warm_client()
+
+
+def warm_cpu_pool():
+    """Start the worker processes that parse large pages (utils/executor.py)."""
+    from utils.executor import warm_pool
+    warm_pool()
+
+
+STEPS: Dict[str, Callable[[], None]] = {
+    "imports": import_dependencies,
+    "code_paths": warm_code_paths,
+    "caches": warm_caches,
+    "cpu_pool": warm_cpu_pool,
+    "connections": warm_connections,
+}
+
+
+def run_warmup() -> Dict[str, object]:
+    """Run every warmup step; a failing step is logged and doesn't block readiness."""
+    for name, step in STEPS.items():
+        start = time.perf_counter()
+        try:
+            step()
+            _report[name] = round(time.perf_counter() - start, 4)
+        except Exception as e:
+            _report[name] = f"error: {type(e).__name__}"
+            logger.warning("Warmup step %s failed: %s", name, e)
+    _ready.set()
+    logger.info("Warmup finished", extra={"steps": dict(_report)})
+    return report()
@@ -1,14 +1,25 @@
-import requests
+import os
+import sys
 from bs4 import BeautifulSoup
 
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "legal-backend")
+sys.path.insert(0, BACKEND_DIR)
+
+# Parser fixture test: by default this replays cassettes/kanoon_fixture.jsonl.gz,
+# which was built from kanoon_sample.html rather than recorded from the live
+# site, so it checks the parser against that saved page, not Kanoon's current
+# markup. NYAYADOOT_CASSETTE_MODE=off runs against the live site; =record
+# with NYAYADOOT_CASSETTE pointing at a new file captures a real recording.
+os.environ.setdefault("NYAYADOOT_CASSETTE_MODE", "replay")
+os.environ.setdefault("NYAYADOOT_CASSETTE", os.path.join(BACKEND_DIR, "cassettes", "kanoon_fixture.jsonl.gz"))
+
+from scraping.kanoon import fetch_page, KANOON_SEARCH_URL
+
 def test_kanoon_structure():
-    url = "https://indiankanoon.org/search/?formInput=Theft"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-    }
+    url = f"{KANOON_SEARCH_URL}Theft"
     
     print(f"Testing URL: {url}")
-    resp = requests.get(url, headers=headers)
+    resp = fetch_page(url)
     print(f"Status code: {resp.status_code}")
     
     if resp.status_code == 200:
@@ -20,6 +31,7 @@ def test_kanoon_structure():
         # Check original selectors
         result_title_links = soup.select("div.result_title > a")
         print(f"Original selector 'div.result_title > a': {len(result_title_links)}")
+        assert result_title_links, "No results matched the selector the scraper relies on"
         
         # Try alternative selectors
         print("\nTrying alternative selectors:")
@@ -44,12 +56,14 @@ def test_kanoon_structure():
             if len(elements) > 0:
                 print(f"  First match: {elements[0]}")
         
-        # Save a sample of the HTML for inspection
-        with open("kanoon_sample.html", "w", encoding="utf-8") as f:
-            f.write(str(soup.select("body")[0]) if soup.select("body") else "No body found")
-        print("\nSaved HTML sample to kanoon_sample.html for inspection")
+        # Save a sample of the HTML for inspection (a replayed page is already that sample)
+        if os.environ["NYAYADOOT_CASSETTE_MODE"] != "replay":
+            with open("kanoon_sample.html", "w", encoding="utf-8") as f:
+                f.write(str(soup.select("body")[0]) if soup.select("body") else "No body found")
+            print("\nSaved HTML sample to kanoon_sample.html for inspection")
     else:
         print(f"Failed to fetch the page. Status code: {resp.status_code}")
+    assert resp.status_code == 200
 
 if __name__ == "__main__":
     test_kanoon_structure()